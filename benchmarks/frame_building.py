@@ -0,0 +1,57 @@
+"""Compare construct-built command frames with the precomputed templates.
+
+Run with: PYTHONPATH=. python benchmarks/frame_building.py
+"""
+
+import timeit
+
+from core.frames import light_color_frame, motor_speed_frame, sound_frame
+from protocols.ble_duplo_train import message_type, port_output_command
+
+
+def construct_frame(port_id: int, payload: bytes) -> bytes:
+    return port_output_command.build(
+        {
+            "header": {
+                "length": 8,
+                "hub_id": 0,
+                "message_type": message_type.port_output_command,
+            },
+            "port_id": port_id,
+            "startup_and_completion_information": {"startup": 1, "completion": 1},
+            "sub_command": 0x51,
+            "payload": payload,
+        }
+    )
+
+
+CASES = {
+    "motor": (
+        lambda: construct_frame(0, bytes([0, 50])),
+        lambda: motor_speed_frame(0, 50),
+    ),
+    "sound": (
+        lambda: construct_frame(1, bytes([1, 9])),
+        lambda: sound_frame(1, 9),
+    ),
+    "light": (
+        lambda: construct_frame(17, bytes([0, 3])),
+        lambda: light_color_frame(17, 3),
+    ),
+}
+
+
+def main(number: int = 20000) -> None:
+    print(f"{'command':<8} {'construct':>14} {'template':>14} {'speedup':>9}")
+    for name, (baseline, fast) in CASES.items():
+        assert baseline() == fast()
+        slow_s = min(timeit.repeat(baseline, number=number, repeat=3)) / number
+        fast_s = min(timeit.repeat(fast, number=number, repeat=3)) / number
+        print(
+            f"{name:<8} {slow_s * 1e6:>11.2f} us {fast_s * 1e6:>11.2f} us"
+            f" {slow_s / fast_s:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
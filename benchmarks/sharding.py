@@ -0,0 +1,51 @@
+"""Measure how sharding trains over worker processes scales.
+
+Drives simulated hubs through ``sharded_connection`` with a growing number of
+workers, sending every train one motor command per round, and reports the
+commands per second acknowledged by the hubs.
+
+Run with: PYTHONPATH=. python benchmarks/sharding.py
+"""
+
+import asyncio
+import functools
+import time
+
+from core.simulator import SimulatedHub
+from duplo.sharding import by_address, sharded_connection
+from services.event_bus import CommandFeedback
+
+
+async def run(trains: int, workers: int, rounds: int, interval: float) -> None:
+    targets = [f"00:16:53:00:{i >> 8:02X}:{i & 0xFF:02X}" for i in range(trains)]
+    hub = functools.partial(SimulatedHub, interval=interval)
+    async with sharded_connection(
+        targets, workers=workers, client_factory=hub, find_all=by_address
+    ) as fleet:
+        feedback = fleet.events.subscribe(CommandFeedback, maxsize=trains * rounds)
+        start = time.perf_counter()
+        for speed in range(rounds):
+            await fleet.set_motor_speed(0, speed % 100)
+        acked = 0
+        try:
+            async with asyncio.timeout(interval * 20):
+                while acked < trains * rounds:
+                    await feedback.get()
+                    acked += 1
+        except TimeoutError:
+            pass
+        elapsed = time.perf_counter() - start
+    print(
+        f"trains={trains:>3} workers={workers:>2}:"
+        f" {trains * rounds / elapsed:>7.0f} cmd/s,"
+        f" acked {acked}/{trains * rounds}"
+    )
+
+
+async def main(trains: int = 32, rounds: int = 50) -> None:
+    for workers in (1, 2, 4, 8):
+        await run(trains, workers, rounds, interval=0.0075)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+"""Load-test TrainController against the simulated hub.
+
+Sends motor commands through a command pipeline and measures the round trip
+from write to ``port_output_command_feedback`` for each one, as reported by
+the completion futures. Lost commands and feedback show up as timeouts.
+
+Run with: PYTHONPATH=. python benchmarks/simulated_hub.py
+"""
+
+import asyncio
+import statistics
+import time
+
+from core.simulator import SimulatedHub
+from core.train_controller import TrainController
+
+
+async def run(commands: int, interval: float, jitter: float, loss: float) -> None:
+    hub = SimulatedHub(interval=interval, jitter=jitter, loss=loss, seed=1)
+    await hub.connect()
+    controller = TrainController(hub)  # type: ignore[arg-type]
+    await controller.setup_notifications()
+    pipeline = controller.start_pipeline(window=hub.buffer_size, timeout=interval * 8)
+
+    start = time.perf_counter()
+    futures: list[asyncio.Future[float]] = []
+    for i in range(commands):
+        future = await controller.set_motor_speed(0, i % 100)
+        # With the pipeline started every command returns a future
+        assert future is not None
+        futures.append(future)
+        await asyncio.sleep(interval / hub.frames_per_interval)
+    await controller.stop_pipeline()
+    elapsed = time.perf_counter() - start
+    await hub.disconnect()
+
+    ms = sorted(
+        future.result() * 1000
+        for future in futures
+        if not future.cancelled() and future.exception() is None
+    )
+    print(
+        f"interval={interval * 1000:>4.0f}ms jitter={jitter * 1000:>3.0f}ms"
+        f" loss={loss:>4.0%}: {commands / elapsed:>6.0f} cmd/s,"
+        f" acked {len(ms)}/{commands}, timeouts {pipeline.timed_out},"
+        f" overflows {hub.overflows},"
+        f" p50 {statistics.median(ms):.1f}ms p99 {ms[int(len(ms) * 0.99)]:.1f}ms"
+    )
+
+
+async def main(commands: int = 500) -> None:
+    for interval, jitter, loss in [
+        (0.0075, 0.0, 0.0),
+        (0.015, 0.0, 0.0),
+        (0.015, 0.005, 0.0),
+        (0.015, 0.005, 0.02),
+    ]:
+        await run(commands, interval, jitter, loss)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,365 @@
+"""Codec and controller micro-benchmarks with a stored baseline.
+
+Measures operations per second and the peak memory traced by ``tracemalloc``
+while running one operation, for:
+
+- building and parsing every ``construct`` Struct in
+  ``protocols.ble_duplo_train`` and ``ToothbrushEvent``
+- the fast decoders: ``decode_toothbrush_event`` and ``notification_handler``
+  for every hub message type
+- ``TrainController`` commands written to a no-op client, with and without
+  latency metrics and through a fast-mode command pipeline
+- the broadcast scan path: ``SharedScanner`` dispatch into a subscription,
+  consumed into ``BroadcastStats``, i.e. advertisements per second a
+  ``duplo-listen-broadcast --stats`` process can keep up with
+
+Run with::
+
+    PYTHONPATH=. python benchmarks/suite.py                   # print results
+    PYTHONPATH=. python benchmarks/suite.py --save-baseline   # update baseline
+    PYTHONPATH=. python benchmarks/suite.py --compare         # fail on regressions
+
+Results depend on the machine; refresh the baseline when switching hosts.
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import platform
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import construct
+
+from core.broadcast import BroadcastStats
+from core.frames import motor_speed_frame
+from core.metrics import Metrics
+from core.train_controller import TrainController, decode_notification
+from protocols import ble_duplo_train
+from protocols.ble_toothbrush import ToothbrushEvent, decode_toothbrush_event
+from services.scanner import SharedScanner
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+DEFAULT_THRESHOLD = 0.25
+
+# One representative wire message for every Struct in protocols.ble_duplo_train
+STRUCT_SAMPLES: dict[str, bytes] = {
+    "common_message_header": bytes.fromhex("050004"),
+    "hub_attached_io_message_format": bytes.fromhex("090004000129000101"),
+    "port_information_request_format": bytes.fromhex("0500210100"),
+    "port_input_format_setup_single_format": bytes.fromhex("0a004101010100000001"),
+    "port_value_single": bytes.fromhex("060045133200"),
+    "startup_and_completion_information": bytes.fromhex("11"),
+    "port_output_command": bytes.fromhex("0800810011510032"),
+    "port_output_command_feedback": bytes.fromhex("050082000a"),
+    "generic_error_message": bytes.fromhex("0500058106"),
+}
+
+TOOTHBRUSH_SAMPLE = b"\x062k\x03\x24\x01\x1e\x08\x09\x02\x04"
+
+# Hub notifications, one per message type the controller decodes
+NOTIFICATION_SAMPLES: dict[str, bytes] = {
+    "hub_attached_io": STRUCT_SAMPLES["hub_attached_io_message_format"],
+    "generic_error_message": STRUCT_SAMPLES["generic_error_message"],
+    "port_value_single": STRUCT_SAMPLES["port_value_single"],
+    "port_input_format_single": bytes.fromhex("0a004701010100000001"),
+    "port_output_command_feedback": STRUCT_SAMPLES["port_output_command_feedback"],
+    "unhandled": bytes.fromhex("0500020100"),
+}
+
+# Commands per controller benchmark operation, to amortize the event loop call
+CONTROLLER_BATCH = 100
+
+# Advertisements per scan path benchmark operation, spread over this many devices
+ADVERTISEMENT_BATCH = 100
+ADVERTISING_DEVICES = 20
+
+
+def protocol_structs() -> dict[str, construct.Construct]:
+    """Every Struct defined in ``protocols.ble_duplo_train``."""
+    return {
+        name: value
+        for name, value in vars(ble_duplo_train).items()
+        # BitStruct wraps a Struct in Transformed
+        if isinstance(value, (construct.Struct, construct.Transformed))
+    }
+
+
+class NullClient:
+    """Accepts writes and does nothing, to isolate controller overhead."""
+
+    address = "00:00:00:00:00:00"
+
+    async def write_gatt_char(
+        self, char_uuid: str, data: bytes, response: bool = False
+    ) -> None:
+        pass
+
+    async def start_notify(self, char_uuid: str, callback: Any) -> None:
+        pass
+
+
+def _controller_benchmark(
+    loop: asyncio.AbstractEventLoop,
+    command: Callable[[TrainController, int], Any],
+    metrics: Optional[Metrics] = None,
+    pipeline: bool = False,
+) -> Callable[[], None]:
+    controller = TrainController(NullClient())  # type: ignore[arg-type]
+    if metrics is not None:
+        controller.start_metrics(metrics)
+    if pipeline:
+        # Fast mode: the null client never answers, so no feedback is awaited
+        controller.start_pipeline(fast=True)
+
+    async def batch() -> None:
+        for i in range(CONTROLLER_BATCH):
+            await command(controller, i)
+
+    return lambda: loop.run_until_complete(batch())
+
+
+class _Advertiser:
+    __slots__ = ("address", "name", "rssi", "manufacturer_data")
+
+    def __init__(self, index: int):
+        self.address = f"00:00:00:00:00:{index:02X}"
+        self.name = f"Device {index}"
+        self.rssi = -40 - index
+        self.manufacturer_data = {919: b"\x00"}
+
+
+def _scan_path_benchmark() -> Callable[[], None]:
+    scanner = SharedScanner()
+    subscription = scanner.subscribe("broadcast", maxsize=ADVERTISEMENT_BATCH)
+    stats = BroadcastStats()
+    adverts = [_Advertiser(i % ADVERTISING_DEVICES) for i in range(ADVERTISEMENT_BATCH)]
+    dispatch = scanner.dispatch
+
+    def batch() -> None:
+        for advert in adverts:
+            dispatch(advert, advert)  # type: ignore[arg-type]
+        while subscription:
+            device, adv_data, _ = subscription.get_nowait()
+            stats.add(device.address, device.name, adv_data.rssi)
+
+    return batch
+
+
+def benchmarks(
+    loop: asyncio.AbstractEventLoop,
+) -> dict[str, tuple[Callable[[], Any], int]]:
+    """Map each benchmark name to its operation and the ops each call performs."""
+    cases: dict[str, tuple[Callable[[], Any], int]] = {}
+    structs = protocol_structs()
+    missing = set(structs) - set(STRUCT_SAMPLES)
+    if missing:
+        raise RuntimeError(f"No benchmark sample for {', '.join(sorted(missing))}")
+    for name, codec in structs.items():
+        sample = STRUCT_SAMPLES[name]
+        parsed = codec.parse(sample)
+        cases[f"construct.{name}.parse"] = (functools.partial(codec.parse, sample), 1)
+        cases[f"construct.{name}.build"] = (functools.partial(codec.build, parsed), 1)
+
+    parsed_event = ToothbrushEvent.parse(TOOTHBRUSH_SAMPLE)
+    cases["construct.ToothbrushEvent.parse"] = (
+        lambda: ToothbrushEvent.parse(TOOTHBRUSH_SAMPLE),
+        1,
+    )
+    cases["construct.ToothbrushEvent.build"] = (
+        lambda: ToothbrushEvent.build(parsed_event),
+        1,
+    )
+    cases["decode_toothbrush_event"] = (
+        lambda: decode_toothbrush_event(TOOTHBRUSH_SAMPLE),
+        1,
+    )
+
+    # notification_handler only hands the data to decode_notification
+    for name, sample in NOTIFICATION_SAMPLES.items():
+        cases[f"notification_handler.{name}"] = (
+            functools.partial(decode_notification, bytearray(sample)),
+            1,
+        )
+
+    frame = motor_speed_frame(0, 50)
+    for name, command in [
+        ("set_motor_speed", lambda c, i: c.set_motor_speed(0, i % 100)),
+        ("play_sound", lambda c, i: c.play_sound(1, 9)),
+        ("set_light_color", lambda c, i: c.set_light_color(17, i % 10)),
+        ("send_frame", lambda c, i: c.send_frame(frame)),
+    ]:
+        cases[f"controller.{name}"] = (
+            _controller_benchmark(loop, command),
+            CONTROLLER_BATCH,
+        )
+    cases["controller.set_motor_speed.fast_pipeline"] = (
+        _controller_benchmark(
+            loop,
+            lambda c, i: c.set_motor_speed(0, i % 100),
+            pipeline=True,
+        ),
+        CONTROLLER_BATCH,
+    )
+    cases["controller.send_frame.with_metrics"] = (
+        _controller_benchmark(loop, lambda c, i: c.send_frame(frame), Metrics()),
+        CONTROLLER_BATCH,
+    )
+
+    cases["scanner.dispatch_to_stats"] = (_scan_path_benchmark(), ADVERTISEMENT_BATCH)
+
+    metrics = Metrics()
+    cases["metrics.record"] = (lambda: metrics.record("write", 12_345), 1)
+    return cases
+
+
+def measure(op: Callable[[], Any], per_call: int, min_time: float) -> dict[str, float]:
+    """Best-of-three throughput and the median peak traced bytes per operation."""
+    timer = timeit.Timer(op)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=3, number=number)) / number
+
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _ in range(25):
+            op()
+            baseline, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            op()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(max(0, peak - baseline))
+    finally:
+        tracemalloc.stop()
+    peaks.sort()
+    return {
+        "ops_per_sec": per_call / best,
+        "peak_bytes_per_op": peaks[len(peaks) // 2] / per_call,
+    }
+
+
+def run(name_filter: Optional[str] = None, min_time: float = 0.2) -> dict[str, Any]:
+    """Run the suite and return results in the JSON layout stored on disk."""
+    loop = asyncio.new_event_loop()
+    try:
+        results = {
+            name: measure(op, per_call, min_time)
+            for name, (op, per_call) in benchmarks(loop).items()
+            if name_filter is None or name_filter in name
+        }
+    finally:
+        loop.close()
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(
+    baseline: dict[str, Any], current: dict[str, Any], threshold: float
+) -> list[str]:
+    """Describe every benchmark that regressed by more than ``threshold``.
+
+    A regression is throughput below ``1 - threshold`` times the baseline, or
+    peak memory per operation above ``1 + threshold`` times the baseline (with
+    a 64 byte allowance for measurement noise).
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result["ops_per_sec"] / base["ops_per_sec"]
+        if ratio < 1 - threshold:
+            regressions.append(
+                f"{name}: {result['ops_per_sec']:,.0f} ops/s is {1 - ratio:.0%}"
+                f" below baseline {base['ops_per_sec']:,.0f}"
+            )
+        limit = base["peak_bytes_per_op"] * (1 + threshold) + 64
+        if result["peak_bytes_per_op"] > limit:
+            regressions.append(
+                f"{name}: {result['peak_bytes_per_op']:,.0f} B/op exceeds baseline"
+                f" {base['peak_bytes_per_op']:,.0f} B/op"
+            )
+    return regressions
+
+
+def print_results(current: dict[str, Any], baseline: Optional[dict[str, Any]]) -> None:
+    print(f"{'benchmark':<58} {'ops/s':>13} {'B/op':>8} {'vs base':>8}")
+    for name, result in current["results"].items():
+        change = ""
+        if baseline is not None and name in baseline["results"]:
+            base = baseline["results"][name]["ops_per_sec"]
+            change = f"{result['ops_per_sec'] / base - 1:+.0%}"
+        print(
+            f"{name:<58} {result['ops_per_sec']:>13,.0f}"
+            f" {result['peak_bytes_per_op']:>8,.0f} {change:>8}"
+        )
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", help="Only run benchmarks containing this text")
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="Seconds per timing run (default: 0.2)",
+    )
+    parser.add_argument("--output", type=Path, help="Also write results to this file")
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=BASELINE_PATH,
+        help=f"Baseline file (default: {BASELINE_PATH.name} next to this script)",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store the results as the new baseline",
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Exit with status 1 if any benchmark regressed past --threshold",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"Allowed slowdown as a fraction (default: {DEFAULT_THRESHOLD})",
+    )
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+    current = run(args.filter, args.min_time)
+    print_results(current, baseline)
+
+    if args.output:
+        args.output.write_text(json.dumps(current, indent=2) + "\n")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(current, indent=2) + "\n")
+        print(f"Saved baseline to {args.baseline}")
+    if args.compare:
+        if baseline is None:
+            print(f"No baseline at {args.baseline}", file=sys.stderr)
+            return 2
+        regressions = compare(baseline, current, args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
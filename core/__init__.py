@@ -1,6 +1,33 @@
 """Core configuration and settings for the duplo package."""
 
-from .config import Config
-from .train_controller import TrainController, find_train, convert_speed_to_val
+from typing import TYPE_CHECKING
 
-__all__ = ["Config", "TrainController", "find_train", "convert_speed_to_val"]
+from .lazy import lazy_imports
+
+__getattr__, _import_deferred = lazy_imports(
+    __name__,
+    {
+        "Config": "core.config:Config",
+        "TrainController": "core.train_controller:TrainController",
+        "find_train": "core.train_controller:find_train",
+        "find_trains": "core.train_controller:find_trains",
+        "convert_speed_to_val": "core.train_controller:convert_speed_to_val",
+    },
+)
+
+if TYPE_CHECKING:
+    from .config import Config
+    from .train_controller import (
+        TrainController,
+        find_train,
+        find_trains,
+        convert_speed_to_val,
+    )
+
+__all__ = [
+    "Config",
+    "TrainController",
+    "find_train",
+    "find_trains",
+    "convert_speed_to_val",
+]
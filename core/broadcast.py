@@ -0,0 +1,326 @@
+"""Bookkeeping for long-running BLE broadcast listeners.
+
+A listener left running in a busy RF environment sees the same devices
+hundreds of times a second. ``DedupeTable`` suppresses repeats of a device
+within a TTL while holding at most ``maxsize`` devices, evicting the least
+recently seen; ``BatchWriter`` turns one write per advertisement into one
+write per batch; and ``format_text``/``format_jsonl`` render an advertisement
+in a single string for either humans or machines.
+
+``BroadcastStats`` keeps, per device, the arrival time and RSSI of its last
+advertisements in a preallocated ``RingBuffer`` and summarises a rolling
+window of them (rate, RSSI and inter-arrival percentiles) as a top-N table.
+"""
+
+import asyncio
+import collections
+import json
+import math
+import time
+from typing import Any, Callable, Hashable, Optional, Sequence, TextIO
+
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+from core.sensors import RingBuffer
+
+
+class DedupeTable:
+    """Remembers recently seen keys, bounded in both size and age.
+
+    Args:
+        maxsize: Keys kept before the least recently seen is evicted
+        ttl: Seconds after which a key counts as new again
+        clock: Monotonic clock used for ages
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 4096,
+        ttl: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.duplicates = 0
+        self.evicted = 0
+        self.expired = 0
+        # Key -> when it was last let through, least recently seen first
+        self._seen: collections.OrderedDict[Hashable, float] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def seen(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """Record ``key`` and tell whether it is a repeat within the TTL."""
+        if now is None:
+            now = self.clock()
+        first = self._seen.get(key)
+        if first is not None:
+            self._seen.move_to_end(key)
+            if now - first < self.ttl:
+                self.duplicates += 1
+                return True
+            self.expired += 1
+        elif len(self._seen) >= self.maxsize:
+            self._seen.popitem(last=False)
+            self.evicted += 1
+        self._seen[key] = now
+        return False
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._seen),
+            "duplicates": self.duplicates,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
+
+
+class BatchWriter:
+    """Buffers lines and writes them to ``stream`` in batches.
+
+    A batch is written once ``batch_size`` lines are pending, and at least
+    every ``interval`` seconds while used as an async context manager.
+
+    Args:
+        stream: Text stream to write to, e.g. ``sys.stdout``
+        batch_size: Pending lines that trigger a write
+        interval: Longest time a line waits, in seconds
+    """
+
+    def __init__(self, stream: TextIO, batch_size: int = 256, interval: float = 0.5):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lines = 0
+        self.batches = 0
+        self._pending: list[str] = []
+        self._task: Optional[asyncio.Task[None]] = None
+
+    def write(self, line: str) -> None:
+        """Queue ``line``; a newline is added."""
+        self._pending.append(line)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        self._pending.append("")
+        self.stream.write("\n".join(self._pending))
+        self.stream.flush()
+        self.lines += len(self._pending) - 1
+        self.batches += 1
+        self._pending.clear()
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+    async def __aenter__(self) -> "BatchWriter":
+        self._task = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.flush()
+
+
+def format_text(
+    device: BLEDevice,
+    adv_data: AdvertisementData,
+    show_manufacturer_data: bool = False,
+    show_service_data: bool = False,
+) -> str:
+    """Human-readable block describing one advertisement."""
+    lines = [
+        f"Device: {device.name or 'Unknown'} ({device.address})",
+        f"  RSSI: {adv_data.rssi} dBm",
+    ]
+    if adv_data.local_name and adv_data.local_name != device.name:
+        lines.append(f"  Local Name: {adv_data.local_name}")
+    if adv_data.service_uuids:
+        lines.append(f"  Services: {', '.join(adv_data.service_uuids)}")
+    if show_manufacturer_data and adv_data.manufacturer_data:
+        lines.append("  Manufacturer Data:")
+        for manufacturer_id, data in adv_data.manufacturer_data.items():
+            lines.append(f"    ID {manufacturer_id}: {data.hex()}")
+    if show_service_data and adv_data.service_data:
+        lines.append("  Service Data:")
+        for service_uuid, data in adv_data.service_data.items():
+            lines.append(f"    {service_uuid}: {data.hex()}")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def format_jsonl(
+    device: BLEDevice, adv_data: AdvertisementData, timestamp: float
+) -> str:
+    """One JSON object per advertisement, payloads as hex strings."""
+    return json.dumps(
+        {
+            "time": round(timestamp, 3),
+            "address": device.address,
+            "name": device.name,
+            "local_name": adv_data.local_name,
+            "rssi": adv_data.rssi,
+            "service_uuids": list(adv_data.service_uuids),
+            "manufacturer_data": {
+                str(key): data.hex() for key, data in adv_data.manufacturer_data.items()
+            },
+            "service_data": {
+                key: data.hex() for key, data in adv_data.service_data.items()
+            },
+        },
+        separators=(",", ":"),
+    )
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted ``values``, ``q`` in 0..1."""
+    return values[int((len(values) - 1) * q)]
+
+
+class DeviceWindow:
+    """Recent advertisements of one device: arrival times and RSSI."""
+
+    __slots__ = ("address", "name", "total", "readings")
+
+    def __init__(self, address: str, name: Optional[str], capacity: int):
+        self.address = address
+        self.name = name
+        self.total = 0
+        self.readings = RingBuffer(capacity)
+
+    def add(self, now: float, rssi: float) -> None:
+        self.total += 1
+        self.readings.append(now, rssi)
+
+    def summary(self, window: float, now: float) -> Optional[dict[str, float]]:
+        """Rate, RSSI and inter-arrival figures over the last ``window`` seconds.
+
+        Returns:
+            None if the device sent nothing within the window
+        """
+        times, rssi = self.readings.window_items(window, now)
+        if not times:
+            return None
+        rssi.sort()
+        summary = {
+            "count": len(times),
+            "rate": len(times) / window,
+            "rssi_mean": math.fsum(rssi) / len(rssi),
+            "rssi_p10": percentile(rssi, 0.10),
+            "rssi_p90": percentile(rssi, 0.90),
+        }
+        if len(times) > 1:
+            gaps = sorted(b - a for a, b in zip(times, times[1:]))
+            summary["gap_p50"] = percentile(gaps, 0.50)
+            summary["gap_p99"] = percentile(gaps, 0.99)
+        return summary
+
+
+class BroadcastStats:
+    """Rolling per-device advertisement statistics for many devices.
+
+    Args:
+        window: Seconds of history summarised
+        capacity: Advertisements kept per device; bounds the rate that can be
+            measured to ``capacity / window`` per second
+        max_devices: Devices tracked before the least recently heard is
+            dropped
+        clock: Monotonic clock used for arrival times
+    """
+
+    def __init__(
+        self,
+        window: float = 10.0,
+        capacity: int = 256,
+        max_devices: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.window = window
+        self.capacity = capacity
+        self.max_devices = max_devices
+        self.clock = clock
+        self.total = 0
+        self.started = clock()
+        self.devices: collections.OrderedDict[str, DeviceWindow] = (
+            collections.OrderedDict()
+        )
+
+    def add(
+        self,
+        address: str,
+        name: Optional[str],
+        rssi: float,
+        now: Optional[float] = None,
+    ) -> None:
+        """Count one advertisement from ``address``."""
+        if now is None:
+            now = self.clock()
+        self.total += 1
+        device = self.devices.get(address)
+        if device is None:
+            if len(self.devices) >= self.max_devices:
+                self.devices.popitem(last=False)
+            device = self.devices[address] = DeviceWindow(address, name, self.capacity)
+        else:
+            self.devices.move_to_end(address)
+            if name:
+                device.name = name
+        device.add(now, rssi)
+
+    def rate(self, now: Optional[float] = None) -> float:
+        """Advertisements per second since the statistics started."""
+        elapsed = (self.clock() if now is None else now) - self.started
+        return self.total / elapsed if elapsed > 0 else 0.0
+
+    def top(
+        self, count: int = 10, now: Optional[float] = None
+    ) -> list[tuple[DeviceWindow, dict[str, float]]]:
+        """The ``count`` busiest devices within the window, busiest first."""
+        if now is None:
+            now = self.clock()
+        active = []
+        for device in self.devices.values():
+            summary = device.summary(self.window, now)
+            if summary is not None:
+                active.append((device, summary))
+        active.sort(key=lambda item: item[1]["count"], reverse=True)
+        return active[:count]
+
+    def render(self, count: int = 10, now: Optional[float] = None) -> str:
+        """Table of the busiest devices with a header line of totals."""
+        if now is None:
+            now = self.clock()
+        top = self.top(count, now)
+        lines = [
+            f"{self.total} advertisements from {len(self.devices)} devices, "
+            f"{self.rate(now):.1f}/s overall; last {self.window:g}s:",
+            f"{'ADDRESS':<18} {'NAME':<16} {'ADV/S':>6} {'RSSI':>6} "
+            f"{'P10':>5} {'P90':>5} {'GAP P50':>8} {'GAP P99':>8}",
+        ]
+        for device, summary in top:
+            if "gap_p50" in summary:
+                p50, p99 = summary["gap_p50"] * 1000, summary["gap_p99"] * 1000
+                gaps = f"{p50:>6.0f}ms {p99:>6.0f}ms"
+            else:
+                gaps = f"{'-':>8} {'-':>8}"
+            lines.append(
+                f"{device.address:<18} {(device.name or '?')[:16]:<16} "
+                f"{summary['rate']:>6.1f} {summary['rssi_mean']:>6.1f} "
+                f"{summary['rssi_p10']:>5.0f} {summary['rssi_p90']:>5.0f} {gaps}"
+            )
+        return "\n".join(lines)
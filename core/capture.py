@@ -0,0 +1,239 @@
+"""Binary capture of BLE traffic and replay of captures.
+
+A capture file is a 16 byte header followed by length-prefixed records::
+
+    header:  magic b"DCAP", version (u8), 3 pad bytes, wall clock start (f64)
+    record:  offset (f64), kind (u8), source length (u8), channel (u16),
+             payload length (u16), source (utf-8), payload
+
+Offsets are seconds since the capture started. ``channel`` is the
+manufacturer ID for advertisements and the characteristic handle for
+notifications. All integers are little-endian. Files are read through
+``mmap``, so even long captures replay without being loaded into memory.
+"""
+
+import asyncio
+import inspect
+import logging
+import mmap
+import struct
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"DCAP"
+VERSION = 1
+
+# Record kinds
+ADVERTISEMENT = 1
+NOTIFICATION = 2
+WRITE = 3
+
+KIND_NAMES = {
+    ADVERTISEMENT: "advertisement",
+    NOTIFICATION: "notification",
+    WRITE: "write",
+}
+
+_header = struct.Struct("<4sBxxxd")
+_record = struct.Struct("<dBBHH")
+
+
+class CaptureRecord:
+    """One captured payload."""
+
+    __slots__ = ("offset", "kind", "source", "channel", "payload")
+
+    def __init__(
+        self, offset: float, kind: int, source: str, channel: int, payload: bytes
+    ):
+        self.offset = offset
+        self.kind = kind
+        self.source = source
+        self.channel = channel
+        self.payload = payload
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CaptureRecord):
+            return NotImplemented
+        return all(getattr(self, s) == getattr(other, s) for s in self.__slots__)
+
+    def __repr__(self) -> str:
+        return (
+            f"CaptureRecord({self.offset:.6f}, {KIND_NAMES.get(self.kind, self.kind)},"
+            f" {self.source!r}, {self.channel}, {self.payload.hex()})"
+        )
+
+
+class CaptureWriter:
+    """Append timestamped payloads to a capture file.
+
+    Args:
+        path: File to create; an existing file is overwritten
+        clock: Monotonic clock used for record offsets
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.path = Path(path)
+        self.clock = clock
+        self.records = 0
+        self._file: Optional[BinaryIO] = open(self.path, "wb")
+        self._file.write(_header.pack(MAGIC, VERSION, time.time()))
+        self._start = clock()
+
+    def record(self, kind: int, source: str, payload: bytes, channel: int = 0) -> None:
+        """Append one record stamped with the current clock."""
+        if self._file is None:
+            raise ValueError("Capture is closed")
+        encoded = source.encode()[:255]
+        self._file.write(
+            _record.pack(
+                self.clock() - self._start, kind, len(encoded), channel, len(payload)
+            )
+            + encoded
+            + payload
+        )
+        self.records += 1
+
+    def advertisement(self, address: str, manufacturer_id: int, data: bytes) -> None:
+        """Record the manufacturer data of an advertisement."""
+        self.record(ADVERTISEMENT, address, data, manufacturer_id)
+
+    def notification(self, source: str, data: bytes, handle: int = 0) -> None:
+        """Record a GATT notification received from ``source``."""
+        self.record(NOTIFICATION, source, data, handle)
+
+    def write(self, source: str, frame: bytes) -> None:
+        """Record a frame written to ``source``."""
+        self.record(WRITE, source, frame)
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+class CaptureReader:
+    """Iterate over the records of a memory-mapped capture file.
+
+    A record cut short at the end of the file (for example after a crash
+    while recording) ends iteration with a warning.
+
+    Raises:
+        ValueError: If the file is not a capture or has an unsupported version
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            size = f.seek(0, 2)
+            if size < _header.size:
+                raise ValueError(f"{self.path}: not a capture file")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.started = _header.unpack_from(self._map)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{self.path}: not a capture file")
+        if version != VERSION:
+            self._map.close()
+            raise ValueError(f"{self.path}: unsupported capture version {version}")
+
+    def __iter__(self) -> Iterator[CaptureRecord]:
+        data = self._map
+        size = len(data)
+        position = _header.size
+        unpack = _record.unpack_from
+        record_size = _record.size
+        while position + record_size <= size:
+            offset, kind, source_length, channel, length = unpack(data, position)
+            start = position + record_size
+            end = start + source_length + length
+            if end > size:
+                break
+            source = data[start : start + source_length].decode()
+            yield CaptureRecord(
+                offset, kind, source, channel, data[start + source_length : end]
+            )
+            position = end
+        if position != size:
+            logger.warning("Capture %s ends with a truncated record", self.path)
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+class ReplayResult:
+    """Outcome of a replay: how many records ran, how long it took, how late."""
+
+    __slots__ = ("records", "elapsed", "max_lateness")
+
+    def __init__(self, records: int, elapsed: float, max_lateness: float):
+        self.records = records
+        self.elapsed = elapsed
+        self.max_lateness = max_lateness
+
+    @property
+    def rate(self) -> float:
+        """Records replayed per second."""
+        return self.records / self.elapsed if self.elapsed > 0 else float("inf")
+
+
+async def replay(
+    records: Iterable[CaptureRecord],
+    handlers: dict[int, Callable[[CaptureRecord], Any]],
+    speed: Optional[float] = 1.0,
+) -> ReplayResult:
+    """Feed captured records to ``handlers`` keyed by record kind.
+
+    Args:
+        records: Records in capture order, e.g. a ``CaptureReader``
+        handlers: Called with each record of their kind; may return an
+            awaitable. Kinds without a handler are skipped.
+        speed: Playback rate relative to the capture (2.0 is twice as fast);
+            None or 0 replays as fast as possible
+
+    Returns:
+        The number of records handled, the wall time taken and the latest
+        any record was handled relative to its scheduled time
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    count = 0
+    max_lateness = 0.0
+    for record in records:
+        handler = handlers.get(record.kind)
+        if handler is None:
+            continue
+        if speed:
+            due = start + record.offset / speed
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            max_lateness = max(max_lateness, loop.time() - due)
+        result = handler(record)
+        if inspect.isawaitable(result):
+            await result
+        count += 1
+    return ReplayResult(count, loop.time() - start, max_lateness)
@@ -1,3 +1,5 @@
+import functools
+from pathlib import Path
 from uuid import UUID
 
 from pydantic_settings import BaseSettings
@@ -6,3 +8,12 @@ from pydantic_settings import BaseSettings
 class Config(BaseSettings):
     UART_UUID: UUID = UUID("00001623-1212-efde-1623-785feabcd123")
     CHAR_UUID: UUID = UUID("00001624-1212-efde-1623-785feabcd123")
+    DISCOVERY_CACHE_PATH: Path = Path("~/.cache/duplo/discovery.json")
+    DISCOVERY_CACHE_TTL: float = 7 * 24 * 3600.0
+    DAEMON_SOCKET_PATH: Path = Path("~/.cache/duplo/daemon.sock")
+
+
+@functools.cache
+def get_config() -> Config:
+    """Return the shared settings, reading the environment on first use."""
+    return Config()
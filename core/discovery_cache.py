@@ -0,0 +1,144 @@
+"""On-disk cache of discovered train hubs, so connections can skip the scan."""
+
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from core.config import get_config
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """What we remember about a hub: where it is and what is plugged into it."""
+
+    __slots__ = ("name", "address", "last_seen", "attached_io")
+
+    def __init__(
+        self,
+        name: str,
+        address: str,
+        last_seen: float,
+        attached_io: Optional[dict[int, int]] = None,
+    ):
+        self.name = name
+        self.address = address
+        self.last_seen = last_seen
+        self.attached_io = attached_io or {}
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "address": self.address,
+            "last_seen": self.last_seen,
+            "attached_io": {str(port): io for port, io in self.attached_io.items()},
+        }
+
+    @classmethod
+    def from_json(cls, name: str, data: dict[str, Any]) -> "CacheEntry":
+        return cls(
+            name,
+            data["address"],
+            float(data["last_seen"]),
+            {int(port): int(io) for port, io in data.get("attached_io", {}).items()},
+        )
+
+
+class DiscoveryCache:
+    """Maps device names to hub addresses, last-seen times and attached IO.
+
+    Entries older than ``ttl`` seconds count as misses. The cache is written
+    back to ``path`` whenever it changes; an unreadable file is treated as
+    empty.
+    """
+
+    def __init__(self, path: Optional[Path] = None, ttl: Optional[float] = None):
+        if path is None or ttl is None:
+            config = get_config()
+            path = path if path is not None else config.DISCOVERY_CACHE_PATH
+            ttl = ttl if ttl is not None else config.DISCOVERY_CACHE_TTL
+        self.path = Path(path).expanduser()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = self._load()
+
+    def _load(self) -> dict[str, CacheEntry]:
+        try:
+            data = json.loads(self.path.read_text())
+            return {
+                name: CacheEntry.from_json(name, entry) for name, entry in data.items()
+            }
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning("Ignoring unreadable discovery cache %s: %s", self.path, e)
+            return {}
+
+    def _save(self) -> None:
+        data = {name: entry.to_json() for name, entry in self._entries.items()}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(data, indent=2))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Could not write discovery cache %s: %s", self.path, e)
+
+    def lookup(self, name: str) -> Optional[CacheEntry]:
+        """Return the fresh entry for ``name``, counting a hit or a miss."""
+        entry = self._entries.get(name)
+        if entry is None or time.time() - entry.last_seen > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def record(
+        self,
+        name: str,
+        address: str,
+        attached_io: Optional[dict[int, int]] = None,
+    ) -> CacheEntry:
+        """Remember ``name`` at ``address``, keeping its known IO layout by default."""
+        previous = self._entries.get(name)
+        if attached_io is None and previous is not None and previous.address == address:
+            attached_io = previous.attached_io
+        entry = CacheEntry(name, address, time.time(), attached_io)
+        self._entries[name] = entry
+        self._save()
+        return entry
+
+    def layout(self, name: str, address: str) -> dict[int, int]:
+        """IO layout remembered for ``name`` at ``address``, or empty if none.
+
+        Unlike ``lookup`` this ignores the TTL and counts neither a hit nor a miss.
+        """
+        entry = self._entries.get(name)
+        if entry is None or entry.address != address:
+            return {}
+        return dict(entry.attached_io)
+
+    def invalidate(self, name: str) -> None:
+        """Forget ``name``, e.g. after a direct connect to its address failed."""
+        if self._entries.pop(name, None) is not None:
+            self.invalidations += 1
+            self._save()
+
+    def clear(self) -> None:
+        """Forget every entry."""
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._save()
+
+    def stats(self) -> dict[str, int]:
+        """Hit, miss and invalidation counters plus the number of entries."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,162 @@
+"""Precomputed command frames for the DUPLO train hub.
+
+Every outgoing command differs from the previous one in only a byte or two, so
+instead of running a nested dict through ``construct`` for each write, the
+frames are assembled from fixed templates (or looked up in prebuilt tables for
+the ports we use). The output is byte-for-byte identical to the ``construct``
+builders in ``protocols.ble_duplo_train``.
+"""
+
+import struct
+
+# Message type bytes, mirroring ``protocols.ble_duplo_train.message_type``
+PORT_INPUT_FORMAT_SETUP_SINGLE = 0x41
+PORT_OUTPUT_COMMAND = 0x81
+
+# ``port_output_command`` sub command used for all DUPLO outputs (WriteDirectModeData)
+WRITE_DIRECT_MODE_DATA = 0x51
+
+# Startup and completion nibbles: execute immediately, request feedback
+STARTUP_AND_COMPLETION = 0x11
+# Execute immediately without feedback, for fire-and-forget streams of commands
+STARTUP_NO_FEEDBACK = 0x10
+
+# Mode byte written ahead of the value in the output command payload
+MOTOR_MODE = 0x00
+SOUND_MODE = 0x01
+LIGHT_MODE = 0x00
+
+# Default port layout of the DUPLO train base
+MOTOR_PORT = 0
+SPEAKER_PORT = 1
+LIGHT_PORT = 17
+
+_OUTPUT_COMMAND_LENGTH = 8
+_INPUT_FORMAT_SETUP_LENGTH = 10
+
+_input_format_setup = struct.Struct("<BBBBBIB")
+
+
+def _speed_to_val(speed: int) -> int:
+    if speed == 127:
+        return 127
+    if speed > 100:
+        speed = 100
+    if speed < 0:
+        speed = speed & 255
+    return speed
+
+
+# Speed byte for every speed in -128..127, indexed by ``speed + 128``
+SPEED_TABLE = bytes(_speed_to_val(speed) for speed in range(-128, 128))
+
+
+def speed_byte(speed: int) -> int:
+    """Map a speed of -100 to 100 (or 127 for brake) to its wire byte."""
+    if -128 <= speed <= 127:
+        return SPEED_TABLE[speed + 128]
+    return _speed_to_val(speed)
+
+
+def output_command_frame(
+    port_id: int,
+    mode: int,
+    value: int,
+    startup_and_completion: int = STARTUP_AND_COMPLETION,
+) -> bytes:
+    """Build a ``port_output_command`` frame writing ``value`` in ``mode``."""
+    return bytes(
+        (
+            _OUTPUT_COMMAND_LENGTH,
+            0,
+            PORT_OUTPUT_COMMAND,
+            port_id,
+            startup_and_completion,
+            WRITE_DIRECT_MODE_DATA,
+            mode,
+            value,
+        )
+    )
+
+
+def _build_table(port_id: int, mode: int, flags: int) -> tuple[bytes, ...]:
+    return tuple(
+        output_command_frame(port_id, mode, value, flags) for value in range(256)
+    )
+
+
+# Prebuilt frames for every value on the default ports, indexed by the value byte
+_TABLES: dict[tuple[int, int, int], tuple[bytes, ...]] = {
+    (port_id, mode, STARTUP_AND_COMPLETION): _build_table(
+        port_id, mode, STARTUP_AND_COMPLETION
+    )
+    for port_id, mode in (
+        (MOTOR_PORT, MOTOR_MODE),
+        (SPEAKER_PORT, SOUND_MODE),
+        (LIGHT_PORT, LIGHT_MODE),
+    )
+}
+
+
+def frame_table(
+    port_id: int, mode: int, startup_and_completion: int = STARTUP_AND_COMPLETION
+) -> tuple[bytes, ...]:
+    """Return the 256 prebuilt frames for ``(port_id, mode)``, building on first use."""
+    key = (port_id, mode, startup_and_completion)
+    table = _TABLES.get(key)
+    if table is None:
+        table = _TABLES[key] = _build_table(port_id, mode, startup_and_completion)
+    return table
+
+
+def motor_speed_frame(
+    port_id: int, speed: int, startup_and_completion: int = STARTUP_AND_COMPLETION
+) -> bytes:
+    """Frame setting the motor on ``port_id`` to ``speed`` (-100 to 100, 127 brakes)."""
+    return frame_table(port_id, MOTOR_MODE, startup_and_completion)[speed_byte(speed)]
+
+
+def sound_frame(
+    port_id: int, sound_id: int, startup_and_completion: int = STARTUP_AND_COMPLETION
+) -> bytes:
+    """Frame playing ``sound_id`` on the speaker at ``port_id``.
+
+    Raises:
+        ValueError: If ``sound_id`` does not fit in a byte
+    """
+    table = frame_table(port_id, SOUND_MODE, startup_and_completion)
+    if not 0 <= sound_id < len(table):
+        raise ValueError(f"Sound id {sound_id} out of range 0-{len(table) - 1}")
+    return table[sound_id]
+
+
+def light_color_frame(
+    port_id: int, color_id: int, startup_and_completion: int = STARTUP_AND_COMPLETION
+) -> bytes:
+    """Frame setting the light at ``port_id`` to ``color_id``.
+
+    Raises:
+        ValueError: If ``color_id`` does not fit in a byte
+    """
+    table = frame_table(port_id, LIGHT_MODE, startup_and_completion)
+    if not 0 <= color_id < len(table):
+        raise ValueError(f"Color id {color_id} out of range 0-{len(table) - 1}")
+    return table[color_id]
+
+
+def port_input_format_frame(
+    port_id: int,
+    mode: int = 1,
+    delta_interval: int = 1,
+    notification_enabled: bool = True,
+) -> bytes:
+    """Build a ``port_input_format_setup_single`` frame."""
+    return _input_format_setup.pack(
+        _INPUT_FORMAT_SETUP_LENGTH,
+        0,
+        PORT_INPUT_FORMAT_SETUP_SINGLE,
+        port_id,
+        mode,
+        delta_interval,
+        1 if notification_enabled else 0,
+    )
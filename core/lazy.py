@@ -0,0 +1,55 @@
+"""Deferred imports, so importing a package or parsing CLI arguments stays cheap.
+
+A module lists the names it wants to defer and where they live::
+
+    __getattr__, _import_deferred = lazy_imports(
+        __name__, {"BleakClient": "bleak:BleakClient"}
+    )
+
+Accessing ``module.BleakClient`` imports ``bleak`` on first use and stores
+the result as a regular module global. Functions that use the names as bare
+globals call ``_import_deferred()`` first; names that are already set (for
+example patched in a test) are left alone.
+"""
+
+import importlib
+import sys
+from typing import Any, Callable
+
+
+def lazy_imports(
+    module_name: str, targets: dict[str, str]
+) -> tuple[Callable[[str], Any], Callable[[], None]]:
+    """Build a module ``__getattr__`` and a loader for deferred names.
+
+    Args:
+        module_name: ``__name__`` of the module the names belong to
+        targets: Maps each name to ``"module.path:attribute"``, or to a bare
+            ``"module.path"`` for a module
+
+    Returns:
+        The module-level ``__getattr__`` and a function importing every
+        deferred name that is not set yet
+    """
+
+    def __getattr__(name: str) -> Any:
+        try:
+            target = targets[name]
+        except KeyError:
+            raise AttributeError(
+                f"module {module_name!r} has no attribute {name!r}"
+            ) from None
+        module_path, _, attribute = target.partition(":")
+        value: Any = importlib.import_module(module_path)
+        if attribute:
+            value = getattr(value, attribute)
+        setattr(sys.modules[module_name], name, value)
+        return value
+
+    def import_deferred() -> None:
+        namespace = sys.modules[module_name].__dict__
+        for name in targets:
+            if name not in namespace:
+                __getattr__(name)
+
+    return __getattr__, import_deferred
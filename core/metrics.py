@@ -0,0 +1,236 @@
+"""Per-stage latency histograms and their OpenMetrics export.
+
+Instrumented code holds an optional ``Metrics`` and records only when one is
+set, so disabled instrumentation costs a single ``is not None`` check::
+
+    if self.metrics is not None:
+        self.metrics.record("write", time.perf_counter_ns() - start)
+
+Histograms use HDR-style log-linear buckets: exact below 32 ns, then 16
+buckets per power of two, so every recorded value is kept within about 6%
+using a fixed array of integer counters and no allocation per sample.
+"""
+
+import asyncio
+import logging
+import math
+import os
+from array import array
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncGenerator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Values below 2**SUB_BUCKET_BITS are counted exactly
+SUB_BUCKET_BITS = 5
+_SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+_HALF = _SUB_BUCKETS // 2
+
+# Largest trackable latency; longer ones are clamped (about 18 minutes)
+MAX_NANOSECONDS = 1 << 40
+
+# ``le`` bounds of the exported histogram buckets, in seconds
+EXPORT_BOUNDS = tuple(m * 10.0**e for e in range(-6, 1) for m in (1, 2, 5)) + (10.0,)
+
+EXPORT_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+METRIC_NAME = "duplo_stage_latency_seconds"
+
+
+def bucket_index(value: int) -> int:
+    """Bucket of a non-negative value in nanoseconds."""
+    if value < _SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return shift * _HALF + (value >> shift)
+
+
+def bucket_upper_bound(index: int) -> int:
+    """Largest value in nanoseconds counted in bucket ``index``."""
+    if index < _SUB_BUCKETS:
+        return index
+    shift = index // _HALF - 1
+    return ((index - shift * _HALF + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Counts latencies in nanoseconds into fixed log-linear buckets."""
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self) -> None:
+        self.counts = array("Q", bytes(8 * (bucket_index(MAX_NANOSECONDS) + 1)))
+        self.count = 0
+        self.total = 0
+        self.min = MAX_NANOSECONDS
+        self.max = 0
+
+    def record(self, nanoseconds: int) -> None:
+        if nanoseconds < 0:
+            nanoseconds = 0
+        elif nanoseconds > MAX_NANOSECONDS:
+            nanoseconds = MAX_NANOSECONDS
+        self.counts[bucket_index(nanoseconds)] += 1
+        self.count += 1
+        self.total += nanoseconds
+        if nanoseconds < self.min:
+            self.min = nanoseconds
+        if nanoseconds > self.max:
+            self.max = nanoseconds
+
+    def percentile(self, quantile: float) -> int:
+        """Upper bound in nanoseconds of the bucket holding ``quantile`` (0-1)."""
+        if self.count == 0:
+            return 0
+        rank = max(1, math.ceil(quantile * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_upper_bound(index), self.max)
+        return self.max
+
+    def count_at_or_below(self, nanoseconds: int) -> int:
+        """Number of samples whose bucket lies entirely at or below ``nanoseconds``."""
+        total = 0
+        for index, count in enumerate(self.counts):
+            if bucket_upper_bound(index) > nanoseconds:
+                break
+            total += count
+        return total
+
+    def reset(self) -> None:
+        self.counts = array("Q", bytes(8 * len(self.counts)))
+        self.count = 0
+        self.total = 0
+        self.min = MAX_NANOSECONDS
+        self.max = 0
+
+
+class Metrics:
+    """A latency histogram per pipeline stage."""
+
+    def __init__(self) -> None:
+        self.histograms: dict[str, LatencyHistogram] = {}
+
+    def histogram(self, stage: str) -> LatencyHistogram:
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        return histogram
+
+    def record(self, stage: str, nanoseconds: int) -> None:
+        """Add one latency sample for ``stage``."""
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.record(nanoseconds)
+
+    def to_openmetrics(self) -> str:
+        """Render every stage as an OpenMetrics histogram plus quantiles."""
+        lines = [
+            f"# TYPE {METRIC_NAME} histogram",
+            f"# UNIT {METRIC_NAME} seconds",
+            f"# HELP {METRIC_NAME} Latency of each pipeline stage.",
+        ]
+        for stage, histogram in sorted(self.histograms.items()):
+            label = f'stage="{stage}"'
+            for bound in EXPORT_BOUNDS:
+                count = histogram.count_at_or_below(int(bound * 1e9))
+                lines.append(f'{METRIC_NAME}_bucket{{{label},le="{bound:g}"}} {count}')
+            lines.append(f'{METRIC_NAME}_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f"{METRIC_NAME}_count{{{label}}} {histogram.count}")
+            lines.append(f"{METRIC_NAME}_sum{{{label}}} {histogram.total / 1e9:.9f}")
+        quantiles = f"{METRIC_NAME.removesuffix('_seconds')}_quantile_seconds"
+        lines += [
+            f"# TYPE {quantiles} gauge",
+            f"# UNIT {quantiles} seconds",
+            f"# HELP {quantiles} Latency percentiles of each pipeline stage.",
+        ]
+        for stage, histogram in sorted(self.histograms.items()):
+            for quantile in EXPORT_QUANTILES:
+                labels = f'stage="{stage}",quantile="{quantile:g}"'
+                value = histogram.percentile(quantile) / 1e9
+                lines.append(f"{quantiles}{{{labels}}} {value:.9f}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_openmetrics(self, path: Union[str, Path]) -> None:
+        """Atomically replace ``path`` with the current metrics."""
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_text(self.to_openmetrics())
+        os.replace(tmp_path, path)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 9464) -> asyncio.Server:
+        """Serve the metrics over HTTP to any request, for Prometheus scrapes."""
+
+        async def handle(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            try:
+                # Read the request line and headers, then answer regardless of path
+                while await reader.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                body = self.to_openmetrics().encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/openmetrics-text; version=1.0.0;"
+                    b" charset=utf-8\r\n"
+                    + f"Content-Length: {len(body)}\r\n".encode()
+                    + b"Connection: close\r\n\r\n"
+                    + body
+                )
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, host, port)
+
+    @asynccontextmanager
+    async def exporting(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        port: Optional[int] = None,
+        interval: float = 5.0,
+    ) -> AsyncGenerator["Metrics", None]:
+        """Export while the context is open: rewrite ``path`` every ``interval``
+        seconds and once more on exit, and serve HTTP on ``port``.
+        """
+        server = await self.serve(port=port) if port else None
+        task = asyncio.create_task(self._write_every(path, interval)) if path else None
+        try:
+            yield self
+        finally:
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                self.write_openmetrics(path)  # type: ignore[arg-type]
+            if server is not None:
+                server.close()
+                await server.wait_closed()
+
+    async def _write_every(self, path: Union[str, Path], interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.write_openmetrics(path)
+            except OSError as e:
+                logger.warning("Could not write metrics to %s: %s", path, e)
+
+    def summary(self, stage: str) -> Optional[dict[str, float]]:
+        """Count and percentiles in seconds for ``stage``, or None if unrecorded."""
+        histogram = self.histograms.get(stage)
+        if histogram is None or histogram.count == 0:
+            return None
+        summary = {
+            "count": histogram.count,
+            "mean": histogram.total / histogram.count / 1e9,
+        }
+        for quantile in EXPORT_QUANTILES:
+            summary[f"p{quantile * 100:g}"] = histogram.percentile(quantile) / 1e9
+        summary["max"] = histogram.max / 1e9
+        return summary
@@ -0,0 +1,203 @@
+"""Precomputed motor speed profiles and a fixed-tick scheduler to play them.
+
+Ramping a train by hand with awaited ``set_motor_speed`` calls and sleeps
+drifts: every step waits for its write and then for a full sleep. A
+``MotionProfile`` instead holds the wire speed byte for every tick of a
+movement, computed up front, and ``play_profile`` writes them on a grid of
+``loop.time()`` deadlines so timing errors never accumulate::
+
+    profile = s_curve(0, 60, duration=2.0)
+    result = await play_profile(controller.send_frame, profile)
+    print(result.summary())  # ticks, writes and jitter per tick
+
+Ticks whose speed byte equals the last one written are not sent again, and a
+scheduler that falls more than a tick behind jumps to the current tick
+rather than bursting the ticks it missed.
+"""
+
+import asyncio
+import math
+from array import array
+from typing import Awaitable, Callable, Optional
+
+from core.frames import MOTOR_MODE, MOTOR_PORT, SPEED_TABLE, frame_table
+from core.write_scheduler import DEFAULT_TICK
+
+
+def _speed_bytes(speeds: list[float]) -> bytes:
+    """Wire bytes of speeds in -100..100, rounded and clamped."""
+    return bytes(
+        SPEED_TABLE[max(-100, min(100, round(speed))) + 128] for speed in speeds
+    )
+
+
+class MotionProfile:
+    """Speed byte to write at each tick of a movement."""
+
+    __slots__ = ("speed_bytes", "tick")
+
+    def __init__(self, speed_bytes: bytes, tick: float = DEFAULT_TICK):
+        if tick <= 0:
+            raise ValueError("tick must be positive")
+        self.speed_bytes = speed_bytes
+        self.tick = tick
+
+    def __len__(self) -> int:
+        return len(self.speed_bytes)
+
+    def __add__(self, other: "MotionProfile") -> "MotionProfile":
+        if other.tick != self.tick:
+            raise ValueError("Cannot join profiles with different ticks")
+        return MotionProfile(self.speed_bytes + other.speed_bytes, self.tick)
+
+    @property
+    def duration(self) -> float:
+        return len(self.speed_bytes) * self.tick
+
+    @property
+    def speeds(self) -> array:
+        """Signed speed of each tick."""
+        return array("b", self.speed_bytes)
+
+    def __repr__(self) -> str:
+        return f"MotionProfile(ticks={len(self)}, tick={self.tick})"
+
+
+def _ticks(duration: float, tick: float) -> int:
+    return max(1, math.ceil(duration / tick - 1e-9))
+
+
+def ramp(
+    start: int, end: int, duration: float, tick: float = DEFAULT_TICK
+) -> MotionProfile:
+    """Change speed linearly from ``start`` to ``end`` over ``duration`` seconds."""
+    steps = _ticks(duration, tick)
+    delta = end - start
+    return MotionProfile(
+        _speed_bytes([start + delta * (i + 1) / steps for i in range(steps)]), tick
+    )
+
+
+def s_curve(
+    start: int, end: int, duration: float, tick: float = DEFAULT_TICK
+) -> MotionProfile:
+    """Change speed from ``start`` to ``end`` with smooth acceleration.
+
+    Uses the smoothstep curve, so acceleration is zero at both ends and the
+    train starts and settles without a jolt.
+    """
+    steps = _ticks(duration, tick)
+    delta = end - start
+    speeds = []
+    for i in range(steps):
+        t = (i + 1) / steps
+        speeds.append(start + delta * t * t * (3 - 2 * t))
+    return MotionProfile(_speed_bytes(speeds), tick)
+
+
+def hold(speed: int, duration: float, tick: float = DEFAULT_TICK) -> MotionProfile:
+    """Keep ``speed`` for ``duration`` seconds."""
+    return MotionProfile(_speed_bytes([speed]) * _ticks(duration, tick), tick)
+
+
+def stop_at_time(
+    speed: int, at: float, braking: float = 1.0, tick: float = DEFAULT_TICK
+) -> MotionProfile:
+    """Cruise at ``speed`` and come to rest exactly ``at`` seconds from now.
+
+    The last ``braking`` seconds slow the train down along an S-curve; if
+    ``at`` is shorter than ``braking`` the whole profile is braking.
+    """
+    braking = min(braking, at)
+    cruise = at - braking
+    profile = s_curve(speed, 0, braking, tick)
+    if cruise >= tick:
+        profile = hold(speed, cruise, tick) + profile
+    return profile
+
+
+class ProfileResult:
+    """Timing of one played profile.
+
+    ``jitter`` holds, per tick sent, how late its write started relative to
+    its deadline, in seconds.
+    """
+
+    __slots__ = ("ticks", "writes", "skipped", "jitter", "elapsed")
+
+    def __init__(self) -> None:
+        self.ticks = 0
+        self.writes = 0
+        self.skipped = 0
+        self.jitter = array("d")
+        self.elapsed = 0.0
+
+    def summary(self) -> dict[str, float]:
+        """Tick counts and the mean, p99 and max jitter in seconds."""
+        jitter = sorted(self.jitter)
+        summary: dict[str, float] = {
+            "ticks": self.ticks,
+            "writes": self.writes,
+            "skipped": self.skipped,
+            "elapsed": self.elapsed,
+        }
+        if jitter:
+            summary["jitter_mean"] = math.fsum(jitter) / len(jitter)
+            summary["jitter_p99"] = jitter[int((len(jitter) - 1) * 0.99)]
+            summary["jitter_max"] = jitter[-1]
+        return summary
+
+
+async def play_profile(
+    send_frame: Callable[[bytes], Awaitable[None]],
+    profile: MotionProfile,
+    port_id: int = MOTOR_PORT,
+    last_byte: Optional[int] = None,
+) -> ProfileResult:
+    """Write ``profile`` to the motor on ``port_id``, one speed per tick.
+
+    Deadlines are ``start + n * tick`` on the event loop clock, so time spent
+    writing or waking up late is absorbed by the next sleep instead of
+    accumulating.
+
+    Args:
+        send_frame: Writes a frame to the hub, e.g. ``TrainController.send_frame``
+        profile: Speeds to play
+        port_id: Motor port
+        last_byte: Speed byte the motor already runs at; matching ticks are
+            not written
+
+    Returns:
+        Tick, write and jitter statistics
+    """
+    loop = asyncio.get_running_loop()
+    table = frame_table(port_id, MOTOR_MODE)
+    speed_bytes = profile.speed_bytes
+    tick = profile.tick
+    ticks = len(speed_bytes)
+    result = ProfileResult()
+    start = loop.time()
+    index = 0
+    while index < ticks:
+        deadline = start + index * tick
+        now = loop.time()
+        if now < deadline:
+            await asyncio.sleep(deadline - now)
+            now = loop.time()
+        elif now - deadline >= tick:
+            # Too late for this tick; skip to the one due now
+            behind = min(int((now - start) / tick), ticks - 1)
+            if behind > index:
+                result.skipped += behind - index
+                index = behind
+                deadline = start + index * tick
+        result.jitter.append(now - deadline)
+        result.ticks += 1
+        speed = speed_bytes[index]
+        if speed != last_byte:
+            await send_frame(table[speed])
+            result.writes += 1
+            last_byte = speed
+        index += 1
+    result.elapsed = loop.time() - start
+    return result
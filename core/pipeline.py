@@ -0,0 +1,238 @@
+"""Pipelined output commands that complete on the hub's feedback.
+
+The hub acknowledges each ``port_output_command`` that asks for feedback with
+a ``port_output_command_feedback`` for its port, and rejects bad ones with a
+``generic_error_message``. ``CommandPipeline`` writes commands without
+waiting for a round trip and hands back a future per command, resolved with
+the completion latency when the feedback arrives::
+
+    pipeline = controller.start_pipeline(window=4)
+    done = await controller.set_motor_speed("motor", 50)
+    latency = await done  # seconds from write to completion
+
+The hub executes the commands of each port in order, so feedback completes
+the oldest command in flight on its port. Errors carry no port: a
+``BUFFER_OVERFLOW`` rejects the newest command written, any other error the
+oldest still in flight. Commands never acknowledged fail with
+``asyncio.TimeoutError`` after ``timeout`` seconds. Feedback carries no
+sequence number, so after a lost feedback each later one completes the
+command before its own, and latencies read high until one times out.
+
+At most ``window`` commands per port are in flight; further submissions wait
+for a slot. In fast mode commands are written with feedback suppressed and
+their futures resolve as soon as the write returns.
+"""
+
+import asyncio
+import collections
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from core.frames import STARTUP_AND_COMPLETION, STARTUP_NO_FEEDBACK
+from core.metrics import Metrics
+from protocols.ble_duplo_train import ErrorCode
+from protocols.duplo_train_decoder import (
+    ERROR_CODE_NAMES,
+    PORT_OUTPUT_COMMAND,
+    GenericErrorMessage,
+    PortOutputCommandFeedback,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bits of ``port_output_command_feedback``
+FEEDBACK_IN_PROGRESS = 0x01
+FEEDBACK_COMPLETED = 0x02
+FEEDBACK_DISCARDED = 0x04
+FEEDBACK_IDLE = 0x08
+FEEDBACK_BUSY = 0x10
+
+BUFFER_OVERFLOW = ErrorCode.encmapping["BUFFER_OVERFLOW"]
+
+
+class CommandError(Exception):
+    """The hub rejected or discarded a command."""
+
+    def __init__(self, message: str, error_code: Optional[int] = None):
+        super().__init__(message)
+        self.error_code = error_code
+
+
+def _retrieve(future: "asyncio.Future[float]") -> None:
+    if not future.cancelled():
+        future.exception()
+
+
+class _InFlight:
+    __slots__ = ("sequence", "port_id", "future", "sent", "timer")
+
+    def __init__(
+        self, sequence: int, port_id: int, future: "asyncio.Future[float]", sent: int
+    ):
+        self.sequence = sequence
+        self.port_id = port_id
+        self.future = future
+        self.sent = sent
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class CommandPipeline:
+    """Tracks in-flight output commands and completes them from hub replies.
+
+    Args:
+        write: Writes a frame to the hub
+        window: Commands in flight per port before ``submit`` waits
+        timeout: Seconds to wait for feedback before failing a command
+        fast: Suppress feedback and complete commands once written
+        metrics: Records completion latencies in the ``completion`` stage
+    """
+
+    def __init__(
+        self,
+        write: Callable[[bytes], Awaitable[None]],
+        window: int = 4,
+        timeout: Optional[float] = 2.0,
+        fast: bool = False,
+        metrics: Optional[Metrics] = None,
+    ):
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self.write = write
+        self.window = window
+        self.timeout = timeout
+        self.fast = fast
+        self.metrics = metrics
+        self.flags = STARTUP_NO_FEEDBACK if fast else STARTUP_AND_COMPLETION
+        self.sent = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self._sequence = 0
+        self._in_flight: dict[int, collections.deque[_InFlight]] = {}
+        self._waiters: dict[int, collections.deque[asyncio.Future[None]]] = {}
+
+    def in_flight(self, port_id: Optional[int] = None) -> int:
+        """Commands awaiting feedback on ``port_id``, or on all ports."""
+        if port_id is not None:
+            return len(self._in_flight.get(port_id, ()))
+        return sum(len(queue) for queue in self._in_flight.values())
+
+    async def submit(self, port_id: int, frame: bytes) -> "asyncio.Future[float]":
+        """Write ``frame`` once the port has a free slot.
+
+        Returns:
+            Future resolved with the completion latency in seconds, or failed
+            with ``CommandError`` or ``asyncio.TimeoutError``
+        """
+        loop = asyncio.get_running_loop()
+        queue = self._in_flight.setdefault(port_id, collections.deque())
+        while len(queue) >= self.window:
+            waiter = loop.create_future()
+            self._waiters.setdefault(port_id, collections.deque()).append(waiter)
+            await waiter
+
+        future: asyncio.Future[float] = loop.create_future()
+        # Callers may ignore the future; failures are counted, not warned about
+        future.add_done_callback(_retrieve)
+        if self.fast:
+            start = time.perf_counter_ns()
+            await self.write(frame)
+            self.sent += 1
+            self._complete(future, time.perf_counter_ns() - start)
+            return future
+
+        self._sequence += 1
+        command = _InFlight(self._sequence, port_id, future, time.perf_counter_ns())
+        queue.append(command)
+        try:
+            await self.write(frame)
+        except BaseException:
+            self._remove(command)
+            raise
+        self.sent += 1
+        if self.timeout is not None and not future.done():
+            command.timer = loop.call_later(self.timeout, self._expire, command)
+        return future
+
+    def feedback(self, message: PortOutputCommandFeedback) -> None:
+        """Complete or discard the oldest command in flight on the port."""
+        queue = self._in_flight.get(message.port_id)
+        if not queue:
+            return
+        flags = message.port_feedback_message
+        if flags & FEEDBACK_DISCARDED:
+            command = queue[0]
+            self._remove(command)
+            self._fail(command, CommandError("Command discarded by the hub"))
+        if flags & FEEDBACK_COMPLETED and queue:
+            command = queue[0]
+            self._remove(command)
+            self._complete(command.future, time.perf_counter_ns() - command.sent)
+
+    def error(self, message: GenericErrorMessage) -> None:
+        """Fail the command a ``generic_error_message`` refers to."""
+        if message.command_type != PORT_OUTPUT_COMMAND:
+            return
+        heads = [queue for queue in self._in_flight.values() if queue]
+        if not heads:
+            return
+        if message.error_code == BUFFER_OVERFLOW:
+            command = max((queue[-1] for queue in heads), key=lambda c: c.sequence)
+        else:
+            command = min((queue[0] for queue in heads), key=lambda c: c.sequence)
+        self._remove(command)
+        name = ERROR_CODE_NAMES.get(message.error_code, hex(message.error_code))
+        self._fail(
+            command, CommandError(f"Hub rejected command: {name}", message.error_code)
+        )
+
+    async def drain(self) -> None:
+        """Wait until every command in flight has completed or failed."""
+        futures = [
+            command.future for queue in self._in_flight.values() for command in queue
+        ]
+        if futures:
+            await asyncio.wait(futures)
+
+    def close(self) -> None:
+        """Cancel every command still in flight."""
+        for queue in list(self._in_flight.values()):
+            for command in list(queue):
+                self._remove(command)
+                command.future.cancel()
+
+    def _complete(self, future: "asyncio.Future[float]", nanoseconds: int) -> None:
+        self.completed += 1
+        if self.metrics is not None:
+            self.metrics.record("completion", nanoseconds)
+        if not future.done():
+            future.set_result(nanoseconds / 1e9)
+
+    def _fail(self, command: _InFlight, exc: BaseException) -> None:
+        self.failed += 1
+        if not command.future.done():
+            command.future.set_exception(exc)
+
+    def _expire(self, command: _InFlight) -> None:
+        self.timed_out += 1
+        self._remove(command)
+        logger.debug("No feedback for command on port %d", command.port_id)
+        self._fail(command, asyncio.TimeoutError("No feedback from the hub"))
+
+    def _remove(self, command: _InFlight) -> None:
+        queue = self._in_flight.get(command.port_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(command)
+        except ValueError:
+            return
+        if command.timer is not None:
+            command.timer.cancel()
+        waiters = self._waiters.get(command.port_id)
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
@@ -0,0 +1,227 @@
+"""Live registry of the IO devices attached to a train hub.
+
+The hub announces every attached device with a ``hub_attached_io`` message
+when notifications are enabled, and again whenever one is plugged in or
+removed. ``PortRegistry`` keeps that layout so callers can address devices by
+role (``"motor"``, ``"speaker"``, ...) instead of hard-coded port numbers, and
+caches the latest ``port_value_single`` reading of each port so sensor values
+can be read without a round trip.
+
+Until the hub has announced its layout, roles resolve to the default ports of
+a DUPLO train base and port numbers are passed through unchecked. Afterwards,
+commands to a port that is not attached fail locally with
+``PortNotAttachedError`` instead of costing a radio write and an error
+notification.
+"""
+
+import time
+from typing import Callable, Optional, Union
+
+from core.frames import LIGHT_PORT, MOTOR_PORT, SPEAKER_PORT
+from protocols.ble_duplo_train import io_type
+from protocols.duplo_train_decoder import (
+    DETACHED_IO,
+    IO_TYPE_NAMES,
+    HubAttachedIo,
+    PortValueSingle,
+)
+
+COLOR_SENSOR_PORT = 18
+SPEEDOMETER_PORT = 19
+VOLTAGE_PORT = 20
+
+# Role -> IO type of the device playing it
+ROLES: dict[str, int] = {
+    "motor": io_type.encmapping["duplo_train_motor"],
+    "speaker": io_type.encmapping["duplo_train_speaker"],
+    "light": io_type.encmapping["rgb_light"],
+    "color": io_type.encmapping["duplo_train_color"],
+    "speedometer": io_type.encmapping["duplo_train_speedometer"],
+    "voltage": io_type.encmapping["voltage"],
+}
+
+# Port -> IO type of a DUPLO train base
+DEFAULT_LAYOUT: dict[int, int] = {
+    MOTOR_PORT: ROLES["motor"],
+    SPEAKER_PORT: ROLES["speaker"],
+    LIGHT_PORT: ROLES["light"],
+    COLOR_SENSOR_PORT: ROLES["color"],
+    SPEEDOMETER_PORT: ROLES["speedometer"],
+    VOLTAGE_PORT: ROLES["voltage"],
+}
+
+Port = Union[int, str]
+
+
+class PortNotAttachedError(LookupError):
+    """Raised for a port or role with no device attached to the hub."""
+
+
+class PortInfo:
+    """An attached device and its latest reported value."""
+
+    __slots__ = (
+        "port_id",
+        "io_type",
+        "hardware_revision",
+        "software_revision",
+        "value",
+        "updated",
+    )
+
+    def __init__(
+        self,
+        port_id: int,
+        io_type: int,
+        hardware_revision: Optional[int] = None,
+        software_revision: Optional[int] = None,
+    ):
+        self.port_id = port_id
+        self.io_type = io_type
+        self.hardware_revision = hardware_revision
+        self.software_revision = software_revision
+        self.value: Optional[bytes] = None
+        self.updated: Optional[float] = None
+
+    @property
+    def io_name(self) -> str:
+        return IO_TYPE_NAMES.get(self.io_type, f"unknown_{self.io_type:#x}")
+
+    def __repr__(self) -> str:
+        return f"PortInfo(port_id={self.port_id}, io_type={self.io_name})"
+
+
+class PortRegistry:
+    """Port layout of one hub, kept current from its notifications.
+
+    Args:
+        clock: Time source for ``PortInfo.updated``
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.ports: dict[int, PortInfo] = {}
+        # True once the hub itself has reported attached IO
+        self.announced = False
+        self._by_io: dict[int, int] = {}
+
+    def __contains__(self, port_id: object) -> bool:
+        return port_id in self.ports
+
+    def __len__(self) -> int:
+        return len(self.ports)
+
+    def seed(self, attached_io: dict[int, int]) -> None:
+        """Assume a previously seen layout until the hub announces its own."""
+        if self.announced:
+            return
+        self.ports.clear()
+        for port_id, attached in attached_io.items():
+            self.ports[port_id] = PortInfo(port_id, attached)
+        self._reindex()
+
+    def update(self, message: object) -> None:
+        """Apply a decoded hub notification; other message types are ignored."""
+        if type(message) is HubAttachedIo:
+            self.attached(message)
+        elif type(message) is PortValueSingle:
+            self.value_changed(message)
+
+    def attached(self, message: HubAttachedIo) -> None:
+        """Record an attach or detach event."""
+        if not self.announced:
+            # Forget any seeded layout, the hub is about to list everything
+            self.announced = True
+            self.ports.clear()
+        port_id = message.port_id
+        if message.event == DETACHED_IO or message.io_type is None:
+            self.ports.pop(port_id, None)
+        else:
+            self.ports[port_id] = PortInfo(
+                port_id,
+                message.io_type,
+                message.hardware_revision,
+                message.software_revision,
+            )
+        self._reindex()
+
+    def value_changed(self, message: PortValueSingle) -> None:
+        """Cache the value reported for an attached port."""
+        info = self.ports.get(message.port_id)
+        if info is not None:
+            info.value = message.value
+            info.updated = self.clock()
+
+    def _reindex(self) -> None:
+        by_io: dict[int, int] = {}
+        for port_id in sorted(self.ports):
+            by_io.setdefault(self.ports[port_id].io_type, port_id)
+        self._by_io = by_io
+
+    def resolve(self, port: Port) -> int:
+        """Port number for a port number or role name.
+
+        Raises:
+            PortNotAttachedError: If the hub has reported its layout and
+                nothing is attached at ``port``
+            ValueError: If ``port`` is an unknown role name
+        """
+        if type(port) is int:
+            if self.announced and port not in self.ports:
+                raise PortNotAttachedError(f"No device attached to port {port}")
+            return port
+        return self.port_for(port)  # type: ignore[arg-type]
+
+    def port_for(self, role: Union[str, int]) -> int:
+        """Lowest port with a device of ``role`` (a role name or IO type).
+
+        Raises:
+            PortNotAttachedError: If no such device is attached
+            ValueError: If ``role`` is an unknown role name
+        """
+        if isinstance(role, str):
+            attached = ROLES.get(role)
+            if attached is None:
+                raise ValueError(
+                    f"Unknown role {role!r}, expected one of {', '.join(ROLES)}"
+                )
+        else:
+            attached = role
+        port_id = self._by_io.get(attached)
+        if port_id is not None:
+            return port_id
+        if not self.announced and not self.ports:
+            # Nothing reported or seeded yet; assume a standard train base
+            for port_id, default in DEFAULT_LAYOUT.items():
+                if default == attached:
+                    return port_id
+        raise PortNotAttachedError(f"No {role} attached to the hub")
+
+    def info(self, port: Port) -> PortInfo:
+        """The attached device at a port or role.
+
+        Raises:
+            PortNotAttachedError: If nothing is attached there
+        """
+        port_id = self.resolve(port)
+        info = self.ports.get(port_id)
+        if info is None:
+            raise PortNotAttachedError(f"No device attached to port {port_id}")
+        return info
+
+    def value(self, port: Port) -> Optional[bytes]:
+        """Latest value reported for a port or role, or None if none yet.
+
+        Raises:
+            PortNotAttachedError: If the hub reported nothing attached there
+        """
+        info = self.ports.get(self.resolve(port))
+        if info is not None:
+            return info.value
+        if self.announced:
+            raise PortNotAttachedError(f"No device attached to port {port}")
+        return None
+
+    def attached_io(self) -> dict[int, int]:
+        """Port -> IO type of every attached device, as the discovery cache stores."""
+        return {port_id: info.io_type for port_id, info in self.ports.items()}
@@ -0,0 +1,275 @@
+"""Declarative toothbrush-to-train rules, compiled into a transition table.
+
+A rule names a toothbrush state field, the transition it reacts to and the
+train command to send::
+
+    {"on": "state", "from": "*", "to": "running",
+     "action": "set_motor_speed", "value": 50}
+    {"on": "pressure.mode_button_pressed", "edge": "rising",
+     "action": "play_sound", "value": 9}
+
+``"*"`` matches any value, and ``"edge"`` is shorthand for a boolean
+``false -> true`` (rising) or ``true -> false`` (falling) transition. Rules are
+compiled once into a table keyed by ``(field, old, new)`` whose entries hold
+ready-made command frames, so evaluating an event costs a few dictionary
+lookups per watched field however many rules there are.
+"""
+
+import json
+import operator
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, Union
+
+from core.frames import (
+    LIGHT_PORT,
+    MOTOR_PORT,
+    SPEAKER_PORT,
+    light_color_frame,
+    motor_speed_frame,
+    sound_frame,
+)
+from core.metrics import Metrics
+from core.ports import Port, PortRegistry
+from protocols.ble_toothbrush import PressureFlags, ToothbrushState
+
+ANY = "*"
+
+# Command name -> (frame builder, default port)
+ACTIONS: dict[str, tuple[Callable[[int, int], bytes], int]] = {
+    "set_motor_speed": (motor_speed_frame, MOTOR_PORT),
+    "play_sound": (sound_frame, SPEAKER_PORT),
+    "set_light_color": (light_color_frame, LIGHT_PORT),
+}
+
+# Command name -> role of the device it drives, for rules without a "port"
+_ROLES = {
+    "set_motor_speed": "motor",
+    "play_sound": "speaker",
+    "set_light_color": "light",
+}
+
+# The boolean fields, the only ones an "edge" can watch
+FLAGS = frozenset(
+    f"pressure.{name}"
+    for name, value in vars(PressureFlags).items()
+    if isinstance(value, property)
+)
+
+FIELDS = (
+    frozenset(name for name in ToothbrushState.__slots__ if name != "pressure") | FLAGS
+)
+
+_EDGES = {"rising": (False, True), "falling": (True, False)}
+
+
+class Action:
+    """A compiled rule action: one command frame for the train.
+
+    ``frame`` is built for the port ``port`` has on a standard train base;
+    ``frame_for`` rebuilds it when the hub reports a different layout.
+
+    Raises:
+        ValueError: If the command, port or value is invalid
+    """
+
+    __slots__ = ("command", "port", "port_id", "value", "frame", "message", "order")
+
+    def __init__(
+        self,
+        command: str,
+        port: Port,
+        value: int,
+        message: Optional[str] = None,
+        order: int = 0,
+    ):
+        try:
+            builder, _ = ACTIONS[command]
+        except KeyError:
+            raise ValueError(f"Unknown action {command!r}") from None
+        if command == "set_motor_speed" and not (-100 <= value <= 100 or value == 127):
+            raise ValueError(f"Speed {value} out of range -100-100 (127 brakes)")
+        self.command = command
+        self.port = port
+        # Without a reported layout, roles resolve to the standard ports
+        self.port_id = PortRegistry().resolve(port)
+        self.value = value
+        self.frame = builder(self.port_id, value)
+        self.message = message
+        self.order = order
+
+    def frame_for(self, ports: PortRegistry) -> bytes:
+        """The frame for this action on a hub with the layout in ``ports``.
+
+        Raises:
+            PortNotAttachedError: If the hub reported nothing attached at ``port``
+        """
+        port_id = ports.resolve(self.port)
+        if port_id == self.port_id:
+            return self.frame
+        builder, _ = ACTIONS[self.command]
+        return builder(port_id, self.value)
+
+    def __repr__(self) -> str:
+        return f"Action({self.command!r}, port_id={self.port_id}, value={self.value})"
+
+
+class RuleEngine:
+    """Evaluate toothbrush state changes against a compiled transition table.
+
+    Args:
+        rules: Rule dictionaries as described in the module docstring
+
+    Raises:
+        ValueError: If a rule names an unknown field or action, or is malformed
+    """
+
+    def __init__(self, rules: Iterable[dict[str, Any]]):
+        self.table: dict[tuple[str, Any, Any], tuple[Action, ...]] = {}
+        getters: dict[str, Callable[[Any], Any]] = {}
+        for order, rule in enumerate(rules):
+            field, old, new, action = _compile_rule(rule, order)
+            getters.setdefault(field, operator.attrgetter(field))
+            key = (field, old, new)
+            self.table[key] = self.table.get(key, ()) + (action,)
+        self._getters = tuple(getters.items())
+
+    def __len__(self) -> int:
+        return sum(len(actions) for actions in self.table.values())
+
+    def evaluate(
+        self, previous: Optional[ToothbrushState], current: ToothbrushState
+    ) -> list[Action]:
+        """Return the actions triggered by the change from ``previous``, in rule order.
+
+        Nothing fires for the first state seen from a toothbrush.
+        """
+        if previous is None:
+            return []
+        table = self.table
+        actions: list[Action] = []
+        for field, get in self._getters:
+            old = get(previous)
+            new = get(current)
+            if old == new:
+                continue
+            for key in (
+                (field, old, new),
+                (field, ANY, new),
+                (field, old, ANY),
+                (field, ANY, ANY),
+            ):
+                matched = table.get(key)
+                if matched:
+                    actions.extend(matched)
+        if len(actions) > 1:
+            actions.sort(key=operator.attrgetter("order"))
+        return actions
+
+    def reaction(
+        self, verbose: bool = True, metrics: Optional[Metrics] = None
+    ) -> Callable[..., Any]:
+        """Build a ``ToothbrushRouter`` reaction sending the triggered frames.
+
+        Args:
+            verbose: Print each rule's message when it fires
+            metrics: Records rule evaluation time as the ``rules`` stage
+        """
+
+        async def react(
+            previous: Optional[ToothbrushState], current: ToothbrushState, train: Any
+        ) -> None:
+            if metrics is None:
+                actions = self.evaluate(previous, current)
+            else:
+                start = time.perf_counter_ns()
+                actions = self.evaluate(previous, current)
+                metrics.record("rules", time.perf_counter_ns() - start)
+            # Check ports against the layout the hub reported, as its commands do
+            ports = getattr(train, "ports", None)
+            for action in actions:
+                if verbose and action.message:
+                    print(action.message)
+                if isinstance(ports, PortRegistry):
+                    await train.send_frame(action.frame_for(ports))
+                else:
+                    await train.send_frame(action.frame)
+
+        return react
+
+
+def _compile_rule(rule: dict[str, Any], order: int) -> tuple[str, Any, Any, Action]:
+    try:
+        field = rule["on"]
+        command = rule["action"]
+        value = int(rule["value"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Malformed rule {rule!r}: {e}") from None
+    if field not in FIELDS:
+        raise ValueError(f"Unknown field {field!r} in rule {rule!r}")
+    if "edge" in rule:
+        if "from" in rule or "to" in rule:
+            raise ValueError(f"Rule {rule!r} gives both an edge and from/to")
+        if field not in FLAGS:
+            raise ValueError(f"Edge on non-boolean field {field!r} in rule {rule!r}")
+        try:
+            old, new = _EDGES[rule["edge"]]
+        except KeyError:
+            raise ValueError(
+                f"Unknown edge {rule['edge']!r} in rule {rule!r}"
+            ) from None
+    else:
+        old = rule.get("from", ANY)
+        new = rule.get("to", ANY)
+    if command not in ACTIONS:
+        raise ValueError(f"Unknown action {command!r} in rule {rule!r}")
+    port = rule.get("port", _ROLES[command])
+    try:
+        if not isinstance(port, str):
+            port = int(port)
+        action = Action(command, port, value, rule.get("message"), order)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid rule {rule!r}: {e}") from None
+    return field, old, new, action
+
+
+def default_rules(speed: int = 50, sound_id: int = 9) -> list[dict[str, Any]]:
+    """Brushing drives the train and the mode button sounds the horn."""
+    return [
+        {
+            "on": "state",
+            "to": "running",
+            "action": "set_motor_speed",
+            "value": speed,
+            "message": "Started brushing - starting train",
+        },
+        {
+            "on": "state",
+            "from": "running",
+            "to": "idle",
+            "action": "set_motor_speed",
+            "value": 0,
+            "message": "Stopped brushing - stopping train",
+        },
+        {
+            "on": "pressure.mode_button_pressed",
+            "edge": "rising",
+            "action": "play_sound",
+            "value": sound_id,
+            "message": "Mode button pressed - playing horn sound",
+        },
+    ]
+
+
+def load_rules(path: Union[str, Path]) -> list[dict[str, Any]]:
+    """Read rules from a JSON file holding a list or ``{"rules": [...]}``.
+
+    Raises:
+        ValueError: If the file is not valid JSON or holds no rule list
+    """
+    data = json.loads(Path(path).read_text())
+    if isinstance(data, dict):
+        data = data.get("rules")
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: expected a list of rules")
+    return data
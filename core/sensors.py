@@ -0,0 +1,285 @@
+"""Async streams of sensor readings from the train hub.
+
+A sensor stream subscribes to a port with ``port_input_format_setup_single``
+and yields each ``port_value_single`` the hub reports, decoded into a number::
+
+    async with controller.stream("speedometer", resolution=5) as speed:
+        async for reading in speed:
+            print(reading.value, speed.buffer.stats(window=1.0))
+
+Readings are also kept in a preallocated ring buffer for windowed statistics.
+
+The hub only reports a value once it has moved by ``delta_interval`` since
+the last report, so the stream asks for the consumer's ``resolution``. When
+the consumer falls behind and readings are dropped, the stream doubles the
+delta interval to thin out notifications, and it steps back towards the
+requested resolution once the consumer keeps up again.
+"""
+
+import asyncio
+import collections
+import logging
+import math
+import struct
+import time
+from array import array
+from typing import TYPE_CHECKING, Callable, Optional
+
+from core.ports import ROLES
+
+if TYPE_CHECKING:
+    from core.train_controller import TrainController
+
+logger = logging.getLogger(__name__)
+
+# (IO type, mode) -> layout of the value in port_value_single
+VALUE_FORMATS: dict[tuple[int, int], struct.Struct] = {
+    (ROLES["speedometer"], 0): struct.Struct("<h"),  # SPEED
+    (ROLES["speedometer"], 1): struct.Struct("<i"),  # COUNT
+    (ROLES["color"], 0): struct.Struct("<b"),  # COLOR, -1 when nothing is seen
+    (ROLES["color"], 1): struct.Struct("<b"),  # C TAG
+    (ROLES["color"], 2): struct.Struct("<b"),  # REFLT
+    (ROLES["voltage"], 0): struct.Struct("<h"),  # VLT L
+}
+
+# Upper bound for the adapted delta interval, in sensor units
+MAX_DELTA_INTERVAL = 1 << 12
+
+
+def decode_value(io: Optional[int], mode: int, value: bytes) -> int:
+    """Decode a ``port_value_single`` payload for a device type and mode.
+
+    Unknown layouts are read as a little-endian signed integer.
+    """
+    layout = VALUE_FORMATS.get((io, mode))  # type: ignore[arg-type]
+    if layout is not None and len(value) >= layout.size:
+        return layout.unpack_from(value)[0]
+    return int.from_bytes(value, "little", signed=True)
+
+
+class SensorReading:
+    """One decoded sensor value and when it arrived."""
+
+    __slots__ = ("port_id", "value", "timestamp")
+
+    def __init__(self, port_id: int, value: int, timestamp: float):
+        self.port_id = port_id
+        self.value = value
+        self.timestamp = timestamp
+
+    def __repr__(self) -> str:
+        return (
+            f"SensorReading(port_id={self.port_id}, value={self.value}, "
+            f"timestamp={self.timestamp:.3f})"
+        )
+
+
+class RingBuffer:
+    """Fixed-capacity history of timestamped values in preallocated arrays."""
+
+    __slots__ = ("capacity", "times", "values", "count", "_next")
+
+    def __init__(self, capacity: int = 1024):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.count = 0
+        self._next = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, timestamp: float, value: float) -> None:
+        index = self._next
+        self.times[index] = timestamp
+        self.values[index] = value
+        index += 1
+        self._next = 0 if index == self.capacity else index
+        if self.count < self.capacity:
+            self.count += 1
+
+    def latest(self) -> Optional[tuple[float, float]]:
+        """The newest ``(timestamp, value)``, or None when empty."""
+        if self.count == 0:
+            return None
+        index = self._next - 1
+        return self.times[index], self.values[index]
+
+    def window(
+        self, seconds: Optional[float] = None, now: Optional[float] = None
+    ) -> list[float]:
+        """Values from the last ``seconds`` (default: all), oldest first.
+
+        The window ends at ``now``, or at the newest reading if not given.
+        """
+        return self.window_items(seconds, now)[1]
+
+    def window_items(
+        self, seconds: Optional[float] = None, now: Optional[float] = None
+    ) -> tuple[list[float], list[float]]:
+        """Timestamps and values from the last ``seconds``, oldest first."""
+        times: list[float] = []
+        values: list[float] = []
+        index = self._next
+        cutoff = None
+        if seconds is not None:
+            latest = self.latest()
+            if latest is None:
+                return times, values
+            cutoff = (latest[0] if now is None else now) - seconds
+        for _ in range(self.count):
+            index = index - 1 if index else self.capacity - 1
+            if cutoff is not None and self.times[index] < cutoff:
+                break
+            times.append(self.times[index])
+            values.append(self.values[index])
+        times.reverse()
+        values.reverse()
+        return times, values
+
+    def stats(
+        self, window: Optional[float] = None, now: Optional[float] = None
+    ) -> Optional[dict[str, float]]:
+        """Count, mean, standard deviation, min and max, or None if empty."""
+        values = self.window(window, now)
+        if not values:
+            return None
+        count = len(values)
+        mean = math.fsum(values) / count
+        variance = math.fsum((v - mean) ** 2 for v in values) / count
+        return {
+            "count": count,
+            "mean": mean,
+            "stdev": math.sqrt(variance),
+            "min": min(values),
+            "max": max(values),
+        }
+
+
+class SensorStream:
+    """Subscription to one sensor port, iterated with ``async for``.
+
+    Create streams with ``TrainController.stream``.
+
+    Args:
+        controller: Controller connected to the hub
+        port_id: Port of the sensor
+        mode: Sensor mode to subscribe to
+        io: IO type of the sensor, used to decode its values
+        resolution: Smallest value change the consumer cares about
+        max_delta_interval: Upper bound when adapting the delta interval
+        capacity: Readings kept in ``buffer``
+        queue_size: Readings waiting for the consumer before the oldest is dropped
+        adapt_after: Seconds between delta interval changes
+        clock: Time source for reading timestamps
+    """
+
+    def __init__(
+        self,
+        controller: "TrainController",
+        port_id: int,
+        mode: int = 0,
+        io: Optional[int] = None,
+        resolution: int = 1,
+        max_delta_interval: int = MAX_DELTA_INTERVAL,
+        capacity: int = 1024,
+        queue_size: int = 64,
+        adapt_after: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.controller = controller
+        self.port_id = port_id
+        self.mode = mode
+        self.io = io
+        self.resolution = max(1, resolution)
+        self.max_delta_interval = max(self.resolution, max_delta_interval)
+        self.delta_interval = self.resolution
+        self.buffer = RingBuffer(capacity)
+        self.adapt_after = adapt_after
+        self.clock = clock
+        self.received = 0
+        self.dropped = 0
+        self._queue: collections.deque[SensorReading] = collections.deque(
+            maxlen=queue_size
+        )
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._overflowed = False
+        self._last_adapted = clock()
+
+    async def start(self) -> "SensorStream":
+        """Subscribe to the sensor at the requested resolution."""
+        self.controller.add_stream(self)
+        await self._subscribe(self.delta_interval)
+        return self
+
+    async def close(self) -> None:
+        """Stop iterating; unsubscribe if no other stream reads the port."""
+        if self._closed:
+            return
+        self._closed = True
+        self._ready.set()
+        if not self.controller.remove_stream(self):
+            await self.controller.setup_port_input_format(
+                self.port_id, self.mode, notification_enabled=False
+            )
+
+    async def __aenter__(self) -> "SensorStream":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+    def push(self, value: bytes) -> None:
+        """Take a raw value reported by the hub."""
+        timestamp = self.clock()
+        decoded = decode_value(self.io, self.mode, value)
+        self.buffer.append(timestamp, decoded)
+        self.received += 1
+        queue = self._queue
+        if len(queue) == queue.maxlen:
+            self.dropped += 1
+            self._overflowed = True
+        queue.append(SensorReading(self.port_id, decoded, timestamp))
+        self._ready.set()
+
+    def __aiter__(self) -> "SensorStream":
+        return self
+
+    async def __anext__(self) -> SensorReading:
+        while not self._queue:
+            if self._closed:
+                raise StopAsyncIteration
+            await self._adapt(caught_up=True)
+            self._ready.clear()
+            await self._ready.wait()
+        if self._overflowed:
+            await self._adapt(caught_up=False)
+        return self._queue.popleft()
+
+    async def _adapt(self, caught_up: bool) -> None:
+        now = self.clock()
+        if now - self._last_adapted < self.adapt_after:
+            return
+        if caught_up:
+            delta = max(self.resolution, self.delta_interval // 2)
+        else:
+            self._overflowed = False
+            delta = min(self.max_delta_interval, self.delta_interval * 2)
+        if delta != self.delta_interval:
+            logger.debug(
+                "Port %d delta interval %d -> %d",
+                self.port_id,
+                self.delta_interval,
+                delta,
+            )
+            self._last_adapted = now
+            await self._subscribe(delta)
+
+    async def _subscribe(self, delta_interval: int) -> None:
+        self.delta_interval = delta_interval
+        await self.controller.setup_port_input_format(
+            self.port_id, self.mode, delta_interval=delta_interval
+        )
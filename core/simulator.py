@@ -0,0 +1,334 @@
+"""An in-process DUPLO train hub that stands in for ``BleakClient``.
+
+``SimulatedHub`` accepts the same calls the controller makes on a real client
+(``connect``, ``start_notify``, ``write_gatt_char``, ...) and answers like a
+train base: it announces its attached IO when notifications are enabled,
+executes output commands, acknowledges them with
+``port_output_command_feedback``, reports sensor values with
+``port_value_single`` and rejects bad requests with ``generic_error_message``.
+
+Frames are handled once per simulated connection interval, so round trips
+take one to two intervals like on real hardware. Jitter, packet loss and the
+size of the hub's receive buffer are configurable; a write arriving while the
+buffer is full is dropped and answered with a ``BUFFER_OVERFLOW`` error.
+
+Use it anywhere a client factory is accepted::
+
+    factory = functools.partial(SimulatedHub, interval=0.015, loss=0.01)
+    client = await connect_train(stack, "Train Base", client_factory=factory, ...)
+"""
+
+import asyncio
+import collections
+import logging
+import random
+import struct
+from typing import Any, Callable, Optional
+
+from core.frames import WRITE_DIRECT_MODE_DATA
+from core.ports import DEFAULT_LAYOUT, ROLES, SPEEDOMETER_PORT
+from protocols.ble_duplo_train import ErrorCode
+from protocols.duplo_train_decoder import (
+    GENERIC_ERROR_MESSAGE,
+    HUB_ATTACHED_IO,
+    PORT_INPUT_FORMAT_SETUP_SINGLE,
+    PORT_INPUT_FORMAT_SINGLE,
+    PORT_OUTPUT_COMMAND,
+    PORT_OUTPUT_COMMAND_FEEDBACK,
+    PORT_VALUE_SINGLE,
+    PortInformationRequest,
+    PortInputFormat,
+    PortOutputCommand,
+    decode_message,
+)
+
+logger = logging.getLogger(__name__)
+
+MOTOR_IO = ROLES["motor"]
+SPEAKER_IO = ROLES["speaker"]
+
+# Port -> IO type of a DUPLO train base
+DEFAULT_PORTS: dict[int, int] = DEFAULT_LAYOUT
+
+ATTACHED_IO = 0x01
+
+# Port output command feedback: buffer empty, command completed, port idle
+FEEDBACK_COMPLETED = 0x0A
+
+BUFFER_OVERFLOW = ErrorCode.encmapping["BUFFER_OVERFLOW"]
+COMMAND_NOT_RECOGNIZED = ErrorCode.encmapping["COMMAND_NOT_RECOGNIZED"]
+INVALID_USE = ErrorCode.encmapping["INVALID_USE"]
+
+_attached_io = struct.Struct("<BBBBBHBB")
+_five_bytes = struct.Struct("<BBBBB")
+_input_format_single = struct.Struct("<BBBBBIB")
+
+
+def hub_attached_io_message(port_id: int, io: int) -> bytes:
+    return _attached_io.pack(9, 0, HUB_ATTACHED_IO, port_id, ATTACHED_IO, io, 1, 1)
+
+
+def generic_error_message(command_type: int, error_code: int) -> bytes:
+    return _five_bytes.pack(5, 0, GENERIC_ERROR_MESSAGE, command_type, error_code)
+
+
+def port_output_command_feedback_message(port_id: int, feedback: int) -> bytes:
+    return _five_bytes.pack(5, 0, PORT_OUTPUT_COMMAND_FEEDBACK, port_id, feedback)
+
+
+def port_value_single_message(port_id: int, value: bytes) -> bytes:
+    return bytes((4 + len(value), 0, PORT_VALUE_SINGLE, port_id)) + value
+
+
+def port_input_format_single_message(
+    port_id: int, mode: int, delta_interval: int, enabled: bool
+) -> bytes:
+    return _input_format_single.pack(
+        10, 0, PORT_INPUT_FORMAT_SINGLE, port_id, mode, delta_interval, int(enabled)
+    )
+
+
+class SimulatedHub:
+    """A simulated train base implementing the ``BleakClient`` surface we use.
+
+    Args:
+        address_or_device: Address string or anything with an ``address``
+        disconnected_callback: Called with the hub when the link drops
+        interval: Connection interval in seconds
+        jitter: Maximum random deviation added to each interval, in seconds
+        loss: Probability that a packet in either direction is lost
+        buffer_size: Frames the hub can hold before overflowing
+        frames_per_interval: Frames the hub executes per connection event
+        ports: Port to IO type map of the attached devices
+        seed: Seed for the loss and jitter random generator
+    """
+
+    def __init__(
+        self,
+        address_or_device: Any = "00:16:53:00:00:01",
+        disconnected_callback: Optional[Callable[["SimulatedHub"], None]] = None,
+        interval: float = 0.015,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        buffer_size: int = 16,
+        frames_per_interval: int = 4,
+        ports: Optional[dict[int, int]] = None,
+        seed: Optional[int] = None,
+    ):
+        self.address = (
+            address_or_device
+            if isinstance(address_or_device, str)
+            else address_or_device.address
+        )
+        self.disconnected_callback = disconnected_callback
+        self.interval = interval
+        self.jitter = jitter
+        self.loss = loss
+        self.buffer_size = buffer_size
+        self.frames_per_interval = frames_per_interval
+        self.ports = dict(DEFAULT_PORTS if ports is None else ports)
+        self.random = random.Random(seed)
+
+        # What the hub is doing, for assertions in tests
+        self.motor_speeds: dict[int, int] = {}
+        self.sounds: list[int] = []
+        self.light_colors: dict[int, int] = {}
+        self.subscriptions: dict[int, PortInputFormat] = {}
+        self.port_values: dict[int, bytes] = {}
+        # Last value reported to subscribers, per port
+        self._reported: dict[int, int] = {}
+
+        # Counters
+        self.received = 0
+        self.executed = 0
+        self.lost = 0
+        self.overflows = 0
+        self.notifications = 0
+
+        self._callback: Optional[Callable[[Any, bytearray], Any]] = None
+        self._inbox: collections.deque[bytes] = collections.deque()
+        self._outbox: collections.deque[bytes] = collections.deque()
+        self._task: Optional[asyncio.Task[None]] = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self._task is not None
+
+    async def connect(self, **kwargs: Any) -> bool:
+        if self._task is None:
+            await asyncio.sleep(self.interval)
+            self._task = asyncio.create_task(self._run())
+        return True
+
+    async def disconnect(self) -> bool:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        return True
+
+    def drop_connection(self) -> None:
+        """Simulate the hub going out of range."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            if self.disconnected_callback is not None:
+                self.disconnected_callback(self)
+
+    async def __aenter__(self) -> "SimulatedHub":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.disconnect()
+
+    async def start_notify(
+        self, char_specifier: Any, callback: Callable[[Any, bytearray], Any]
+    ) -> None:
+        """Enable notifications; the hub then announces its attached IO."""
+        self._require_connection()
+        self._callback = callback
+        for port_id, attached in self.ports.items():
+            self._notify(hub_attached_io_message(port_id, attached))
+
+    async def stop_notify(self, char_specifier: Any) -> None:
+        self._callback = None
+
+    async def write_gatt_char(
+        self, char_specifier: Any, data: Any, response: bool = False
+    ) -> None:
+        """Queue a frame for the hub; with ``response`` wait for the next interval."""
+        self._require_connection()
+        self.received += 1
+        if self.random.random() < self.loss:
+            self.lost += 1
+        elif len(self._inbox) >= self.buffer_size:
+            self.overflows += 1
+            logger.debug("Simulated hub %s dropped a frame: buffer full", self.address)
+            message_type = data[2] if len(data) > 2 else 0
+            self._notify(generic_error_message(message_type, BUFFER_OVERFLOW))
+        else:
+            self._inbox.append(bytes(data))
+        if response:
+            await asyncio.sleep(self.interval)
+
+    def set_port_value(self, port_id: int, value: bytes) -> None:
+        """Change a sensor reading, notifying subscribers.
+
+        Like a real hub, a subscriber is only notified once the value has moved
+        by the subscription's delta interval since the last report.
+        """
+        self.port_values[port_id] = value
+        subscription = self.subscriptions.get(port_id)
+        if subscription is None or not subscription.notification_enabled:
+            return
+        reading = int.from_bytes(value, "little", signed=True)
+        reported = self._reported.get(port_id)
+        if reported is None or abs(reading - reported) >= max(
+            1, subscription.delta_interval
+        ):
+            self._report(port_id, value)
+
+    def _report(self, port_id: int, value: bytes) -> None:
+        self._reported[port_id] = int.from_bytes(value, "little", signed=True)
+        self._notify(port_value_single_message(port_id, value))
+
+    def _require_connection(self) -> None:
+        if self._task is None:
+            raise ConnectionError(f"Simulated hub {self.address} is not connected")
+
+    def _notify(self, message: bytes) -> None:
+        self._outbox.append(message)
+
+    def _next_interval(self) -> float:
+        if not self.jitter:
+            return self.interval
+        return max(0.0, self.interval + self.random.uniform(-self.jitter, self.jitter))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._next_interval())
+            self._deliver()
+            for _ in range(min(self.frames_per_interval, len(self._inbox))):
+                self._execute(self._inbox.popleft())
+
+    def _deliver(self) -> None:
+        outbox = self._outbox
+        while outbox:
+            message = outbox.popleft()
+            if self._callback is None:
+                continue
+            if self.random.random() < self.loss:
+                self.lost += 1
+                continue
+            self.notifications += 1
+            self._callback(None, bytearray(message))
+
+    def _execute(self, frame: bytes) -> None:
+        message_type = frame[2] if len(frame) > 2 else 0
+        try:
+            message = decode_message(frame)
+        except (struct.error, IndexError):
+            self._notify(generic_error_message(message_type, INVALID_USE))
+            return
+        self.executed += 1
+        if type(message) is PortOutputCommand:
+            self._output_command(message)
+        elif type(message) is PortInputFormat and (
+            message.message_type == PORT_INPUT_FORMAT_SETUP_SINGLE
+        ):
+            self._input_format_setup(message)
+        elif type(message) is PortInformationRequest:
+            value = self.port_values.get(message.port_id, b"\x00")
+            self._notify(port_value_single_message(message.port_id, value))
+        else:
+            # Unknown message types, or ones only a hub sends
+            error = COMMAND_NOT_RECOGNIZED if message is None else INVALID_USE
+            self._notify(generic_error_message(message_type, error))
+
+    def _output_command(self, command: PortOutputCommand) -> None:
+        port_id = command.port_id
+        attached = self.ports.get(port_id)
+        if attached is None or len(command.payload) < 2:
+            self._notify(generic_error_message(PORT_OUTPUT_COMMAND, INVALID_USE))
+            return
+        if command.sub_command != WRITE_DIRECT_MODE_DATA:
+            self._notify(
+                generic_error_message(PORT_OUTPUT_COMMAND, COMMAND_NOT_RECOGNIZED)
+            )
+            return
+        value = command.payload[1]
+        if attached == MOTOR_IO:
+            speed = value - 256 if value > 127 else value
+            self.motor_speeds[port_id] = speed
+            if SPEEDOMETER_PORT in self.ports:
+                self.set_port_value(SPEEDOMETER_PORT, struct.pack("<h", speed))
+        elif attached == SPEAKER_IO:
+            self.sounds.append(value)
+        else:
+            self.light_colors[port_id] = value
+        if command.completion & 0x01:
+            self._notify(
+                port_output_command_feedback_message(port_id, FEEDBACK_COMPLETED)
+            )
+
+    def _input_format_setup(self, setup: PortInputFormat) -> None:
+        if setup.port_id not in self.ports:
+            self._notify(
+                generic_error_message(PORT_INPUT_FORMAT_SETUP_SINGLE, INVALID_USE)
+            )
+            return
+        self.subscriptions[setup.port_id] = setup
+        self._notify(
+            port_input_format_single_message(
+                setup.port_id,
+                setup.mode,
+                setup.delta_interval,
+                setup.notification_enabled,
+            )
+        )
+        if setup.notification_enabled:
+            self._report(setup.port_id, self.port_values.get(setup.port_id, b"\x00"))
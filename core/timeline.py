@@ -0,0 +1,273 @@
+"""Timelines of train commands at absolute offsets, compiled to raw frames.
+
+A timeline lists what the train should do and when, in seconds from the
+start, across the motor, speaker and light::
+
+    {"events": [
+        {"at": 0.0, "action": "play_sound", "value": 5},
+        {"at": 1.0, "action": "set_light_color", "value": 3},
+        {"at": 2.0, "action": "s_curve", "from": 0, "to": 50, "duration": 2.0},
+        {"at": 10.0, "action": "set_motor_speed", "value": 0}
+    ]}
+
+or the same in Python with ``Timeline().sound(0.0, 5).light(1.0, 3)...``.
+
+``Timeline.compile`` turns every event into its command frame up front (ramps
+become one motor frame per tick) and keeps them on a heap ordered by offset.
+``run_timeline`` fires each frame at ``start + offset`` on the event loop
+clock, so a slow write delays only its own event instead of everything after
+it, and reports how late each event went out.
+"""
+
+import asyncio
+import heapq
+import json
+import math
+from array import array
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterable, Optional, Union
+
+from core import motion
+from core.frames import (
+    LIGHT_PORT,
+    MOTOR_MODE,
+    MOTOR_PORT,
+    SPEAKER_PORT,
+    frame_table,
+)
+from core.ports import PortRegistry
+from core.rules import ACTIONS
+from core.write_scheduler import DEFAULT_TICK
+
+# Actions that expand into a motion profile on the motor
+PROFILES: dict[str, Callable[..., motion.MotionProfile]] = {
+    "ramp": motion.ramp,
+    "s_curve": motion.s_curve,
+}
+
+# (offset, insertion order, frame, label); the order breaks ties between
+# events at the same offset so frames are never compared
+Event = tuple[float, int, bytes, str]
+
+
+class CompiledTimeline:
+    """Frames of a timeline on a heap, ready to run any number of times."""
+
+    __slots__ = ("heap", "duration")
+
+    def __init__(self, heap: list[Event]):
+        self.heap = heap
+        self.duration = max((event[0] for event in heap), default=0.0)
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def events(self) -> list[Event]:
+        """Every event in firing order."""
+        return sorted(self.heap)
+
+
+class Timeline:
+    """Builds a timeline of commands at offsets in seconds from its start.
+
+    Args:
+        tick: Interval between the motor frames of ramps
+
+    Raises:
+        ValueError: If ``tick`` is not a positive time
+    """
+
+    def __init__(self, tick: float = DEFAULT_TICK):
+        if not (tick > 0 and math.isfinite(tick)):
+            raise ValueError(f"Tick must be a positive time, got {tick!r}")
+        self.tick = tick
+        self._events: list[Event] = []
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def add_frame(self, at: float, frame: bytes, label: str = "frame") -> "Timeline":
+        """Send a prebuilt ``frame`` at ``at`` seconds."""
+        if not (at >= 0 and math.isfinite(at)):
+            raise ValueError(f"Event offset must be a non-negative time, got {at!r}")
+        self._events.append((float(at), len(self._events), frame, label))
+        return self
+
+    def command(
+        self, at: float, action: str, value: int, port_id: Optional[int] = None
+    ) -> "Timeline":
+        """Send one of the ``core.rules.ACTIONS`` commands at ``at`` seconds."""
+        try:
+            builder, default_port = ACTIONS[action]
+        except KeyError:
+            raise ValueError(f"Unknown action {action!r}") from None
+        port_id = default_port if port_id is None else port_id
+        return self.add_frame(at, builder(port_id, value), f"{action}({value})@{at:g}")
+
+    def motor(self, at: float, speed: int, port_id: int = MOTOR_PORT) -> "Timeline":
+        return self.command(at, "set_motor_speed", speed, port_id)
+
+    def sound(
+        self, at: float, sound_id: int, port_id: int = SPEAKER_PORT
+    ) -> "Timeline":
+        return self.command(at, "play_sound", sound_id, port_id)
+
+    def light(self, at: float, color_id: int, port_id: int = LIGHT_PORT) -> "Timeline":
+        return self.command(at, "set_light_color", color_id, port_id)
+
+    def profile(
+        self,
+        at: float,
+        profile: motion.MotionProfile,
+        port_id: int = MOTOR_PORT,
+        label: str = "profile",
+    ) -> "Timeline":
+        """Play a motion profile from ``at``, one frame per changed speed."""
+        table = frame_table(port_id, MOTOR_MODE)
+        last = None
+        for index, speed in enumerate(profile.speed_bytes):
+            if speed != last:
+                self.add_frame(at + index * profile.tick, table[speed], label)
+                last = speed
+        return self
+
+    def ramp(
+        self,
+        at: float,
+        start: int,
+        end: int,
+        duration: float,
+        smooth: bool = True,
+        port_id: int = MOTOR_PORT,
+    ) -> "Timeline":
+        """Change the motor speed from ``start`` to ``end`` over ``duration``."""
+        action = "s_curve" if smooth else "ramp"
+        profile = PROFILES[action](start, end, duration, self.tick)
+        return self.profile(at, profile, port_id, f"{action}({start}->{end})@{at:g}")
+
+    def add_event(self, event: dict[str, Any]) -> "Timeline":
+        """Add an event in the file format.
+
+        Raises:
+            ValueError: If the event is malformed or names an unknown action
+        """
+        try:
+            at = float(event["at"])
+            action = event["action"]
+            port = event.get("port")
+            if port is None:
+                port_id = None
+            elif isinstance(port, str):
+                # Frames are built ahead of time, for a standard train base
+                port_id = PortRegistry().resolve(port)
+            else:
+                port_id = int(port)
+            if action in PROFILES:
+                return self.ramp(
+                    at,
+                    int(event.get("from", 0)),
+                    int(event["to"]),
+                    float(event["duration"]),
+                    smooth=action == "s_curve",
+                    port_id=MOTOR_PORT if port_id is None else port_id,
+                )
+            return self.command(at, action, int(event["value"]), port_id)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Malformed timeline event {event!r}: {e}") from None
+
+    @classmethod
+    def from_events(
+        cls, events: Iterable[dict[str, Any]], tick: float = DEFAULT_TICK
+    ) -> "Timeline":
+        timeline = cls(tick)
+        for event in events:
+            timeline.add_event(event)
+        return timeline
+
+    def compile(self) -> CompiledTimeline:
+        """Freeze the events into a heap of frames ordered by offset."""
+        heap = list(self._events)
+        heapq.heapify(heap)
+        return CompiledTimeline(heap)
+
+
+def load_timeline(path: Union[str, Path]) -> Timeline:
+    """Read a timeline from a JSON list of events or ``{"events": [...]}``.
+
+    An object may also set ``"tick"``, the interval between ramp frames.
+
+    Raises:
+        ValueError: If the file is not valid JSON or holds a bad tick or event
+    """
+    data = json.loads(Path(path).read_text())
+    tick = DEFAULT_TICK
+    if isinstance(data, dict):
+        try:
+            tick = float(data.get("tick", tick))
+            Timeline(tick)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Malformed timeline {path}: {e}") from None
+        data = data.get("events")
+    if not isinstance(data, list):
+        raise ValueError(f"{path}: expected a list of timeline events")
+    return Timeline.from_events(data, tick)
+
+
+class TimelineResult:
+    """How late each event of a timeline run was sent, in firing order."""
+
+    __slots__ = ("labels", "lateness", "elapsed")
+
+    def __init__(self) -> None:
+        self.labels: list[str] = []
+        self.lateness = array("d")
+        self.elapsed = 0.0
+
+    def __len__(self) -> int:
+        return len(self.lateness)
+
+    def summary(self) -> dict[str, float]:
+        """Event count and the mean, p99 and max lateness in seconds."""
+        lateness = sorted(self.lateness)
+        summary: dict[str, float] = {"events": len(lateness), "elapsed": self.elapsed}
+        if lateness:
+            summary["lateness_mean"] = math.fsum(lateness) / len(lateness)
+            summary["lateness_p99"] = lateness[int((len(lateness) - 1) * 0.99)]
+            summary["lateness_max"] = lateness[-1]
+        return summary
+
+    def latest(self, count: int = 5) -> list[tuple[str, float]]:
+        """The ``count`` latest events and their lateness, worst first."""
+        ranked = sorted(zip(self.labels, self.lateness), key=lambda e: -e[1])
+        return ranked[:count]
+
+
+async def run_timeline(
+    send_frame: Callable[[bytes], Awaitable[None]],
+    timeline: CompiledTimeline,
+) -> TimelineResult:
+    """Send every frame of ``timeline`` at its offset from now.
+
+    Args:
+        send_frame: Writes a frame to the hub, e.g. ``TrainController.send_frame``
+        timeline: Compiled timeline; it is not consumed and can be run again
+
+    Returns:
+        Lateness of each event
+    """
+    loop = asyncio.get_running_loop()
+    heap = list(timeline.heap)  # a copy of a heap is still a heap
+    result = TimelineResult()
+    start = loop.time()
+    while heap:
+        offset, _, frame, label = heapq.heappop(heap)
+        deadline = start + offset
+        now = loop.time()
+        if now < deadline:
+            await asyncio.sleep(deadline - now)
+            now = loop.time()
+        await send_frame(frame)
+        result.labels.append(label)
+        result.lateness.append(now - deadline)
+    result.elapsed = loop.time() - start
+    return result
@@ -0,0 +1,213 @@
+"""Per-toothbrush state tracking and routing of brush events to trains."""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from core.metrics import Metrics
+from protocols.ble_toothbrush import ToothbrushDecoder, ToothbrushState
+
+logger = logging.getLogger(__name__)
+
+# Called with (previous state, new state, train controller) on every change
+Reaction = Callable[[Optional[ToothbrushState], ToothbrushState, Any], Awaitable[None]]
+
+
+class _TrackedDevice:
+    __slots__ = ("decoder", "last_seen")
+
+    def __init__(self, decoder: ToothbrushDecoder, last_seen: float):
+        self.decoder = decoder
+        self.last_seen = last_seen
+
+
+class ToothbrushTracker:
+    """Keep decoding and edge-detection state separately for every toothbrush.
+
+    Devices not heard from for ``stale_after`` seconds are evicted, as is the
+    least recently seen device once more than ``max_devices`` are tracked.
+    """
+
+    def __init__(
+        self,
+        stale_after: float = 60.0,
+        max_devices: int = 64,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.stale_after = stale_after
+        self.max_devices = max_devices
+        self.clock = clock
+        self.evicted = 0
+        self._devices: dict[str, _TrackedDevice] = {}
+        self._next_sweep = clock() + stale_after
+
+    def __contains__(self, address: str) -> bool:
+        return address in self._devices
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def update(
+        self, address: str, data: bytes
+    ) -> Optional[tuple[Optional[ToothbrushState], ToothbrushState]]:
+        """Feed an advertisement payload from ``address``.
+
+        Returns:
+            ``(previous, current)`` when this brush's state changed, else None
+
+        Raises:
+            struct.error: If the payload is too short to decode
+        """
+        now = self.clock()
+        if now >= self._next_sweep:
+            self.evict_stale(now)
+        device = self._devices.get(address)
+        if device is None:
+            device = _TrackedDevice(ToothbrushDecoder(cache_size=8), now)
+            self._devices[address] = device
+            if len(self._devices) > self.max_devices:
+                oldest = min(self._devices, key=lambda a: self._devices[a].last_seen)
+                del self._devices[oldest]
+                self.evicted += 1
+        device.last_seen = now
+        previous = device.decoder.last_state
+        current = device.decoder.update(data)
+        if current is None:
+            return None
+        return previous, current
+
+    def evict_stale(self, now: Optional[float] = None) -> list[str]:
+        """Forget devices not seen for ``stale_after`` seconds."""
+        if now is None:
+            now = self.clock()
+        stale = [
+            address
+            for address, device in self._devices.items()
+            if now - device.last_seen > self.stale_after
+        ]
+        for address in stale:
+            del self._devices[address]
+        self.evicted += len(stale)
+        self._next_sweep = now + self.stale_after
+        return stale
+
+
+class ToothbrushRouter:
+    """Route state changes of each toothbrush to the train it controls.
+
+    Every train gets its own queue and worker task, so a slow write to one
+    hub never delays reactions for brushes routed to another.
+
+    Args:
+        routes: Maps toothbrush addresses to train controllers
+        reaction: Coroutine run on the train for each state change
+        default: Train for brushes without a route; None ignores them
+        tracker: Per-device state table (a fresh one by default)
+        queue_size: Pending reactions kept per train; the oldest is dropped
+            when a train falls further behind
+        metrics: Records the ``receive``, ``decode``, ``queue`` and
+            ``end_to_end`` stages when set
+        on_change: Called with ``(address, previous, current)`` on every
+            state change, e.g. ``EventBus.toothbrush_changed``
+    """
+
+    def __init__(
+        self,
+        routes: dict[str, Any],
+        reaction: Reaction,
+        default: Any = None,
+        tracker: Optional[ToothbrushTracker] = None,
+        queue_size: int = 16,
+        metrics: Optional[Metrics] = None,
+        on_change: Optional[Callable[[str, Any, Any], None]] = None,
+    ):
+        self.routes = {address.upper(): train for address, train in routes.items()}
+        self.reaction = reaction
+        self.default = default
+        self.tracker = tracker if tracker is not None else ToothbrushTracker()
+        self.queue_size = queue_size
+        self.metrics = metrics
+        self.on_change = on_change
+        self.dispatched = 0
+        self.dropped = 0
+        self.errors = 0
+        self._queues: dict[int, asyncio.Queue[tuple[Any, Any, int]]] = {}
+        self._workers: list[asyncio.Task[None]] = []
+
+    def _queue_for(self, train: Any) -> asyncio.Queue[tuple[Any, Any, int]]:
+        queue = self._queues.get(id(train))
+        if queue is None:
+            queue = self._queues[id(train)] = asyncio.Queue(self.queue_size)
+            self._workers.append(asyncio.create_task(self._work(train, queue)))
+        return queue
+
+    async def _work(
+        self, train: Any, queue: asyncio.Queue[tuple[Any, Any, int]]
+    ) -> None:
+        while True:
+            previous, current, received = await queue.get()
+            metrics = self.metrics
+            if metrics is not None:
+                metrics.record("queue", time.perf_counter_ns() - received)
+            try:
+                await self.reaction(previous, current, train)
+            except Exception:
+                self.errors += 1
+                logger.exception("Toothbrush reaction failed")
+            else:
+                if metrics is not None:
+                    metrics.record("end_to_end", time.perf_counter_ns() - received)
+            finally:
+                queue.task_done()
+
+    def handle_advertisement(
+        self, address: str, data: bytes, received: Optional[int] = None
+    ) -> bool:
+        """Track a payload and queue a reaction if the brush's state changed.
+
+        Args:
+            address: Toothbrush address
+            data: Manufacturer data of the advertisement
+            received: ``time.perf_counter_ns()`` when the scan saw the
+                advertisement, the start of the ``end_to_end`` stage
+
+        Returns:
+            True if a reaction was queued
+        """
+        metrics = self.metrics
+        start = time.perf_counter_ns() if metrics is not None else 0
+        if received is None:
+            received = start
+        train = self.routes.get(address.upper(), self.default)
+        if train is None:
+            return False
+        change = self.tracker.update(address, data)
+        if metrics is not None:
+            now = time.perf_counter_ns()
+            metrics.record("receive", start - received)
+            metrics.record("decode", now - start)
+        if change is None:
+            return False
+        if self.on_change is not None:
+            self.on_change(address, *change)
+        queue = self._queue_for(train)
+        if queue.full():
+            queue.get_nowait()
+            queue.task_done()
+            self.dropped += 1
+        queue.put_nowait((*change, received))
+        self.dispatched += 1
+        return True
+
+    async def join(self) -> None:
+        """Wait until every queued reaction has run."""
+        await asyncio.gather(*(queue.join() for queue in self._queues.values()))
+
+    async def stop(self) -> None:
+        """Cancel the per-train workers."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
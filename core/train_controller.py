@@ -1,23 +1,64 @@
 """Utilities for controlling DUPLO trains via BLE."""
 
-from typing import Optional
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Optional,
+    Sequence,
+    Union,
+)
+from uuid import UUID
+
 from bleak import BleakClient, BleakScanner
 from bleak.backends.device import BLEDevice
 from bleak.backends.characteristic import BleakGATTCharacteristic
+from bleak.backends.scanner import AdvertisementData
 
-from core.config import Config
-from protocols.ble_duplo_train import (
-    common_message_header,
-    message_type,
-    port_input_format_setup_single_format,
-    port_output_command,
-    port_output_command_feedback,
-    port_value_single,
-    hub_attached_io_message_format,
-    generic_error_message,
+from core.capture import CaptureWriter
+from core.config import get_config
+from core.discovery_cache import DiscoveryCache
+from core.metrics import Metrics
+from core.pipeline import CommandPipeline
+from core.ports import DEFAULT_LAYOUT, Port, PortRegistry
+from core.sensors import SensorStream
+from core.frames import (
+    STARTUP_AND_COMPLETION,
+    light_color_frame,
+    motor_speed_frame,
+    port_input_format_frame,
+    sound_frame,
+    speed_byte,
+)
+from core.write_scheduler import DEFAULT_TICK, WriteScheduler
+from protocols.duplo_train_decoder import (
+    GenericErrorMessage,
+    HubAttachedIo,
+    PortOutputCommandFeedback,
+    PortValueSingle,
+    Record,
+    decode_message,
 )
 
-config = Config()
+if TYPE_CHECKING:
+    from services.scanner import SharedScanner
+
+logger = logging.getLogger(__name__)
+
+# Looks a train up by name: a device from a scan, or a bare cached address
+FindTrain = Callable[..., Awaitable[Optional[Union[BLEDevice, str]]]]
+
+
+def __getattr__(name: str) -> Any:
+    # The shared settings used to be built at import time; build them on first use
+    if name == "config":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def convert_speed_to_val(speed: int) -> int:
@@ -30,152 +71,460 @@ def convert_speed_to_val(speed: int) -> int:
     Returns:
         Byte value for the speed command
     """
-    if speed == 127:
-        return 127
-    if speed > 100:
-        speed = 100
-    if speed < 0:
-        # Convert to 8-bit unsigned representation
-        speed = speed & 255
-    return speed
+    return speed_byte(speed)
+
+
+def decode_notification(data: bytearray) -> Optional[Record]:
+    """Decode a notification from the train hub.
+
+    Returns:
+        The decoded message, or None for message types we do not handle
+    """
+    payload = decode_message(data)
+    if payload is not None and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Hub notification: %r", payload)
+    return payload
 
 
 def notification_handler(sender: BleakGATTCharacteristic, data: bytearray) -> None:
     """Handle notifications from the train hub."""
-    payload = common_message_header.parse(data)
-    match payload.message_type:
-        case message_type.hub_attached_io:
-            payload = hub_attached_io_message_format.parse(data)
-            print("Hub attached IO")
-        case message_type.generic_error_message:
-            payload = generic_error_message.parse(data)
-            print("Error")
-        case message_type.port_value_single:
-            payload = port_value_single.parse(data)
-            print("Port value")
-        case message_type.port_input_format_single:
-            payload = port_input_format_setup_single_format.parse(data)
-            print("Port input format")
-        case message_type.port_output_command_feedback:
-            payload = port_output_command_feedback.parse(data)
-            print("Port output command feedback")
+    decode_notification(data)
 
 
 async def find_train(
-    name: str = "Train Base", timeout: float = 30.0
-) -> Optional[BLEDevice]:
-    """Find a DUPLO train by name."""
-    device = await BleakScanner().find_device_by_name(name, timeout=timeout)
+    name: str = "Train Base",
+    timeout: float = 30.0,
+    cache: Optional[DiscoveryCache] = None,
+    scanner: "Optional[SharedScanner]" = None,
+) -> Optional[Union[BLEDevice, str]]:
+    """Find a DUPLO train by name.
+
+    With a discovery cache, a fresh cached address is returned without
+    scanning (``BleakClient`` connects to it directly), and scan results are
+    recorded in the cache. With a shared ``scanner`` the train is looked for
+    in its scan instead of starting another one.
+    """
+    if cache is not None:
+        entry = cache.lookup(name)
+        if entry is not None:
+            return entry.address
+    if scanner is not None:
+        device = await scanner.find_device(name, timeout=timeout)
+    else:
+        device = await BleakScanner().find_device_by_name(name, timeout=timeout)
+    if device is not None and cache is not None:
+        cache.record(name, device.address)
     return device
 
 
+async def connect_train(
+    stack: AsyncExitStack,
+    name: str = "Train Base",
+    timeout: float = 30.0,
+    cache: Optional[DiscoveryCache] = None,
+    find: FindTrain = find_train,
+    client_factory: Callable[[Union[BLEDevice, str]], BleakClient] = BleakClient,
+) -> Optional[BleakClient]:
+    """Connect to a train, trying its cached address before scanning.
+
+    A failed direct connect invalidates the cache entry and falls back to a
+    scan. The client is disconnected when ``stack`` closes.
+
+    Args:
+        stack: Exit stack that owns the connection
+        name: Name of the train device
+        timeout: Timeout in seconds for device discovery
+        cache: Discovery cache to consult and update, if any
+        find: Scanner used on a cache miss
+        client_factory: Creates the client for a device or address
+
+    Returns:
+        The connected client, or None if the train was not found
+    """
+    entry = cache.lookup(name) if cache is not None else None
+    if cache is not None and entry is not None:
+        try:
+            return await stack.enter_async_context(client_factory(entry.address))
+        except Exception as e:
+            logger.info("Direct connect to %s failed (%s), scanning", entry.address, e)
+            cache.invalidate(name)
+
+    device = await find(name, timeout=timeout)
+    if device is None:
+        return None
+    client = await stack.enter_async_context(client_factory(device))
+    if cache is not None:
+        cache.record(name, device if isinstance(device, str) else device.address)
+    return client
+
+
+async def find_trains(
+    targets: Sequence[str],
+    timeout: float = 30.0,
+    scanner: "Optional[SharedScanner]" = None,
+) -> list[Optional[BLEDevice]]:
+    """Find several DUPLO trains, by name or address, in a single scan.
+
+    Each target claims a different device, so listing the same name twice
+    finds two trains that share it.
+
+    Args:
+        targets: Device names or addresses to look for
+        timeout: Maximum time in seconds to scan
+        scanner: Shared scan to look in instead of starting another one
+
+    Returns:
+        The device found for each target, in order, or None where not found
+    """
+    found: list[Optional[BLEDevice]] = [None] * len(targets)
+    claimed: set[str] = set()
+    remaining = len(targets)
+    all_found = asyncio.Event()
+
+    def callback(device: BLEDevice, adv_data: AdvertisementData) -> None:
+        nonlocal remaining
+        if device.address in claimed:
+            return
+        names = (device.address.upper(), device.name, adv_data.local_name)
+        for index, target in enumerate(targets):
+            if found[index] is None and (target in names or target.upper() in names):
+                found[index] = device
+                claimed.add(device.address)
+                remaining -= 1
+                if remaining == 0:
+                    all_found.set()
+                return
+
+    if not targets:
+        return found
+    if scanner is None:
+        async with BleakScanner(detection_callback=callback):
+            try:
+                await asyncio.wait_for(all_found.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return found
+
+    subscription = scanner.subscribe("find_trains")
+
+    async def consume() -> None:
+        async for device, adv_data, _ in subscription:
+            callback(device, adv_data)
+            if all_found.is_set():
+                return
+
+    async with scanner:
+        try:
+            await asyncio.wait_for(consume(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            scanner.unsubscribe(subscription)
+    return found
+
+
 class TrainController:
     """High-level controller for DUPLO train operations."""
 
     def __init__(self, client: BleakClient):
         self.client = client
-        self.config = config
+        self.config = get_config()
+        self.write_scheduler: Optional[WriteScheduler] = None
+        self.pipeline: Optional[CommandPipeline] = None
+        self.ports = PortRegistry()
+        self.streams: dict[int, list[SensorStream]] = {}
+        self.recorder: Optional[CaptureWriter] = None
+        self.metrics: Optional[Metrics] = None
+        # Called with every decoded hub message, e.g. by ``EventBus.attach``
+        self.on_message: Optional[Callable[[Record], None]] = None
+        # What frames are written to: the UUID, or the characteristic resolved
+        # from the client's services, which skips a lookup on every write
+        self.characteristic: Union[UUID, BleakGATTCharacteristic] = (
+            self.config.CHAR_UUID
+        )
+        self._record_source = ""
+
+    @property
+    def attached_io(self) -> dict[int, int]:
+        """Port -> IO type of the devices the hub reported as attached."""
+        return self.ports.attached_io()
+
+    def use_cached_layout(self, cache: DiscoveryCache, name: str) -> None:
+        """Assume the IO layout cached for ``name`` until the hub announces its own."""
+        layout = cache.layout(name, str(self.client.address))
+        if layout:
+            self.ports.seed(layout)
+
+    def start_recording(self, recorder: CaptureWriter) -> None:
+        """Log every notification and outgoing frame to ``recorder``."""
+        self._record_source = str(getattr(self.client, "address", ""))
+        self.recorder = recorder
+
+    def stop_recording(self) -> None:
+        self.recorder = None
+
+    def start_metrics(self, metrics: Metrics) -> None:
+        """Time every ``write_gatt_char`` into the ``write`` stage of ``metrics``."""
+        self.metrics = metrics
+
+    def stop_metrics(self) -> None:
+        self.metrics = None
+
+    def handle_notification(
+        self, sender: BleakGATTCharacteristic, data: bytearray
+    ) -> None:
+        """Notification callback for ``start_notify``; see ``process_notification``."""
+        if self.recorder is not None:
+            handle = getattr(sender, "handle", 0)
+            self.recorder.notification(
+                self._record_source, bytes(data), handle if type(handle) is int else 0
+            )
+        self.process_notification(data)
+
+    def process_notification(self, data: bytearray) -> Optional[Record]:
+        """Decode a hub notification and update the controller's view of the hub.
+
+        Returns:
+            The decoded message, or None for message types we do not handle
+        """
+        payload = decode_notification(data)
+        if type(payload) is PortValueSingle:
+            self.ports.value_changed(payload)
+            streams = self.streams.get(payload.port_id)
+            if streams:
+                for stream in streams:
+                    stream.push(payload.value)
+        elif type(payload) is PortOutputCommandFeedback:
+            if self.pipeline is not None:
+                self.pipeline.feedback(payload)
+        elif type(payload) is GenericErrorMessage:
+            if self.pipeline is not None:
+                self.pipeline.error(payload)
+        elif type(payload) is HubAttachedIo:
+            self.ports.attached(payload)
+        if self.on_message is not None and payload is not None:
+            self.on_message(payload)
+        return payload
+
+    def resolve_characteristic(self) -> bool:
+        """Write to the hub characteristic found in the client's services.
+
+        Returns:
+            Whether the characteristic was found; if not, the UUID is kept
+        """
+        services = getattr(self.client, "services", None)
+        if services is None:
+            return False
+        try:
+            characteristic = services.get_characteristic(self.config.CHAR_UUID)
+        except Exception as e:
+            logger.debug("Characteristic lookup failed: %s", e)
+            return False
+        if characteristic is None:
+            return False
+        self.characteristic = characteristic
+        return True
 
     async def setup_notifications(self) -> None:
         """Setup notification handling for train responses."""
-        await self.client.start_notify(self.config.CHAR_UUID, notification_handler)
-
-    async def setup_port_input_format(self, port_id: int, mode: int = 1) -> None:
-        """Setup input format for a specific port."""
-        payload = port_input_format_setup_single_format.build(
-            {
-                "header": {
-                    "length": 10,
-                    "hub_id": 0,
-                    "message_type": message_type.port_input_format_setup_single,
-                },
-                "port_id": port_id,
-                "mode": mode,
-                "delta_interval": 1,
-                "notification_enabled": 1,
-            }
+        await self.client.start_notify(self.characteristic, self.handle_notification)
+
+    async def send_frame(self, frame: bytes) -> None:
+        """Write a prebuilt command frame to the hub."""
+        if self.recorder is not None:
+            self.recorder.write(self._record_source, frame)
+        if self.metrics is None:
+            await self.client.write_gatt_char(
+                self.characteristic, frame, response=False
+            )
+            return
+        start = time.perf_counter_ns()
+        await self.client.write_gatt_char(self.characteristic, frame, response=False)
+        self.metrics.record("write", time.perf_counter_ns() - start)
+
+    async def _send(self, port_id: int, kind: str, frame: bytes) -> None:
+        if self.write_scheduler is not None:
+            # Every sound plays; other commands only need the newest value
+            self.write_scheduler.submit(
+                (port_id, kind), frame, coalesce=kind != "sound"
+            )
+        else:
+            await self.send_frame(frame)
+
+    async def _output(
+        self,
+        port_id: Port,
+        kind: str,
+        build: Callable[[int, int, int], bytes],
+        value: int,
+    ) -> "Optional[asyncio.Future[float]]":
+        port_id = self.ports.resolve(port_id)
+        pipeline = self.pipeline
+        if pipeline is not None:
+            return await pipeline.submit(port_id, build(port_id, value, pipeline.flags))
+        await self._send(port_id, kind, build(port_id, value, STARTUP_AND_COMPLETION))
+        return None
+
+    def start_pipeline(
+        self, window: int = 4, fast: bool = False, timeout: Optional[float] = 2.0
+    ) -> CommandPipeline:
+        """Return a completion future from every output command.
+
+        Args:
+            window: Commands in flight per port before further commands wait
+            fast: Suppress hub feedback; futures resolve once written
+            timeout: Seconds before an unacknowledged command fails
+
+        Returns:
+            The pipeline, whose counters report completed and failed commands
+        """
+        if self.write_scheduler is not None:
+            raise RuntimeError("Stop the write scheduler before starting a pipeline")
+        self.pipeline = CommandPipeline(
+            self.send_frame, window, timeout, fast, metrics=self.metrics
         )
-        await self.client.write_gatt_char(
-            self.config.CHAR_UUID, payload, response=False
+        return self.pipeline
+
+    async def stop_pipeline(self) -> None:
+        """Wait for commands in flight, then go back to fire-and-forget writes."""
+        if self.pipeline is not None:
+            # Keep routing feedback to the pipeline until it has drained
+            await self.pipeline.drain()
+            self.pipeline = None
+
+    def start_write_scheduler(self, tick: float = DEFAULT_TICK) -> WriteScheduler:
+        """Coalesce commands per (port, command kind), flushing once per tick.
+
+        Args:
+            tick: Flush interval in seconds, ideally the BLE connection interval
+
+        Returns:
+            The running scheduler, whose counters report coalesced writes
+        """
+        if self.pipeline is not None:
+            raise RuntimeError("Stop the pipeline before starting a write scheduler")
+        if self.write_scheduler is None:
+            self.write_scheduler = WriteScheduler(self.send_frame, tick)
+        self.write_scheduler.start()
+        return self.write_scheduler
+
+    async def stop_write_scheduler(self) -> None:
+        """Flush pending commands and go back to writing each command directly."""
+        if self.write_scheduler is not None:
+            scheduler, self.write_scheduler = self.write_scheduler, None
+            await scheduler.stop()
+
+    def read_value(self, port: Port) -> Optional[bytes]:
+        """Latest value the hub reported for a port or role, without a round trip.
+
+        Raises:
+            PortNotAttachedError: If nothing is attached there
+        """
+        return self.ports.value(port)
+
+    async def setup_port_input_format(
+        self,
+        port_id: Port,
+        mode: int = 1,
+        delta_interval: int = 1,
+        notification_enabled: bool = True,
+    ) -> None:
+        """Setup input format for a specific port or role.
+
+        Args:
+            port_id: Port ID or role of the sensor
+            mode: Sensor mode to report
+            delta_interval: Change in value needed before the hub reports again
+            notification_enabled: Whether the hub should report values at all
+        """
+        port_id = self.ports.resolve(port_id)
+        frame = port_input_format_frame(
+            port_id, mode, delta_interval, notification_enabled
         )
+        await self._send(port_id, "input_format", frame)
+
+    def stream(
+        self, port_id: Port, mode: int = 0, resolution: int = 1, **options: Any
+    ) -> SensorStream:
+        """Stream decoded readings of a sensor, subscribing on ``start``.
+
+        Args:
+            port_id: Port ID or role of the sensor, e.g. ``"speedometer"``
+            mode: Sensor mode to subscribe to
+            resolution: Smallest value change worth a notification
+            **options: Further ``SensorStream`` arguments
 
-    async def set_motor_speed(self, port_id: int, speed: int) -> None:
+        Returns:
+            The stream, to use with ``async with`` and ``async for``
+        """
+        port_id = self.ports.resolve(port_id)
+        info = self.ports.ports.get(port_id)
+        io = info.io_type if info is not None else DEFAULT_LAYOUT.get(port_id)
+        return SensorStream(self, port_id, mode, io, resolution, **options)
+
+    def add_stream(self, stream: SensorStream) -> None:
+        self.streams.setdefault(stream.port_id, []).append(stream)
+
+    def remove_stream(self, stream: SensorStream) -> bool:
+        """Stop feeding ``stream``; returns whether others still read its port."""
+        streams = self.streams.get(stream.port_id, [])
+        if stream in streams:
+            streams.remove(stream)
+        if streams:
+            return True
+        self.streams.pop(stream.port_id, None)
+        return False
+
+    async def set_motor_speed(
+        self, port_id: Port, speed: int
+    ) -> "Optional[asyncio.Future[float]]":
         """Set motor speed for a specific port.
 
         Args:
-            port_id: Motor port ID (typically 0 for main motor)
+            port_id: Motor port ID (typically 0 for main motor) or ``"motor"``
             speed: Speed from -100 to 100, or 127 for brake
+
+        Returns:
+            With a pipeline started, a future resolved with the completion
+            latency in seconds; otherwise None
+
+        Raises:
+            PortNotAttachedError: If the hub reported no device at the port
         """
-        payload = port_output_command.build(
-            {
-                "header": {
-                    "length": 8,
-                    "hub_id": 0,
-                    "message_type": message_type.port_output_command,
-                },
-                "port_id": port_id,
-                "startup_and_completion_information": {
-                    "startup": 1,
-                    "completion": 1,
-                },
-                "sub_command": 0x51,
-                "payload": bytes([0, convert_speed_to_val(speed)]),
-            }
-        )
-        await self.client.write_gatt_char(
-            self.config.CHAR_UUID, payload, response=False
-        )
+        return await self._output(port_id, "motor", motor_speed_frame, speed)
 
-    async def play_sound(self, port_id: int, sound_id: int) -> None:
+    async def play_sound(
+        self, port_id: Port, sound_id: int
+    ) -> "Optional[asyncio.Future[float]]":
         """Play a sound on the train speaker.
 
         Args:
-            port_id: Speaker port ID (typically 1)
+            port_id: Speaker port ID (typically 1) or ``"speaker"``
             sound_id: Sound ID to play
+
+        Returns:
+            With a pipeline started, a future resolved with the completion
+            latency in seconds; otherwise None
+
+        Raises:
+            PortNotAttachedError: If the hub reported no device at the port
         """
-        payload = port_output_command.build(
-            {
-                "header": {
-                    "length": 8,
-                    "hub_id": 0,
-                    "message_type": message_type.port_output_command,
-                },
-                "port_id": port_id,
-                "startup_and_completion_information": {
-                    "startup": 1,
-                    "completion": 1,
-                },
-                "sub_command": 0x51,
-                "payload": bytes([1, sound_id]),
-            }
-        )
-        await self.client.write_gatt_char(
-            self.config.CHAR_UUID, payload, response=False
-        )
+        return await self._output(port_id, "sound", sound_frame, sound_id)
 
-    async def set_light_color(self, port_id: int, color_id: int) -> None:
+    async def set_light_color(
+        self, port_id: Port, color_id: int
+    ) -> "Optional[asyncio.Future[float]]":
         """Set light color on the train.
 
         Args:
-            port_id: Light port ID (typically 17)
+            port_id: Light port ID (typically 17) or ``"light"``
             color_id: Color ID to set
+
+        Returns:
+            With a pipeline started, a future resolved with the completion
+            latency in seconds; otherwise None
+
+        Raises:
+            PortNotAttachedError: If the hub reported no device at the port
         """
-        payload = port_output_command.build(
-            {
-                "header": {
-                    "length": 8,
-                    "hub_id": 0,
-                    "message_type": message_type.port_output_command,
-                },
-                "port_id": port_id,
-                "startup_and_completion_information": {
-                    "startup": 1,
-                    "completion": 1,
-                },
-                "sub_command": 0x51,
-                "payload": bytes([0, color_id]),
-            }
-        )
-        await self.client.write_gatt_char(
-            self.config.CHAR_UUID, payload, response=False
-        )
+        return await self._output(port_id, "light", light_color_frame, color_id)
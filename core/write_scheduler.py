@@ -0,0 +1,107 @@
+"""Last-writer-wins write coalescing for train commands."""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# A typical LEGO hub connection interval; frames submitted within one tick coalesce
+DEFAULT_TICK = 0.015
+
+
+class WriteScheduler:
+    """Coalesce command frames into one pending slot per key.
+
+    Frames are submitted under a key such as ``(port_id, "motor")``. Only the
+    newest frame per key is kept; the scheduler writes all pending frames as
+    soon as it is idle, then waits one tick before the next flush, so bursts
+    within a connection interval collapse into a single write per key.
+    Frames submitted with ``coalesce=False`` are never replaced.
+    """
+
+    def __init__(
+        self, write: Callable[[bytes], Awaitable[None]], tick: float = DEFAULT_TICK
+    ):
+        self.write = write
+        self.tick = tick
+        self.submitted = 0
+        self.written = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._pending: dict[Hashable, bytes] = {}
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task[None]] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def submit(self, key: Hashable, frame: bytes, coalesce: bool = True) -> None:
+        """Queue ``frame`` under ``key``, replacing any frame still pending there.
+
+        With ``coalesce=False`` the frame gets a slot of its own, for commands
+        such as sounds where every one counts.
+        """
+        self.submitted += 1
+        if not coalesce:
+            key = (key, self.submitted)
+        elif key in self._pending:
+            self.coalesced += 1
+        self._pending[key] = frame
+        self._wakeup.set()
+
+    async def flush(self) -> None:
+        """Write all pending frames now, in the order their keys were first queued."""
+        pending, self._pending = self._pending, {}
+        self._wakeup.clear()
+        items = list(pending.items())
+        for index, (key, frame) in enumerate(items):
+            try:
+                await self.write(frame)
+            except asyncio.CancelledError:
+                # Keep the unwritten frames, unless newer ones replaced them
+                self._pending = {**dict(items[index:]), **self._pending}
+                self._wakeup.set()
+                raise
+            except Exception:
+                self.errors += 1
+                logger.exception("Failed to write coalesced frame")
+            else:
+                self.written += 1
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            await self._wakeup.wait()
+            await self.flush()
+            if not self._stopping:
+                await asyncio.sleep(self.tick)
+
+    def start(self) -> None:
+        """Start flushing in the background."""
+        if not self.running:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and write whatever is still pending.
+
+        A flush in progress finishes first; the task is never cancelled while
+        it holds frames that are not written yet.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            try:
+                await self._task
+            finally:
+                self._task = None
+        await self.flush()
+
+    async def __aenter__(self) -> "WriteScheduler":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.stop()
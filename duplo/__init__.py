@@ -2,50 +2,71 @@
 Duplo BLE Controller - Python library for controlling LEGO Duplo trains via Bluetooth.
 
 This package provides both a high-level Python API and command-line tools for controlling
-LEGO Duplo trains using Bluetooth Low Energy (BLE), with optional integration for 
+LEGO Duplo trains using Bluetooth Low Energy (BLE), with optional integration for
 Oral-B toothbrush events.
 
 Basic library usage:
     from duplo import train_connection
-    
+
     async with train_connection() as train:
         await train.set_motor_speed(0, 50)
         await train.play_sound(1, 5)
 
 Command-line tools:
     - duplo-demo: Basic train control demonstration
-    - duplo-toothbrush: Control train with toothbrush events  
+    - duplo-toothbrush: Control train with toothbrush events
     - duplo-listen-toothbrush: Monitor toothbrush events
     - duplo-listen-broadcast: Listen to BLE broadcasts
 """
 
-# Import the high-level API for easy library usage
-from duplo.api import (
-    train_connection,
-    simple_train_demo, 
-    TrainController,
-    EnhancedTrainController,
-    find_train
+from typing import TYPE_CHECKING
+
+from core.lazy import lazy_imports
+
+# The high-level API is imported on first access, so CLI startup and
+# `import duplo` do not load bleak, construct and pydantic up front
+__getattr__, _import_deferred = lazy_imports(
+    __name__,
+    {
+        "train_connection": "duplo.api:train_connection",
+        "simple_train_demo": "duplo.api:simple_train_demo",
+        "TrainController": "duplo.api:TrainController",
+        "EnhancedTrainController": "duplo.api:EnhancedTrainController",
+        "find_train": "duplo.api:find_train",
+        "Fleet": "duplo.fleet:Fleet",
+        "fleet_connection": "duplo.fleet:fleet_connection",
+        # Also make core components available
+        "CoreTrainController": "core.train_controller:TrainController",
+        "ToothbrushEvent": "protocols.ble_toothbrush:ToothbrushEvent",
+    },
 )
 
-# Also make core components available
-from core.train_controller import TrainController as CoreTrainController
-from protocols.ble_toothbrush import ToothbrushEvent
+if TYPE_CHECKING:
+    from duplo.api import (
+        train_connection,
+        simple_train_demo,
+        TrainController,
+        EnhancedTrainController,
+        find_train,
+    )
+    from duplo.fleet import Fleet, fleet_connection
+    from core.train_controller import TrainController as CoreTrainController
+    from protocols.ble_toothbrush import ToothbrushEvent
 
 __version__ = "0.1.0"
 
 __all__ = [
     # High-level API
-    'train_connection',
-    'simple_train_demo',
-    'TrainController', 
-    'EnhancedTrainController',
-    'find_train',
-    
+    "train_connection",
+    "simple_train_demo",
+    "TrainController",
+    "EnhancedTrainController",
+    "find_train",
+    "Fleet",
+    "fleet_connection",
     # Core components
-    'CoreTrainController',
-    'ToothbrushEvent',
-    
+    "CoreTrainController",
+    "ToothbrushEvent",
     # Version
-    '__version__'
-]
\ No newline at end of file
+    "__version__",
+]
@@ -1,40 +1,92 @@
 """High-level convenience API for DUPLO train control."""
 
 import asyncio
-from contextlib import asynccontextmanager
-from typing import AsyncGenerator, Any
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import TYPE_CHECKING, AsyncGenerator, Any, Callable, Optional
 
 from bleak import BleakClient
-from core.train_controller import find_train, TrainController as BaseTrainController
+from core import motion
+from core.discovery_cache import DiscoveryCache
+from core.ports import Port
+from core.train_controller import (
+    connect_train,
+    find_train,
+    TrainController as BaseTrainController,
+)
+from protocols.duplo_train_decoder import Record
+
+if TYPE_CHECKING:
+    from services.connection_pool import ConnectionPool
 
 
 @asynccontextmanager
 async def train_connection(
     device_name: str = "Train Base",
-    timeout: float = 30.0
-) -> AsyncGenerator['EnhancedTrainController', None]:
+    timeout: float = 30.0,
+    cache: Optional[DiscoveryCache] = None,
+    pool: Optional["ConnectionPool"] = None,
+) -> AsyncGenerator["EnhancedTrainController", None]:
     """Context manager for easy train connection and control.
-    
+
     Args:
         device_name: Name of the train device to connect to
         timeout: Timeout in seconds for device discovery
-        
+        cache: Discovery cache; a cached address is connected to directly,
+            scanning only on a miss or a failed connect
+        pool: Connection pool to lease the train from; the connection stays
+            open for the next block instead of disconnecting
+
     Yields:
         EnhancedTrainController: Ready-to-use train controller with convenience methods
-        
+
     Example:
         async with train_connection() as train:
             await train.set_motor_speed(0, 50)
             await train.play_sound(1, 5)
     """
-    device = await find_train(device_name, timeout=timeout)
-    if device is None:
-        raise ConnectionError(f"Train '{device_name}' not found within {timeout} seconds")
-    
-    async with BleakClient(device) as client:
+    if pool is not None:
+        connection = await pool.acquire(device_name, timeout=timeout, cache=cache)
+        try:
+            controller = connection.controller
+            if not isinstance(controller, EnhancedTrainController):
+                # Built once per connection, so e.g. its speed outlives the block
+                if connection.wrapper is None:
+                    connection.wrapper = EnhancedTrainController(
+                        controller.client, controller
+                    )
+                controller = connection.wrapper
+            yield controller
+        finally:
+            pool.release(connection)
+            if cache is not None and controller.attached_io:
+                cache.record(
+                    device_name, connection.address, dict(controller.attached_io)
+                )
+        return
+
+    async with AsyncExitStack() as stack:
+        client = await connect_train(
+            stack,
+            device_name,
+            timeout=timeout,
+            cache=cache,
+            find=find_train,
+            client_factory=BleakClient,
+        )
+        if client is None:
+            raise ConnectionError(
+                f"Train '{device_name}' not found within {timeout} seconds"
+            )
+
         controller = EnhancedTrainController(client)
+        if cache is not None:
+            controller.use_cached_layout(cache, device_name)
         await controller.setup_notifications()
-        yield controller
+        try:
+            yield controller
+        finally:
+            if cache is not None and controller.attached_io:
+                cache.record(device_name, client.address, dict(controller.attached_io))
 
 
 async def simple_train_demo(
@@ -42,88 +94,156 @@ async def simple_train_demo(
     speed: int = 50,
     sound_id: int = 5,
     color_id: int = 5,
-    run_time: float = 10.0
+    run_time: float = 10.0,
+    ramp: float = 0.0,
 ) -> None:
     """Run a simple train demonstration.
-    
+
     Args:
         device_name: Name of the train device
         speed: Motor speed (0-100)
         sound_id: Sound to play
         color_id: Light color
         run_time: How long to run the motor
+        ramp: Seconds to smoothly accelerate and brake, 0 to jump
     """
     async with train_connection(device_name) as train:
         # Setup ports
         await train.setup_port_input_format(port_id=1, mode=1)
         await asyncio.sleep(0.5)
-        
+
         # Play sound and set light
         await train.play_sound(port_id=1, sound_id=sound_id)
         await train.set_light_color(port_id=17, color_id=color_id)
         await asyncio.sleep(1)
-        
+
         # Run motor
-        await train.set_motor_speed(port_id=0, speed=speed)
+        if ramp > 0:
+            await train.ramp_to(speed, ramp)
+        else:
+            await train.set_motor_speed(port_id=0, speed=speed)
         await asyncio.sleep(run_time)
-        
+
         # Stop
-        await train.set_motor_speed(port_id=0, speed=0)
+        if ramp > 0:
+            await train.ramp_to(0, ramp)
+        else:
+            await train.set_motor_speed(port_id=0, speed=0)
 
 
 class EnhancedTrainController:
     """Enhanced TrainController with additional convenience methods."""
-    
-    def __init__(self, client: BleakClient):
-        self._controller = BaseTrainController(client)
-    
+
+    def __init__(
+        self, client: BleakClient, controller: Optional[BaseTrainController] = None
+    ):
+        self._controller = controller or BaseTrainController(client)
+        # Speed the motor was last set or driven to by a profile
+        self.speed = 0
+
     def __getattr__(self, name: str) -> Any:
         """Delegate to the base controller."""
         return getattr(self._controller, name)
-    
+
+    @property
+    def on_message(self) -> Optional[Callable[[Record], None]]:
+        """Hook called with every decoded hub message, set on the base controller."""
+        return self._controller.on_message
+
+    @on_message.setter
+    def on_message(self, hook: Optional[Callable[[Record], None]]) -> None:
+        self._controller.on_message = hook
+
     async def quick_setup(self) -> None:
         """Perform common setup tasks."""
         await self.setup_notifications()
-        await self.setup_port_input_format(port_id=1, mode=1)  # Speaker
+        await self.setup_port_input_format(port_id="speaker", mode=1)
         await asyncio.sleep(0.5)
-    
+
+    async def set_motor_speed(
+        self, port_id: Port, speed: int
+    ) -> "Optional[asyncio.Future[float]]":
+        """Set motor speed, remembering it as the start of the next ramp.
+
+        See ``TrainController.set_motor_speed``.
+        """
+        future = await self._controller.set_motor_speed(port_id, speed)
+        self.speed = 0 if speed == 127 else speed
+        return future
+
     async def stop_all(self) -> None:
         """Stop all motors."""
-        await self.set_motor_speed(port_id=0, speed=0)
-    
+        await self.set_motor_speed(port_id="motor", speed=0)
+
     async def emergency_stop(self) -> None:
         """Emergency brake (faster stop)."""
-        await self.set_motor_speed(port_id=0, speed=127)  # Brake
-    
+        await self.set_motor_speed(port_id="motor", speed=127)  # Brake
+
+    async def play_profile(
+        self, profile: motion.MotionProfile, port_id: Port = "motor"
+    ) -> motion.ProfileResult:
+        """Stream a precomputed motion profile to the motor at its tick rate.
+
+        Returns:
+            Tick, write and per-tick jitter statistics
+        """
+        port = self.ports.resolve(port_id)
+        result = await motion.play_profile(self.send_frame, profile, port)
+        if len(profile):
+            self.speed = profile.speeds[-1]
+        return result
+
+    async def ramp_to(
+        self, speed: int, duration: float, smooth: bool = True
+    ) -> motion.ProfileResult:
+        """Accelerate or brake from the current speed to ``speed``.
+
+        Args:
+            speed: Target speed from -100 to 100
+            duration: Seconds the change takes
+            smooth: Use an S-curve instead of a linear ramp
+        """
+        build = motion.s_curve if smooth else motion.ramp
+        return await self.play_profile(build(self.speed, speed, duration))
+
+    async def stop_at(self, at: float, braking: float = 1.0) -> motion.ProfileResult:
+        """Keep the current speed and come to rest ``at`` seconds from now.
+
+        Args:
+            at: Seconds until the train stands still
+            braking: Seconds of smooth braking at the end
+        """
+        return await self.play_profile(motion.stop_at_time(self.speed, at, braking))
+
     async def play_horn(self) -> None:
         """Play horn sound."""
-        await self.play_sound(port_id=1, sound_id=9)
-    
+        await self.play_sound(port_id="speaker", sound_id=9)
+
     async def play_station_sound(self) -> None:
         """Play station arrival sound."""
-        await self.play_sound(port_id=1, sound_id=5)
-    
+        await self.play_sound(port_id="speaker", sound_id=5)
+
     async def set_light_red(self) -> None:
         """Set lights to red."""
-        await self.set_light_color(port_id=17, color_id=5)
-    
+        await self.set_light_color(port_id="light", color_id=5)
+
     async def set_light_green(self) -> None:
-        """Set lights to green."""  
-        await self.set_light_color(port_id=17, color_id=7)
-    
+        """Set lights to green."""
+        await self.set_light_color(port_id="light", color_id=7)
+
     async def set_light_blue(self) -> None:
         """Set lights to blue."""
-        await self.set_light_color(port_id=17, color_id=3)
+        await self.set_light_color(port_id="light", color_id=3)
 
 
 # Export the original TrainController and the enhanced one
 TrainController = BaseTrainController
 
-# Make functions and classes available at module level  
+# Make functions and classes available at module level
 __all__ = [
-    'train_connection', 
-    'simple_train_demo', 
-    'TrainController', 
-    'EnhancedTrainController',
-    'find_train'
-]
\ No newline at end of file
+    "train_connection",
+    "simple_train_demo",
+    "TrainController",
+    "EnhancedTrainController",
+    "find_train",
+]
@@ -1,118 +1,278 @@
 #!/usr/bin/env python3
 """CLI command for listening to BLE broadcasts."""
 
+from __future__ import annotations
+
 import argparse
-import asyncio
 import sys
+import time
+from typing import Any, Optional, TextIO, TYPE_CHECKING
+
+from core.lazy import lazy_imports
+
+# BLE and protocol code is imported when the command runs, not to parse arguments
+__getattr__, _import_deferred = lazy_imports(
+    __name__,
+    {
+        "asyncio": "asyncio",
+        "BatchWriter": "core.broadcast:BatchWriter",
+        "BroadcastStats": "core.broadcast:BroadcastStats",
+        "DedupeTable": "core.broadcast:DedupeTable",
+        "format_jsonl": "core.broadcast:format_jsonl",
+        "format_text": "core.broadcast:format_text",
+        "CaptureWriter": "core.capture:CaptureWriter",
+        "SharedScanner": "services.scanner:SharedScanner",
+    },
+)
 
-from bleak import BleakScanner
+if TYPE_CHECKING:
+    import asyncio
+
+    from core.broadcast import (
+        BatchWriter,
+        BroadcastStats,
+        DedupeTable,
+        format_jsonl,
+        format_text,
+    )
+    from core.capture import CaptureWriter
+    from services.scanner import SharedScanner
 
 
 def create_parser() -> argparse.ArgumentParser:
     """Create argument parser for the broadcast listener command."""
     parser = argparse.ArgumentParser(
         description="Listen to BLE device advertisements and broadcasts",
-        prog="duplo-listen-broadcast"
+        prog="duplo-listen-broadcast",
     )
     parser.add_argument(
-        "--timeout", 
-        type=float, 
+        "--timeout",
+        type=float,
         default=60.0,
-        help="How long to scan in seconds (default: 60.0, 0 for infinite)"
+        help="How long to scan in seconds (default: 60.0, 0 for infinite)",
     )
     parser.add_argument(
-        "--filter",
-        help="Filter devices by name (case-insensitive substring match)"
+        "--filter", help="Filter devices by name (case-insensitive substring match)"
     )
     parser.add_argument(
-        "--verbose", "-v",
-        action="store_true",
-        help="Show detailed advertisement data"
+        "--verbose", "-v", action="store_true", help="Show detailed advertisement data"
     )
     parser.add_argument(
         "--manufacturer-data",
         action="store_true",
-        help="Show manufacturer-specific data"
+        help="Show manufacturer-specific data",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="FILE",
+        help="Record the manufacturer data of every matching advertisement "
+        "to a binary capture file for offline replay",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["text", "jsonl"],
+        default="text",
+        help="Output format: readable text, or one JSON object per line "
+        "(default: text)",
+    )
+    parser.add_argument(
+        "--dedupe-ttl",
+        type=float,
+        default=300.0,
+        help="Seconds before a device already shown is shown again (default: 300.0)",
+    )
+    parser.add_argument(
+        "--dedupe-size",
+        type=int,
+        default=4096,
+        help="Devices remembered for deduplication; the least recently seen "
+        "are forgotten first (default: 4096)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Instead of printing advertisements, show a live table of the "
+        "busiest devices with their rate, RSSI and inter-arrival times",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="Devices shown in the --stats table (default: 10)",
+    )
+    parser.add_argument(
+        "--refresh",
+        type=float,
+        default=1.0,
+        help="Seconds between --stats table redraws (default: 1.0)",
+    )
+    parser.add_argument(
+        "--window",
+        type=float,
+        default=10.0,
+        help="Seconds of history summarised by --stats (default: 10.0)",
     )
     return parser
 
 
 async def listen_to_broadcasts(
-    timeout: float, 
+    timeout: float,
     name_filter: str,
     verbose: bool,
-    show_manufacturer_data: bool
-) -> None:
-    """Listen to BLE broadcasts."""
-    print("Scanning for BLE devices...")
+    show_manufacturer_data: bool,
+    record_path: Optional[str] = None,
+    scanner: Optional[SharedScanner] = None,
+    output_format: str = "text",
+    dedupe_ttl: float = 300.0,
+    dedupe_size: int = 4096,
+    stream: Optional[TextIO] = None,
+    show_stats: bool = False,
+    top: int = 10,
+    refresh: float = 1.0,
+    stats_window: float = 10.0,
+) -> dict[str, Any]:
+    """Listen to BLE broadcasts, optionally recording them to ``record_path``.
+
+    Each device is shown once per ``dedupe_ttl`` seconds (every advertisement
+    with ``verbose``), remembering at most ``dedupe_size`` devices. Output is
+    written to ``stream`` in batches; with ``output_format="jsonl"`` it is one
+    JSON object per line and status messages go to stderr. Pass a running
+    ``scanner`` to share its scan with other consumers.
+
+    With ``show_stats`` no advertisements are printed. Instead a table of the
+    ``top`` busiest devices over the last ``stats_window`` seconds is redrawn
+    every ``refresh`` seconds.
+
+    Returns:
+        Counts of advertisements received, shown, deduplicated and dropped
+    """
+    _import_deferred()
+    stream = stream or sys.stdout
+    jsonl = output_format == "jsonl"
+    status = sys.stderr if jsonl else stream
+
+    def report(message: str = "") -> None:
+        print(message, file=status, flush=True)
+
+    report("Scanning for BLE devices...")
     if name_filter:
-        print(f"Filtering by name: {name_filter}")
+        report(f"Filtering by name: {name_filter}")
     if timeout > 0:
-        print(f"Scanning for {timeout} seconds")
+        report(f"Scanning for {timeout} seconds")
     else:
-        print("Scanning indefinitely (press Ctrl+C to stop)")
-    print()
-    
-    seen_devices = set()
-    
-    async with BleakScanner() as scanner:
+        report("Scanning indefinitely (press Ctrl+C to stop)")
+    report()
+
+    name_filter = name_filter.lower() if name_filter else ""
+    dedupe = DedupeTable(dedupe_size, dedupe_ttl)
+    device_stats = BroadcastStats(stats_window) if show_stats else None
+    recorder = CaptureWriter(record_path) if record_path else None
+    received = 0
+    filtered = 0
+
+    scanner = scanner or SharedScanner()
+    broadcasts = scanner.subscribe("broadcast", maxsize=1024)
+    redraw = None
+    async with scanner, BatchWriter(stream) as output:
+        if device_stats is not None:
+            redraw = asyncio.create_task(
+                redraw_stats(device_stats, stream, top, refresh)
+            )
         try:
-            start_time = asyncio.get_event_loop().time()
-            async for device, adv_data in scanner.advertisement_data():
-                # Check timeout
-                if timeout > 0 and (asyncio.get_event_loop().time() - start_time) > timeout:
-                    break
-                    
-                # Apply name filter
-                if name_filter and (not device.name or name_filter.lower() not in device.name.lower()):
-                    continue
-                    
-                # Avoid duplicates (show each device once)
-                device_key = (device.address, device.name)
-                if device_key in seen_devices and not verbose:
-                    continue
-                seen_devices.add(device_key)
-                    
-                print(f"Device: {device.name or 'Unknown'} ({device.address})")
-                print(f"  RSSI: {adv_data.rssi} dBm")
-                
-                if adv_data.local_name and adv_data.local_name != device.name:
-                    print(f"  Local Name: {adv_data.local_name}")
-                    
-                if adv_data.service_uuids:
-                    print(f"  Services: {', '.join(adv_data.service_uuids)}")
-                    
-                if show_manufacturer_data and adv_data.manufacturer_data:
-                    print("  Manufacturer Data:")
-                    for manufacturer_id, data in adv_data.manufacturer_data.items():
-                        print(f"    ID {manufacturer_id}: {data.hex()}")
-                        
-                if verbose and adv_data.service_data:
-                    print("  Service Data:")
-                    for service_uuid, data in adv_data.service_data.items():
-                        print(f"    {service_uuid}: {data.hex()}")
-                        
-                print()
-                    
+            async with asyncio.timeout(timeout if timeout > 0 else None):
+                async for device, adv_data, _ in broadcasts:
+                    received += 1
+                    if name_filter and name_filter not in (device.name or "").lower():
+                        filtered += 1
+                        continue
+
+                    if recorder is not None:
+                        for maker, data in adv_data.manufacturer_data.items():
+                            recorder.advertisement(device.address, maker, data)
+
+                    if device_stats is not None:
+                        device_stats.add(device.address, device.name, adv_data.rssi)
+                        continue
+
+                    if not verbose and dedupe.seen((device.address, device.name)):
+                        continue
+
+                    if jsonl:
+                        output.write(format_jsonl(device, adv_data, time.time()))
+                    else:
+                        output.write(
+                            format_text(
+                                device, adv_data, show_manufacturer_data, verbose
+                            )
+                        )
+        except TimeoutError:
+            pass
         except KeyboardInterrupt:
-            print("Stopping scan...")
+            report("Stopping scan...")
             raise
-    
-    print("Scan completed.")
+        finally:
+            if redraw is not None:
+                redraw.cancel()
+            scanner.unsubscribe(broadcasts)
+            output.flush()
+            if recorder is not None:
+                recorder.close()
+                report(f"Recorded {recorder.records} advertisements to {record_path}")
+
+    # Counts, plus the advertisement rate with show_stats
+    stats: dict[str, float] = {
+        "received": received,
+        "filtered": filtered,
+        "shown": output.lines,
+        "deduplicated": dedupe.duplicates,
+        "dropped": broadcasts.dropped,
+        "devices": len(dedupe),
+        "evicted": dedupe.evicted,
+    }
+    if device_stats is not None:
+        stream.write(device_stats.render(top) + "\n")
+        stats["devices"] = len(device_stats.devices)
+        stats["rate"] = round(device_stats.rate(), 1)
+    report("Scan completed.")
+    report(", ".join(f"{key}: {value}" for key, value in stats.items()))
+    return stats
+
+
+async def redraw_stats(
+    stats: BroadcastStats, stream: TextIO, top: int, refresh: float
+) -> None:
+    """Redraw the top-N device table every ``refresh`` seconds."""
+    clear = "\x1b[H\x1b[2J" if stream.isatty() else ""
+    while True:
+        await asyncio.sleep(refresh)
+        stream.write(f"{clear}{stats.render(top)}\n\n")
+        stream.flush()
 
 
 def main() -> None:
     """Main entry point for the broadcast listener CLI command."""
     parser = create_parser()
     args = parser.parse_args()
-    
+    # Only after parsing, so --help and argument errors stay fast
+    _import_deferred()
+
     try:
-        asyncio.run(listen_to_broadcasts(
-            timeout=args.timeout,
-            name_filter=args.filter,
-            verbose=args.verbose,
-            show_manufacturer_data=args.manufacturer_data
-        ))
+        asyncio.run(
+            listen_to_broadcasts(
+                timeout=args.timeout,
+                name_filter=args.filter,
+                verbose=args.verbose,
+                show_manufacturer_data=args.manufacturer_data,
+                record_path=args.record,
+                output_format=args.format,
+                dedupe_ttl=args.dedupe_ttl,
+                dedupe_size=args.dedupe_size,
+                show_stats=args.stats,
+                top=args.top,
+                refresh=args.refresh,
+                stats_window=args.window,
+            )
+        )
     except KeyboardInterrupt:
         print("Interrupted by user")
         sys.exit(0)
@@ -122,4 +282,4 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""CLI command for running the train connection daemon."""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+from typing import TYPE_CHECKING
+
+from core.lazy import lazy_imports
+
+# BLE and protocol code is imported when the command runs, not to parse arguments
+__getattr__, _import_deferred = lazy_imports(
+    __name__,
+    {
+        "asyncio": "asyncio",
+        "get_config": "core.config:get_config",
+        "DiscoveryCache": "core.discovery_cache:DiscoveryCache",
+        "TrainDaemon": "services.daemon:TrainDaemon",
+    },
+)
+
+if TYPE_CHECKING:
+    import asyncio
+
+    from core.config import get_config
+    from core.discovery_cache import DiscoveryCache
+    from services.daemon import TrainDaemon
+
+
+def create_parser() -> argparse.ArgumentParser:
+    """Create argument parser for the daemon command."""
+    parser = argparse.ArgumentParser(
+        description="Keep DUPLO trains connected and accept commands over a local socket",
+        prog="duplo-daemon",
+    )
+    parser.add_argument(
+        "--device-name",
+        action="append",
+        default=[],
+        help="Train to connect to at startup (repeatable; others connect on first use)",
+    )
+    parser.add_argument(
+        "--socket", help="Unix domain socket path (default: DAEMON_SOCKET_PATH setting)"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30.0,
+        help="Timeout in seconds for device discovery (default: 30.0)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always scan instead of connecting to cached train addresses",
+    )
+    parser.add_argument(
+        "--verbose", "-v", action="store_true", help="Log connection events"
+    )
+    return parser
+
+
+def main() -> None:
+    """Main entry point for the daemon CLI command."""
+    parser = create_parser()
+    args = parser.parse_args()
+    # Only after parsing, so --help and argument errors stay fast
+    _import_deferred()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    socket_path = args.socket or get_config().DAEMON_SOCKET_PATH.expanduser()
+    daemon = TrainDaemon(
+        socket_path,
+        trains=tuple(args.device_name),
+        timeout=args.timeout,
+        cache=None if args.no_cache else DiscoveryCache(),
+    )
+    print(f"Listening on {socket_path} (press Ctrl+C to stop)")
+    try:
+        asyncio.run(daemon.serve_forever())
+    except KeyboardInterrupt:
+        print("Daemon stopped")
+        sys.exit(0)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
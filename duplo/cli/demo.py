@@ -1,120 +1,267 @@
 #!/usr/bin/env python3
 """CLI command for basic train control demonstration."""
 
+from __future__ import annotations
+
 import argparse
-import asyncio
 import sys
+from contextlib import AsyncExitStack
+from pathlib import Path
+from typing import Any, Optional, TYPE_CHECKING
+
+from core.lazy import lazy_imports
+
+# BLE and protocol code is imported when the command runs, not to parse arguments
+__getattr__, _import_deferred = lazy_imports(
+    __name__,
+    {
+        "asyncio": "asyncio",
+        "BleakClient": "bleak:BleakClient",
+        "get_config": "core.config:get_config",
+        "DiscoveryCache": "core.discovery_cache:DiscoveryCache",
+        "connect_train": "core.train_controller:connect_train",
+        "find_train": "core.train_controller:find_train",
+        "TrainController": "core.train_controller:TrainController",
+        "DaemonClient": "services.daemon:DaemonClient",
+        "motion": "core.motion",
+        "timeline": "core.timeline",
+    },
+)
 
-from bleak import BleakClient
-from core.train_controller import find_train, TrainController
+if TYPE_CHECKING:
+    import asyncio
+
+    from bleak import BleakClient
+    from core import motion, timeline
+    from core.config import get_config
+    from core.discovery_cache import DiscoveryCache
+    from core.train_controller import connect_train, find_train, TrainController
+    from services.daemon import DaemonClient
 
 
 def create_parser() -> argparse.ArgumentParser:
     """Create argument parser for the demo command."""
     parser = argparse.ArgumentParser(
-        description="Demonstrate basic DUPLO train control features",
-        prog="duplo-demo"
+        description="Demonstrate basic DUPLO train control features", prog="duplo-demo"
     )
     parser.add_argument(
-        "--device-name", 
+        "--device-name",
         default="Train Base",
-        help="Name of the train device to connect to (default: Train Base)"
+        help="Name of the train device to connect to (default: Train Base)",
     )
     parser.add_argument(
-        "--timeout", 
-        type=float, 
+        "--timeout",
+        type=float,
         default=30.0,
-        help="Timeout in seconds for device discovery (default: 30.0)"
+        help="Timeout in seconds for device discovery (default: 30.0)",
     )
     parser.add_argument(
-        "--speed",
-        type=int,
-        default=50,
-        help="Motor speed to test (0-100, default: 50)"
+        "--no-cache",
+        action="store_true",
+        help="Always scan instead of connecting to the cached train address",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Send commands through a running duplo-daemon instead of connecting",
+    )
+    parser.add_argument(
+        "--daemon-socket",
+        type=Path,
+        help="Socket of the daemon (default: DAEMON_SOCKET_PATH setting)",
+    )
+    parser.add_argument(
+        "--speed", type=int, default=50, help="Motor speed to test (0-100, default: 50)"
     )
     parser.add_argument(
         "--sound-id",
         type=int,
         default=5,
-        help="Sound ID to play (default: 5 - station sound)"
+        help="Sound ID to play (default: 5 - station sound)",
     )
     parser.add_argument(
-        "--color-id",
-        type=int,
-        default=5,
-        help="Color ID for lights (default: 5)"
+        "--color-id", type=int, default=5, help="Color ID for lights (default: 5)"
     )
     parser.add_argument(
         "--run-time",
         type=float,
         default=10.0,
-        help="How long to run the motor in seconds (default: 10.0)"
+        help="How long to run the motor in seconds (default: 10.0)",
+    )
+    parser.add_argument(
+        "--ramp",
+        type=float,
+        default=0.0,
+        help="Seconds to smoothly accelerate and brake, 0 to jump straight "
+        "to the speed (default: 0)",
+    )
+    parser.add_argument(
+        "--timeline",
+        type=Path,
+        help="Play a JSON timeline of timed commands instead of the built-in "
+        "sequence",
     )
     return parser
 
 
+async def run_demo_sequence(
+    controller: Any,
+    speed: int,
+    sound_id: int,
+    color_id: int,
+    run_time: float,
+    ramp: float = 0.0,
+) -> None:
+    """Play the demo on a connected TrainController or daemon-managed train."""
+    _import_deferred()
+    # Setup speaker port
+    print("Setting up speaker port...")
+    await controller.setup_port_input_format(port_id=1, mode=1)
+    await asyncio.sleep(1)
+
+    # Play sound
+    print(f"Playing sound ID {sound_id}...")
+    await controller.play_sound(port_id=1, sound_id=sound_id)
+    await asyncio.sleep(1)
+
+    # Change light color
+    print(f"Setting light color to {color_id}...")
+    await controller.set_light_color(port_id=17, color_id=color_id)
+    await asyncio.sleep(1)
+
+    # Set speed
+    if ramp > 0:
+        print(f"Accelerating to {speed}% over {ramp}s...")
+        await play_ramp(controller, 0, speed, ramp)
+    else:
+        print(f"Setting motor speed to {speed}%...")
+        await controller.set_motor_speed(port_id=0, speed=speed)
+    await asyncio.sleep(run_time)
+
+    # Stop the train
+    print("Stopping train...")
+    if ramp > 0:
+        await play_ramp(controller, speed, 0, ramp)
+    else:
+        await controller.set_motor_speed(port_id=0, speed=0)
+
+
+async def play_ramp(controller: Any, start: int, end: int, duration: float) -> None:
+    """Stream an S-curve speed change and report how steady the ticks were."""
+    result = await motion.play_profile(
+        controller.send_frame, motion.s_curve(start, end, duration)
+    )
+    summary = result.summary()
+    print(
+        f"  {result.writes} writes over {result.ticks} ticks, jitter "
+        f"mean {summary['jitter_mean'] * 1000:.2f}ms "
+        f"max {summary['jitter_max'] * 1000:.2f}ms"
+    )
+
+
 async def demo_train_control(
     device_name: str,
     timeout: float,
     speed: int,
     sound_id: int,
     color_id: int,
-    run_time: float
+    run_time: float,
+    cache: Optional[DiscoveryCache] = None,
+    daemon_socket: Optional[Path] = None,
+    ramp: float = 0.0,
+    timeline_path: Optional[Path] = None,
 ) -> None:
     """Run the train control demonstration."""
+    _import_deferred()
+    compiled = None
+    if timeline_path is not None:
+        # Compile before connecting so a bad file fails without touching the train
+        compiled = timeline.load_timeline(timeline_path).compile()
+
+    async def run(controller: Any) -> None:
+        if compiled is not None:
+            await play_timeline(controller, compiled)
+        else:
+            await run_demo_sequence(
+                controller, speed, sound_id, color_id, run_time, ramp
+            )
+
+    if daemon_socket is not None:
+        print(f"Sending commands for {device_name} through {daemon_socket}")
+        async with DaemonClient(daemon_socket) as daemon:
+            await run(daemon.train(device_name))
+        print("Demo completed successfully!")
+        return
+
     print(f"Looking for train: {device_name}")
-    train = await find_train(device_name, timeout=timeout)
-    if train is None:
-        print(f"Error: Train '{device_name}' not found within {timeout} seconds")
-        sys.exit(1)
-        
-    print(f"Found train: {train}")
+    async with AsyncExitStack() as stack:
+        client = await connect_train(
+            stack,
+            device_name,
+            timeout=timeout,
+            cache=cache,
+            find=find_train,
+            client_factory=BleakClient,
+        )
+        if client is None:
+            print(f"Error: Train '{device_name}' not found within {timeout} seconds")
+            sys.exit(1)
 
-    async with BleakClient(train) as client:
+        print(f"Connected to train: {client.address}")
         controller = TrainController(client)
+        if cache is not None:
+            controller.use_cached_layout(cache, device_name)
         await controller.setup_notifications()
 
-        # Setup speaker port
-        print("Setting up speaker port...")
-        await controller.setup_port_input_format(port_id=1, mode=1)
-        await asyncio.sleep(1)
-
-        # Play sound
-        print(f"Playing sound ID {sound_id}...")
-        await controller.play_sound(port_id=1, sound_id=sound_id)
-        await asyncio.sleep(1)
+        await run(controller)
 
-        # Change light color
-        print(f"Setting light color to {color_id}...")
-        await controller.set_light_color(port_id=17, color_id=color_id)
-        await asyncio.sleep(1)
+        if cache is not None and controller.attached_io:
+            cache.record(device_name, client.address, dict(controller.attached_io))
 
-        # Set speed
-        print(f"Setting motor speed to {speed}%...")
-        await controller.set_motor_speed(port_id=0, speed=speed)
-        await asyncio.sleep(run_time)
+    print("Demo completed successfully!")
 
-        # Stop the train
-        print("Stopping train...")
-        await controller.set_motor_speed(port_id=0, speed=0)
 
-    print("Demo completed successfully!")
+async def play_timeline(controller: Any, compiled: timeline.CompiledTimeline) -> None:
+    """Fire a compiled timeline and report how late its events went out."""
+    print(f"Playing timeline: {len(compiled)} frames over {compiled.duration:g}s...")
+    result = await timeline.run_timeline(controller.send_frame, compiled)
+    summary = result.summary()
+    if result:
+        print(
+            f"  {len(result)} events, lateness "
+            f"mean {summary['lateness_mean'] * 1000:.2f}ms "
+            f"p99 {summary['lateness_p99'] * 1000:.2f}ms "
+            f"max {summary['lateness_max'] * 1000:.2f}ms"
+        )
 
 
 def main() -> None:
     """Main entry point for the demo CLI command."""
     parser = create_parser()
     args = parser.parse_args()
-    
+    # Only after parsing, so --help and argument errors stay fast
+    _import_deferred()
+    daemon_socket = None
+    if args.daemon:
+        daemon_socket = (
+            args.daemon_socket or get_config().DAEMON_SOCKET_PATH.expanduser()
+        )
+
     try:
-        asyncio.run(demo_train_control(
-            device_name=args.device_name,
-            timeout=args.timeout,
-            speed=args.speed,
-            sound_id=args.sound_id,
-            color_id=args.color_id,
-            run_time=args.run_time
-        ))
+        asyncio.run(
+            demo_train_control(
+                device_name=args.device_name,
+                timeout=args.timeout,
+                speed=args.speed,
+                sound_id=args.sound_id,
+                color_id=args.color_id,
+                run_time=args.run_time,
+                cache=None if args.no_cache else DiscoveryCache(),
+                daemon_socket=daemon_socket,
+                ramp=args.ramp,
+                timeline_path=args.timeline,
+            )
+        )
     except KeyboardInterrupt:
         print("\nDemo interrupted by user")
         sys.exit(1)
@@ -124,4 +271,4 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
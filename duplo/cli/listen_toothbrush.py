@@ -1,78 +1,185 @@
 #!/usr/bin/env python3
 """CLI command for listening to toothbrush events."""
 
+from __future__ import annotations
+
 import argparse
-import asyncio
 import sys
+from typing import Optional, TYPE_CHECKING
+
+from core.lazy import lazy_imports
+
+# BLE and protocol code is imported when the command runs, not to parse arguments
+__getattr__, _import_deferred = lazy_imports(
+    __name__,
+    {
+        "asyncio": "asyncio",
+        "ScanFilter": "services.scanner:ScanFilter",
+        "SharedScanner": "services.scanner:SharedScanner",
+        "ToothbrushTracker": "core.toothbrush_router:ToothbrushTracker",
+        "capture": "core.capture",
+    },
+)
+
+if TYPE_CHECKING:
+    import asyncio
+
+    from core import capture
+    from core.toothbrush_router import ToothbrushTracker
+    from services.scanner import ScanFilter, SharedScanner
 
-from bleak import BleakScanner
-from protocols.ble_toothbrush import ToothbrushEvent
 
 TOOTHBRUSH_SERVICE_UUID = "0000fe0d-0000-1000-8000-00805f9b34fb"
+TOOTHBRUSH_MANUFACTURER_ID = 220
 
 
 def create_parser() -> argparse.ArgumentParser:
     """Create argument parser for the toothbrush listener command."""
     parser = argparse.ArgumentParser(
         description="Listen to and display Oral-B toothbrush events",
-        prog="duplo-listen-toothbrush"
+        prog="duplo-listen-toothbrush",
     )
     parser.add_argument(
-        "--verbose", "-v",
+        "--verbose",
+        "-v",
         action="store_true",
-        help="Enable verbose output including raw data"
+        help="Enable verbose output including raw data",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="FILE",
+        help="Record raw toothbrush advertisements to a binary capture file",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="FILE",
+        help="Read advertisements from a capture file instead of scanning",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        help="Replay rate relative to the recording, 0 for as fast as possible "
+        "(default: 1.0)",
     )
     return parser
 
 
-async def listen_to_toothbrush_events(verbose: bool) -> None:
-    """Listen to toothbrush events and display them."""
+def show_toothbrush_data(
+    tracker: ToothbrushTracker,
+    address: str,
+    name: Optional[str],
+    data: bytes,
+    verbose: bool,
+) -> None:
+    """Decode one advertisement payload and print it if the state changed."""
+    if verbose:
+        print(f"Raw data from {name or address}: {data.hex()}")
+
+    try:
+        change = tracker.update(address, data)
+    except Exception as e:
+        if verbose:
+            print(f"Failed to parse data: {e}")
+        return
+
+    if change is not None:
+        _, parsed = change
+        print(f"Toothbrush state changed ({address}):")
+        print(f"  State: {parsed.state}")
+        print(f"  Pressure: {parsed.pressure}")
+        print(f"  Timer: {parsed.brush_minutes}:{parsed.brush_seconds:02d}")
+        print(f"  Mode: {parsed.mode}")
+        if parsed.pressure.mode_button_pressed:
+            print("  >>> Mode button pressed!")
+        if parsed.pressure.power_button_pressed:
+            print("  >>> Power button pressed!")
+        print()
+
+
+async def listen_to_toothbrush_events(
+    verbose: bool,
+    record_path: Optional[str] = None,
+    scanner: Optional[SharedScanner] = None,
+) -> None:
+    """Listen to toothbrush events and display them.
+
+    Pass a running ``scanner`` to share its scan with other consumers.
+    """
+    _import_deferred()
     print("Scanning for Oral-B toothbrushes...")
     print("Press Ctrl+C to stop")
-    
-    async with BleakScanner(service_uuids=[TOOTHBRUSH_SERVICE_UUID]) as scanner:
-        last_state = None
+
+    tracker = ToothbrushTracker()
+    recorder = capture.CaptureWriter(record_path) if record_path else None
+    scanner = scanner or SharedScanner()
+    brushes = scanner.subscribe(
+        "listen-toothbrush",
+        ScanFilter(
+            service_uuids=[TOOTHBRUSH_SERVICE_UUID],
+            manufacturer_ids=[TOOTHBRUSH_MANUFACTURER_ID],
+        ),
+    )
+    async with scanner:
         try:
-            async for device, adv_data in scanner.advertisement_data():
-                if 220 not in adv_data.manufacturer_data:
-                    continue
-                    
-                data = adv_data.manufacturer_data[220]
-                if verbose:
-                    print(f"Raw data from {device.name}: {data.hex()}")
-                    
-                try:
-                    parsed = ToothbrushEvent.parse(data)
-                except Exception as e:
-                    if verbose:
-                        print(f"Failed to parse data: {e}")
-                    continue
-                    
-                if parsed != last_state:
-                    print("Toothbrush state changed:")
-                    print(f"  State: {parsed.state}")
-                    print(f"  Pressure: {parsed.pressure}")
-                    print(f"  Timer: {parsed.timer}")
-                    print(f"  Mode: {parsed.mode}")
-                    if parsed.pressure.mode_button_pressed:
-                        print("  >>> Mode button pressed!")
-                    if parsed.pressure.power_button_pressed:
-                        print("  >>> Power button pressed!")
-                    print()
-                    last_state = parsed
-                    
+            async for device, adv_data, _ in brushes:
+                data = adv_data.manufacturer_data[TOOTHBRUSH_MANUFACTURER_ID]
+                if recorder is not None:
+                    recorder.advertisement(
+                        device.address, TOOTHBRUSH_MANUFACTURER_ID, data
+                    )
+                show_toothbrush_data(
+                    tracker, device.address, device.name, data, verbose
+                )
+
         except KeyboardInterrupt:
             print("\nStopping...")
             raise
+        finally:
+            scanner.unsubscribe(brushes)
+            if recorder is not None:
+                recorder.close()
+
+
+async def replay_toothbrush_events(path: str, speed: float, verbose: bool) -> None:
+    """Display toothbrush events from a capture file using the live decoding path."""
+    _import_deferred()
+    tracker = ToothbrushTracker()
+
+    def handle(record: capture.CaptureRecord) -> None:
+        if record.channel == TOOTHBRUSH_MANUFACTURER_ID:
+            show_toothbrush_data(tracker, record.source, None, record.payload, verbose)
+
+    with capture.CaptureReader(path) as reader:
+        result = await capture.replay(
+            reader, {capture.ADVERTISEMENT: handle}, speed=speed
+        )
+    print(
+        f"Replayed {result.records} advertisements in {result.elapsed:.3f}s "
+        f"({result.rate:.0f}/s)"
+    )
 
 
 def main() -> None:
     """Main entry point for the toothbrush listener CLI command."""
     parser = create_parser()
     args = parser.parse_args()
-    
+    # Only after parsing, so --help and argument errors stay fast
+    _import_deferred()
+
     try:
-        asyncio.run(listen_to_toothbrush_events(verbose=args.verbose))
+        if args.replay:
+            asyncio.run(
+                replay_toothbrush_events(
+                    args.replay, speed=args.replay_speed, verbose=args.verbose
+                )
+            )
+        else:
+            asyncio.run(
+                listen_to_toothbrush_events(
+                    verbose=args.verbose, record_path=args.record
+                )
+            )
     except KeyboardInterrupt:
         print("Interrupted by user")
         sys.exit(0)
@@ -82,4 +189,4 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
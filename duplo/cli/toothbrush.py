@@ -1,136 +1,314 @@
 #!/usr/bin/env python3
 """CLI command for controlling train with toothbrush events."""
 
+from __future__ import annotations
+
 import argparse
-import asyncio
+import functools
 import sys
+from contextlib import AsyncExitStack
+from typing import Any, Optional, TYPE_CHECKING
+
+from core.lazy import lazy_imports
+
+# BLE and protocol code is imported when the command runs, not to parse arguments
+__getattr__, _import_deferred = lazy_imports(
+    __name__,
+    {
+        "asyncio": "asyncio",
+        "BleakClient": "bleak:BleakClient",
+        "ScanFilter": "services.scanner:ScanFilter",
+        "SharedScanner": "services.scanner:SharedScanner",
+        "DiscoveryCache": "core.discovery_cache:DiscoveryCache",
+        "Metrics": "core.metrics:Metrics",
+        "ToothbrushRouter": "core.toothbrush_router:ToothbrushRouter",
+        "RuleEngine": "core.rules:RuleEngine",
+        "default_rules": "core.rules:default_rules",
+        "load_rules": "core.rules:load_rules",
+        "fleet_connection": "duplo.fleet:fleet_connection",
+        "connect_train": "core.train_controller:connect_train",
+        "find_train": "core.train_controller:find_train",
+        "TrainController": "core.train_controller:TrainController",
+    },
+)
+
+if TYPE_CHECKING:
+    import asyncio
+
+    from bleak import BleakClient
+    from core.discovery_cache import DiscoveryCache
+    from core.metrics import Metrics
+    from core.rules import RuleEngine, default_rules, load_rules
+    from core.toothbrush_router import ToothbrushRouter
+    from core.train_controller import connect_train, find_train, TrainController
+    from duplo.fleet import fleet_connection
+    from services.scanner import ScanFilter, SharedScanner
 
-from bleak import BleakClient, BleakScanner
-from protocols.ble_toothbrush import ToothbrushEvent
-from core.train_controller import find_train, TrainController
 
 TOOTHBRUSH_SERVICE_UUID = "0000fe0d-0000-1000-8000-00805f9b34fb"
+TOOTHBRUSH_MANUFACTURER_ID = 220
 
 
 def create_parser() -> argparse.ArgumentParser:
     """Create argument parser for the toothbrush control command."""
     parser = argparse.ArgumentParser(
         description="Control DUPLO train using Oral-B toothbrush events",
-        prog="duplo-toothbrush"
+        prog="duplo-toothbrush",
     )
     parser.add_argument(
-        "--device-name", 
+        "--device-name",
         default="Train Base",
-        help="Name of the train device to connect to (default: Train Base)"
+        help="Name of the train device to connect to (default: Train Base)",
     )
     parser.add_argument(
-        "--timeout", 
-        type=float, 
+        "--timeout",
+        type=float,
         default=30.0,
-        help="Timeout in seconds for device discovery (default: 30.0)"
+        help="Timeout in seconds for device discovery (default: 30.0)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always scan instead of connecting to the cached train address",
+    )
+    parser.add_argument(
+        "--route",
+        action="append",
+        metavar="BRUSH=TRAIN",
+        help="Drive TRAIN with the toothbrush at address BRUSH; repeat to "
+        "connect several brushes and trains (default: any brush drives "
+        "--device-name)",
+    )
+    parser.add_argument(
+        "--rules",
+        metavar="FILE",
+        help="JSON file of rules mapping toothbrush events to train commands "
+        "(default: brushing drives the train, mode button plays --sound-id)",
     )
     parser.add_argument(
         "--speed",
         type=int,
         default=50,
-        help="Motor speed when brushing starts (0-100, default: 50)"
+        help="Motor speed when brushing starts (0-100, default: 50)",
     )
     parser.add_argument(
         "--sound-id",
         type=int,
         default=9,
-        help="Sound ID for mode button press (default: 9 - horn sound)"
+        help="Sound ID for mode button press (default: 9 - horn sound)",
     )
     parser.add_argument(
-        "--verbose", "-v",
-        action="store_true",
-        help="Enable verbose output"
+        "--metrics",
+        metavar="FILE",
+        help="Record per-stage latency histograms and write them to FILE in "
+        "OpenMetrics text format every few seconds",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve the latency histograms over HTTP on this local port",
+    )
+    parser.add_argument(
+        "--verbose", "-v", action="store_true", help="Enable verbose output"
     )
     return parser
 
 
+def parse_routes(routes: list[str]) -> dict[str, str]:
+    """Parse ``BRUSH=TRAIN`` arguments into a toothbrush address to train map."""
+    parsed = {}
+    for route in routes:
+        brush, sep, train = route.partition("=")
+        if not sep or not brush.strip() or not train.strip():
+            raise ValueError(f"Invalid route {route!r}, expected BRUSH=TRAIN")
+        parsed[brush.strip()] = train.strip()
+    return parsed
+
+
+async def route_toothbrush_events(
+    router: ToothbrushRouter, verbose: bool, scanner: SharedScanner
+) -> None:
+    """Feed toothbrush advertisements seen by ``scanner`` to ``router``."""
+    _import_deferred()
+    # Only the latest advertisements matter; drop stale ones if we fall behind
+    brushes = scanner.subscribe(
+        "toothbrush",
+        ScanFilter(
+            service_uuids=[TOOTHBRUSH_SERVICE_UUID],
+            manufacturer_ids=[TOOTHBRUSH_MANUFACTURER_ID],
+        ),
+        maxsize=64,
+    )
+    async with scanner:
+        try:
+            async for device, adv_data, received in brushes:
+                data = adv_data.manufacturer_data[TOOTHBRUSH_MANUFACTURER_ID]
+                try:
+                    router.handle_advertisement(device.address, data, received)
+                except Exception as e:
+                    if verbose:
+                        print(f"Failed to parse toothbrush data: {e}")
+        finally:
+            scanner.unsubscribe(brushes)
+
+
 async def control_train_with_toothbrush(
     device_name: str,
     timeout: float,
     speed: int,
     sound_id: int,
-    verbose: bool
+    verbose: bool,
+    cache: Optional[DiscoveryCache] = None,
+    routes: Optional[dict[str, str]] = None,
+    rules_path: Optional[str] = None,
+    metrics_path: Optional[str] = None,
+    metrics_port: Optional[int] = None,
 ) -> None:
-    """Control train based on toothbrush events."""
+    """Control trains based on toothbrush events.
+
+    Without ``routes`` every toothbrush in range drives ``device_name``. With
+    ``routes`` each toothbrush address drives its own train, and all trains
+    are connected at once. ``rules_path`` replaces the default rules built
+    from ``speed`` and ``sound_id``. With ``metrics_path`` or ``metrics_port``
+    the latency of every stage from advertisement to GATT write is measured
+    and exported.
+    """
+    _import_deferred()
+    rules = load_rules(rules_path) if rules_path else default_rules(speed, sound_id)
+    engine = RuleEngine(rules)
+    if not (metrics_path or metrics_port):
+        await _control_trains(
+            device_name, timeout, verbose, cache, routes, engine, None
+        )
+        return
+
+    metrics = Metrics()
+    async with metrics.exporting(metrics_path, metrics_port):
+        await _control_trains(
+            device_name, timeout, verbose, cache, routes, engine, metrics
+        )
+
+
+async def _control_trains(
+    device_name: str,
+    timeout: float,
+    verbose: bool,
+    cache: Optional[DiscoveryCache],
+    routes: Optional[dict[str, str]],
+    engine: RuleEngine,
+    metrics: Optional[Metrics],
+) -> None:
+    reaction = engine.reaction(metrics=metrics)
+    # Train discovery and toothbrush events share one scan
+    async with SharedScanner() as scanner:
+        await _connect_and_route(
+            device_name, timeout, verbose, cache, routes, reaction, metrics, scanner
+        )
+
+
+async def _connect_and_route(
+    device_name: str,
+    timeout: float,
+    verbose: bool,
+    cache: Optional[DiscoveryCache],
+    routes: Optional[dict[str, str]],
+    reaction: Any,
+    metrics: Optional[Metrics],
+    scanner: SharedScanner,
+) -> None:
+    if routes:
+        train_names = list(dict.fromkeys(routes.values()))
+        if verbose:
+            print(f"Looking for trains: {', '.join(train_names)}")
+        async with fleet_connection(
+            train_names, timeout=timeout, scanner=scanner
+        ) as fleet:
+            for name in fleet:
+                await fleet[name].setup_port_input_format(port_id=1, mode=1)
+                if metrics is not None:
+                    fleet[name].start_metrics(metrics)
+            router = ToothbrushRouter(
+                {brush: fleet[train] for brush, train in routes.items()},
+                reaction,
+                metrics=metrics,
+            )
+            if verbose:
+                print(f"Connected to {len(fleet)} trains.")
+                print("Listening for toothbrush events...")
+                print("Press Ctrl+C to stop")
+            try:
+                await route_toothbrush_events(router, verbose, scanner)
+            except KeyboardInterrupt:
+                print("\nStopping trains and exiting...")
+                await fleet.set_motor_speed(0, 0)
+                raise
+            finally:
+                await router.stop()
+        return
+
     if verbose:
         print(f"Looking for train: {device_name}")
-        
-    train = await find_train(device_name, timeout=timeout)
-    if train is None:
-        print(f"Error: Train '{device_name}' not found within {timeout} seconds")
-        sys.exit(1)
-        
-    if verbose:
-        print(f"Found train: {train}")
 
-    async with BleakClient(train) as client:
+    async with AsyncExitStack() as stack:
+        client = await connect_train(
+            stack,
+            device_name,
+            timeout=timeout,
+            cache=cache,
+            find=functools.partial(find_train, scanner=scanner),
+            client_factory=BleakClient,
+        )
+        if client is None:
+            print(f"Error: Train '{device_name}' not found within {timeout} seconds")
+            sys.exit(1)
+
+        if verbose:
+            print(f"Connected to train: {client.address}")
+
         controller = TrainController(client)
         await controller.setup_notifications()
         await controller.setup_port_input_format(port_id=1, mode=1)
-        
+
         if verbose:
             print("Connected to train. Listening for toothbrush events...")
             print("Start brushing to move the train, press mode button for horn sound")
             print("Press Ctrl+C to stop")
 
-        async with BleakScanner(service_uuids=[TOOTHBRUSH_SERVICE_UUID]) as scanner:
-            last_state = None
-            try:
-                async for _, adv_data in scanner.advertisement_data():
-                    if 220 not in adv_data.manufacturer_data:
-                        continue
-                        
-                    data = adv_data.manufacturer_data[220]
-                    try:
-                        parsed = ToothbrushEvent.parse(data)
-                    except Exception as e:
-                        if verbose:
-                            print(f"Failed to parse toothbrush data: {e}")
-                        continue
-                        
-                    if parsed != last_state:
-                        if last_state is not None:
-                            if parsed.state == "running" and last_state.state != "running":
-                                print("Started brushing - starting train")
-                                await controller.set_motor_speed(port_id=0, speed=speed)
-
-                            if parsed.state == "idle" and last_state.state == "running":
-                                print("Stopped brushing - stopping train")
-                                await controller.set_motor_speed(port_id=0, speed=0)
-
-                            if (
-                                parsed.pressure.mode_button_pressed
-                                and not last_state.pressure.mode_button_pressed
-                            ):
-                                print("Mode button pressed - playing horn sound")
-                                await controller.play_sound(port_id=1, sound_id=sound_id)
-
-                        last_state = parsed
-                        
-            except KeyboardInterrupt:
-                print("\nStopping train and exiting...")
-                await controller.set_motor_speed(port_id=0, speed=0)
-                raise
+        if metrics is not None:
+            controller.start_metrics(metrics)
+        router = ToothbrushRouter({}, reaction, default=controller, metrics=metrics)
+        try:
+            await route_toothbrush_events(router, verbose, scanner)
+        except KeyboardInterrupt:
+            print("\nStopping train and exiting...")
+            await controller.set_motor_speed(port_id=0, speed=0)
+            raise
+        finally:
+            await router.stop()
 
 
 def main() -> None:
     """Main entry point for the toothbrush control CLI command."""
     parser = create_parser()
     args = parser.parse_args()
-    
+    # Only after parsing, so --help and argument errors stay fast
+    _import_deferred()
+
     try:
-        asyncio.run(control_train_with_toothbrush(
-            device_name=args.device_name,
-            timeout=args.timeout,
-            speed=args.speed,
-            sound_id=args.sound_id,
-            verbose=args.verbose
-        ))
+        asyncio.run(
+            control_train_with_toothbrush(
+                device_name=args.device_name,
+                timeout=args.timeout,
+                speed=args.speed,
+                sound_id=args.sound_id,
+                verbose=args.verbose,
+                cache=None if args.no_cache else DiscoveryCache(),
+                routes=parse_routes(args.route or []),
+                rules_path=args.rules,
+                metrics_path=args.metrics,
+                metrics_port=args.metrics_port,
+            )
+        )
     except KeyboardInterrupt:
         print("\nInterrupted by user")
         sys.exit(0)
@@ -140,4 +318,4 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
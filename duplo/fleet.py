@@ -0,0 +1,163 @@
+"""Control several DUPLO trains at once."""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Iterator, Optional, Sequence
+
+from bleak import BleakClient
+from bleak.backends.device import BLEDevice
+
+from core.ports import Port
+from core.train_controller import find_trains
+from duplo.api import EnhancedTrainController
+from services.scanner import SharedScanner
+
+FleetResult = dict[str, Optional[BaseException]]
+
+
+class Fleet:
+    """A set of connected trains, addressed by the name or address used to find them.
+
+    Commands fan out to every train in parallel. A failing train never blocks
+    the others; each command returns a ``FleetResult`` mapping every train to
+    ``None`` on success or to the exception it raised.
+    """
+
+    def __init__(self, trains: dict[str, EnhancedTrainController]):
+        self.trains = trains
+        self.connect_errors: FleetResult = {}
+
+    def __getitem__(self, name: str) -> EnhancedTrainController:
+        return self.trains[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.trains)
+
+    def __len__(self) -> int:
+        return len(self.trains)
+
+    async def _run(
+        self, train: EnhancedTrainController, method: str, *args: Any
+    ) -> Any:
+        return await getattr(train, method)(*args)
+
+    async def broadcast(self, method: str, *args: Any) -> FleetResult:
+        """Call ``method`` with ``args`` on every train in parallel.
+
+        Returns:
+            Mapping of train name to None on success or the raised exception
+        """
+        names = list(self.trains)
+        results = await asyncio.gather(
+            *(self._run(self.trains[name], method, *args) for name in names),
+            return_exceptions=True,
+        )
+        return {
+            name: result if isinstance(result, BaseException) else None
+            for name, result in zip(names, results)
+        }
+
+    async def set_motor_speed(self, port_id: Port, speed: int) -> FleetResult:
+        """Set the motor speed on every train."""
+        return await self.broadcast("set_motor_speed", port_id, speed)
+
+    async def play_sound(self, port_id: Port, sound_id: int) -> FleetResult:
+        """Play a sound on every train."""
+        return await self.broadcast("play_sound", port_id, sound_id)
+
+    async def set_light_color(self, port_id: Port, color_id: int) -> FleetResult:
+        """Set the light color on every train."""
+        return await self.broadcast("set_light_color", port_id, color_id)
+
+    async def stop_all(self) -> FleetResult:
+        """Stop every train."""
+        return await self.broadcast("stop_all")
+
+    async def emergency_stop(self) -> FleetResult:
+        """Brake every train."""
+        return await self.broadcast("emergency_stop")
+
+
+@asynccontextmanager
+async def fleet_connection(
+    targets: Sequence[str],
+    timeout: float = 30.0,
+    max_concurrency: int = 3,
+    require_all: bool = True,
+    scanner: Optional[SharedScanner] = None,
+) -> AsyncGenerator[Fleet, None]:
+    """Find and connect to several trains, scanning only once.
+
+    Args:
+        targets: Train names or addresses; repeat a name to find several
+            trains that share it
+        timeout: Timeout in seconds for device discovery
+        max_concurrency: Maximum number of connections being set up at once
+        require_all: Raise if any train is missing or fails to connect;
+            otherwise continue with the trains that did connect
+        scanner: Shared scan to find the trains in, instead of starting one
+
+    Yields:
+        Fleet: The connected trains, keyed by target (``name#2`` for repeats)
+
+    Raises:
+        ConnectionError: If trains are missing and ``require_all`` is set, or
+            if no train could be connected at all
+    """
+    keys = target_keys(targets)
+    if scanner is None:
+        devices = await find_trains(targets, timeout=timeout)
+    else:
+        devices = await find_trains(targets, timeout=timeout, scanner=scanner)
+    missing = [key for key, device in zip(keys, devices) if device is None]
+    if missing and require_all:
+        raise ConnectionError(
+            f"Trains not found within {timeout} seconds: {', '.join(missing)}"
+        )
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    clients: dict[str, BleakClient] = {}
+
+    async def connect(key: str, device: BLEDevice) -> EnhancedTrainController:
+        async with semaphore:
+            # Registered before connecting so a cancelled connect is cleaned up
+            client = clients[key] = BleakClient(device)
+            await client.connect()
+            controller = EnhancedTrainController(client)
+            await controller.setup_notifications()
+            return controller
+
+    found = [(key, device) for key, device in zip(keys, devices) if device is not None]
+    try:
+        results = await asyncio.gather(
+            *(connect(key, device) for key, device in found), return_exceptions=True
+        )
+
+        fleet = Fleet({})
+        for key in missing:
+            fleet.connect_errors[key] = ConnectionError(f"Train '{key}' not found")
+        for (key, _), result in zip(found, results):
+            if isinstance(result, BaseException):
+                fleet.connect_errors[key] = result
+            else:
+                fleet.trains[key] = result
+
+        if not fleet.trains or (require_all and fleet.connect_errors):
+            failed = ", ".join(f"{k} ({e})" for k, e in fleet.connect_errors.items())
+            raise ConnectionError(f"Failed to connect to trains: {failed}")
+        yield fleet
+    finally:
+        await asyncio.gather(
+            *(client.disconnect() for client in clients.values()),
+            return_exceptions=True,
+        )
+
+
+def target_keys(targets: Sequence[str]) -> list[str]:
+    """Fleet key of each target: the target, or ``name#2`` etc. for repeats."""
+    counts: dict[str, int] = {}
+    keys = []
+    for target in targets:
+        counts[target] = counts.get(target, 0) + 1
+        keys.append(target if counts[target] == 1 else f"{target}#{counts[target]}")
+    return keys
@@ -0,0 +1,406 @@
+"""Trains spread over worker processes, driven like a single fleet.
+
+With one event loop, the BLE callbacks, message decoding and command handling
+of every train share one core. ``sharded_connection`` starts worker processes
+that each own a subset of the trains, with their own event loop and
+controllers, and returns a ``ShardedFleet`` that routes commands to the worker
+owning a train::
+
+    async with sharded_connection(names, workers=4) as fleet:
+        feedback = fleet.events.subscribe(CommandFeedback)
+        await fleet["Train Base"].set_motor_speed(0, 50)
+        await fleet.stop_all()
+
+The coordinator and each worker talk over a ``multiprocessing`` pipe. Commands
+are ``(request id, train, method, args)`` tuples answered with results; hub
+messages decoded by the workers come back as batches of typed events and are
+published on ``fleet.events``, an ``EventBus``.
+
+The coordinator finds every train in a single scan and hands each worker the
+addresses of its trains, so the workers never scan. Workers are started with
+``spawn``, so ``client_factory`` must be picklable: a module-level callable or
+a ``functools.partial`` of one.
+"""
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import traceback
+from contextlib import AsyncExitStack, asynccontextmanager
+from multiprocessing.connection import Connection
+from typing import Any, AsyncGenerator, Callable, Optional, Sequence
+
+from bleak import BleakClient
+
+from core.train_controller import find_trains
+from duplo.api import EnhancedTrainController
+from duplo.fleet import Fleet, target_keys
+from protocols.duplo_train_decoder import Record
+from services.daemon import COMMANDS
+from services.event_bus import Event, EventBus, event_from_record
+
+logger = logging.getLogger(__name__)
+
+# Controller methods that may be called on a train owned by a worker
+SHARD_COMMANDS = COMMANDS | {"stop_all", "emergency_stop"}
+
+# Seconds a worker gets to disconnect its trains before it is terminated
+STOP_TIMEOUT = 5.0
+
+
+class ShardError(Exception):
+    """A worker failed to run a command, or exited."""
+
+
+async def by_address(targets: Sequence[str], timeout: float = 30.0) -> list[str]:
+    """Use the targets as the addresses to connect to, without scanning."""
+    return list(targets)
+
+
+class ShardWorker:
+    """Owns the trains of one shard inside a worker process.
+
+    Args:
+        conn: Worker end of the pipe to the coordinator
+        targets: Train key -> hub address of the trains to connect to
+        client_factory: Creates the client for an address
+    """
+
+    def __init__(
+        self,
+        conn: Connection,
+        targets: dict[str, str],
+        client_factory: Callable[..., Any],
+    ):
+        self.conn = conn
+        self.targets = targets
+        self.client_factory = client_factory
+        self.trains: dict[str, EnhancedTrainController] = {}
+        self._events: list[Event] = []
+        self._requests: asyncio.Queue[tuple[Any, ...]] = asyncio.Queue()
+
+    def _on_message(self, source: str, record: Record) -> None:
+        event = event_from_record(source, record)
+        if event is None:
+            return
+        if not self._events:
+            # Send what arrives in one loop iteration as a single batch
+            asyncio.get_running_loop().call_soon(self._send_events)
+        self._events.append(event)
+
+    def _send_events(self) -> None:
+        if self._events:
+            events, self._events = self._events, []
+            self.conn.send(("events", events))
+
+    def _on_readable(self) -> None:
+        try:
+            while self.conn.poll():
+                self._requests.put_nowait(self.conn.recv())
+        except (EOFError, OSError):
+            asyncio.get_running_loop().remove_reader(self.conn.fileno())
+            self._requests.put_nowait(("stop",))
+
+    async def _connect(
+        self, stack: AsyncExitStack, key: str, address: str
+    ) -> Optional[str]:
+        try:
+            client = await stack.enter_async_context(self.client_factory(address))
+            controller = EnhancedTrainController(client)
+            controller.on_message = functools.partial(self._on_message, key)
+            await controller.setup_notifications()
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+        self.trains[key] = controller
+        return None
+
+    async def _call(self, request_id: int, key: str, method: str, args: tuple) -> None:
+        try:
+            if method not in SHARD_COMMANDS:
+                raise ValueError(f"Unknown command {method!r}")
+            result = await getattr(self.trains[key], method)(*args)
+            # Inside the try: a result that cannot be pickled is an error too
+            self.conn.send(("result", request_id, True, result))
+        except Exception as e:
+            self.conn.send(("result", request_id, False, f"{type(e).__name__}: {e}"))
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.conn.fileno(), self._on_readable)
+        tasks: set[asyncio.Task[None]] = set()
+        async with AsyncExitStack() as stack:
+            errors = await asyncio.gather(
+                *(
+                    self._connect(stack, key, address)
+                    for key, address in self.targets.items()
+                )
+            )
+            self.conn.send(("ready", os.getpid(), dict(zip(self.targets, errors))))
+            while True:
+                request = await self._requests.get()
+                if request[0] == "stop":
+                    break
+                task = asyncio.create_task(self._call(*request[1:]))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        self._send_events()
+        loop.remove_reader(self.conn.fileno())
+
+
+def _run_worker(
+    conn: Connection,
+    targets: dict[str, str],
+    client_factory: Callable[..., Any],
+) -> None:
+    """Entry point of a worker process."""
+    try:
+        asyncio.run(ShardWorker(conn, targets, client_factory).run())
+    except Exception:
+        logger.error("Shard worker failed:\n%s", traceback.format_exc())
+    finally:
+        conn.close()
+
+
+class Shard:
+    """The coordinator's end of one worker process."""
+
+    def __init__(
+        self,
+        index: int,
+        targets: dict[str, str],
+        process: multiprocessing.process.BaseProcess,
+        conn: Connection,
+        events: EventBus,
+    ):
+        self.index = index
+        self.targets = targets
+        self.process = process
+        self.conn = conn
+        self.events = events
+        self.pid: Optional[int] = None
+        self.calls = 0
+        self.received = 0
+        self.connect_errors: dict[str, Optional[str]] = {}
+        self._next_id = 0
+        self._pending: dict[int, asyncio.Future[Any]] = {}
+        self._ready: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._closed = False
+
+    def start(self) -> None:
+        self.process.start()
+        asyncio.get_running_loop().add_reader(self.conn.fileno(), self._on_readable)
+
+    async def wait_ready(self) -> None:
+        await self._ready
+
+    def _on_readable(self) -> None:
+        try:
+            while self.conn.poll():
+                self._dispatch(self.conn.recv())
+        except (EOFError, OSError):
+            self._lost(ShardError(f"Shard {self.index} exited"))
+
+    def _dispatch(self, message: tuple[Any, ...]) -> None:
+        kind = message[0]
+        if kind == "events":
+            self.received += len(message[1])
+            for event in message[1]:
+                self.events.publish_nowait(event)
+        elif kind == "result":
+            _, request_id, ok, value = message
+            future = self._pending.pop(request_id, None)
+            if future is None or future.done():
+                return
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(ShardError(value))
+        elif kind == "ready":
+            _, self.pid, self.connect_errors = message
+            if not self._ready.done():
+                self._ready.set_result(None)
+
+    def _lost(self, error: ShardError) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        asyncio.get_running_loop().remove_reader(self.conn.fileno())
+        if not self._ready.done():
+            self._ready.set_exception(error)
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+
+    async def call(self, train: str, method: str, *args: Any) -> Any:
+        """Run ``method`` on ``train`` in the worker and return its result.
+
+        Raises:
+            ShardError: If the command failed or the worker is gone
+        """
+        if self._closed:
+            raise ShardError(f"Shard {self.index} is closed")
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[self._next_id] = future
+        self.calls += 1
+        self.conn.send(("call", self._next_id, train, method, args))
+        return await future
+
+    async def stop(self) -> None:
+        """Disconnect the shard's trains and wait for the worker to exit."""
+        if not self._closed:
+            try:
+                self.conn.send(("stop",))
+            except OSError:
+                pass
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.process.join, STOP_TIMEOUT)
+        if self.process.is_alive():
+            logger.warning("Shard %d did not stop, terminating it", self.index)
+            self.process.terminate()
+            await loop.run_in_executor(None, self.process.join)
+        # Deliver what the worker sent before exiting
+        if not self._closed:
+            self._on_readable()
+        self._lost(ShardError(f"Shard {self.index} is closed"))
+        self.conn.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "pid": self.pid,
+            "trains": list(self.targets),
+            "calls": self.calls,
+            "events": self.received,
+            "pending": len(self._pending),
+        }
+
+
+class ShardedTrain:
+    """A train owned by a worker; commands are awaited like on a controller."""
+
+    def __init__(self, name: str, shard: Shard):
+        self.name = name
+        self.shard = shard
+
+    def __getattr__(self, method: str) -> Callable[..., Any]:
+        if method not in SHARD_COMMANDS:
+            raise AttributeError(f"{method!r} cannot be called on a sharded train")
+        return functools.partial(self.shard.call, self.name, method)
+
+    def __repr__(self) -> str:
+        return f"ShardedTrain({self.name!r}, shard={self.shard.index})"
+
+
+class ShardedFleet(Fleet):
+    """A ``Fleet`` whose trains are owned by worker processes.
+
+    Commands fan out like on ``Fleet``, and hub messages of every train are
+    published on ``events``.
+    """
+
+    def __init__(self, shards: list[Shard], events: EventBus):
+        super().__init__(
+            {
+                name: ShardedTrain(name, shard)  # type: ignore[misc]
+                for shard in shards
+                for name in shard.targets
+                if shard.connect_errors.get(name) is None
+            }
+        )
+        self.shards = shards
+        self.events = events
+        for shard in shards:
+            for name, error in shard.connect_errors.items():
+                if error is not None:
+                    self.connect_errors[name] = ConnectionError(error)
+
+    def stats(self) -> dict[str, Any]:
+        """Calls, events and owned trains per shard."""
+        return {
+            "events": self.events.stats(),
+            "shards": [shard.stats() for shard in self.shards],
+        }
+
+
+@asynccontextmanager
+async def sharded_connection(
+    targets: Sequence[str],
+    workers: Optional[int] = None,
+    timeout: float = 30.0,
+    require_all: bool = True,
+    client_factory: Callable[..., Any] = BleakClient,
+    find_all: Callable[..., Any] = find_trains,
+    events: Optional[EventBus] = None,
+) -> AsyncGenerator[ShardedFleet, None]:
+    """Connect to trains from worker processes, each owning a subset.
+
+    Args:
+        targets: Train names or addresses; repeats get ``name#2`` keys
+        workers: Worker processes (default: one per CPU, at most one per train)
+        timeout: Timeout in seconds for device discovery
+        require_all: Raise if any train fails to connect
+        client_factory: Creates BLE clients in the workers
+        find_all: Finds every target in one call, like ``find_trains``;
+            ``by_address`` skips scanning
+        events: Bus the trains' events are published on (default: a new one)
+
+    Yields:
+        ShardedFleet: The connected trains, keyed like ``fleet_connection``
+
+    Raises:
+        ConnectionError: If trains are missing and ``require_all`` is set, or
+            if no train could be connected at all
+    """
+    keys = target_keys(targets)
+    # One scan for all trains; the workers connect to the addresses found
+    devices = await find_all(list(targets), timeout=timeout)
+    missing = [key for key, device in zip(keys, devices) if device is None]
+    found = {
+        key: device if isinstance(device, str) else device.address
+        for key, device in zip(keys, devices)
+        if device is not None
+    }
+    if missing and (require_all or not found):
+        raise ConnectionError(
+            f"Trains not found within {timeout} seconds: {', '.join(missing)}"
+        )
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(found)))
+    assignments: list[dict[str, str]] = [{} for _ in range(workers)]
+    for i, (key, address) in enumerate(found.items()):
+        assignments[i % workers][key] = address
+
+    context = multiprocessing.get_context("spawn")
+    events = events or EventBus()
+    shards = []
+    try:
+        for index, assigned in enumerate(assignments):
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=_run_worker,
+                args=(child, assigned, client_factory),
+                name=f"duplo-shard-{index}",
+                daemon=True,
+            )
+            shard = Shard(index, assigned, process, parent, events)
+            shards.append(shard)
+            shard.start()
+            child.close()
+        await asyncio.gather(*(shard.wait_ready() for shard in shards))
+
+        fleet = ShardedFleet(shards, events)
+        for key in missing:
+            fleet.connect_errors[key] = ConnectionError(f"Train '{key}' not found")
+        if not fleet.trains or (require_all and fleet.connect_errors):
+            failed = ", ".join(f"{k} ({e})" for k, e in fleet.connect_errors.items())
+            raise ConnectionError(f"Failed to connect to trains: {failed}")
+        yield fleet
+    finally:
+        await asyncio.gather(
+            *(shard.stop() for shard in shards), return_exceptions=True
+        )
@@ -1,19 +1,61 @@
 """BLE protocol definitions for DUPLO trains and toothbrush control."""
 
-from .ble_duplo_train import (
-    message_type,
-    io_type,
-    event,
-    duplo_speaker_sounds,
-    common_message_header,
-    hub_attached_io_message_format,
-    port_input_format_setup_single_format,
-    port_output_command,
-    port_output_command_feedback,
-    generic_error_message,
-    ErrorCode,
+from typing import TYPE_CHECKING
+
+from core.lazy import lazy_imports
+
+# Protocol modules pull in construct, so they are imported on first access
+__getattr__, _import_deferred = lazy_imports(
+    __name__,
+    {
+        "message_type": "protocols.ble_duplo_train:message_type",
+        "io_type": "protocols.ble_duplo_train:io_type",
+        "event": "protocols.ble_duplo_train:event",
+        "duplo_speaker_sounds": "protocols.ble_duplo_train:duplo_speaker_sounds",
+        "common_message_header": "protocols.ble_duplo_train:common_message_header",
+        "hub_attached_io_message_format": "protocols.ble_duplo_train:hub_attached_io_message_format",
+        "port_input_format_setup_single_format": "protocols.ble_duplo_train:port_input_format_setup_single_format",
+        "port_output_command": "protocols.ble_duplo_train:port_output_command",
+        "port_output_command_feedback": "protocols.ble_duplo_train:port_output_command_feedback",
+        "generic_error_message": "protocols.ble_duplo_train:generic_error_message",
+        "ErrorCode": "protocols.ble_duplo_train:ErrorCode",
+        "decode_message": "protocols.duplo_train_decoder:decode_message",
+        "ToothbrushEvent": "protocols.ble_toothbrush:ToothbrushEvent",
+        "State": "protocols.ble_toothbrush:State",
+        "Mode": "protocols.ble_toothbrush:Mode",
+        "Pressure": "protocols.ble_toothbrush:Pressure",
+        "PressureFlags": "protocols.ble_toothbrush:PressureFlags",
+        "ToothbrushState": "protocols.ble_toothbrush:ToothbrushState",
+        "ToothbrushDecoder": "protocols.ble_toothbrush:ToothbrushDecoder",
+        "decode_toothbrush_event": "protocols.ble_toothbrush:decode_toothbrush_event",
+    },
 )
-from .ble_toothbrush import ToothbrushEvent, State, Mode, Pressure
+
+if TYPE_CHECKING:
+    from .ble_duplo_train import (
+        message_type,
+        io_type,
+        event,
+        duplo_speaker_sounds,
+        common_message_header,
+        hub_attached_io_message_format,
+        port_input_format_setup_single_format,
+        port_output_command,
+        port_output_command_feedback,
+        generic_error_message,
+        ErrorCode,
+    )
+    from .duplo_train_decoder import decode_message
+    from .ble_toothbrush import (
+        ToothbrushEvent,
+        State,
+        Mode,
+        Pressure,
+        PressureFlags,
+        ToothbrushState,
+        ToothbrushDecoder,
+        decode_toothbrush_event,
+    )
 
 __all__ = [
     "message_type",
@@ -27,8 +69,13 @@ __all__ = [
     "port_output_command_feedback",
     "generic_error_message",
     "ErrorCode",
+    "decode_message",
     "ToothbrushEvent",
     "State",
     "Mode",
     "Pressure",
+    "PressureFlags",
+    "ToothbrushState",
+    "ToothbrushDecoder",
+    "decode_toothbrush_event",
 ]
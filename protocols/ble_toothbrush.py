@@ -1,3 +1,7 @@
+import struct
+from collections import OrderedDict
+from typing import Optional, Union
+
 from construct import (
     Struct,
     BitStruct,
@@ -54,3 +58,164 @@ ToothbrushEvent = Struct(
     "sector_timer" / Byte,
     "sector_counter" / Byte,
 )
+
+
+STATE_NAMES: dict[int, str] = dict(State.decmapping)
+MODE_NAMES: dict[int, str] = dict(Mode.decmapping)
+
+_toothbrush_event = struct.Struct("<3sBBBBBBBB")
+
+
+class PressureFlags(int):
+    """``Pressure`` flags kept as an int bitmask, with the BitStruct field names."""
+
+    __slots__ = ()
+
+    HIGH_PRESSURE = 0x80
+    MOTOR_SPEED = 0x40
+    UNKNOWN1 = 0x20
+    UNKNOWN2 = 0x10
+    POWER_BUTTON_PRESSED = 0x08
+    MODE_BUTTON_PRESSED = 0x04
+    TIMER_MODE = 0x02
+    UNKNOWN3 = 0x01
+
+    high_pressure = property(lambda self: bool(self & 0x80))
+    motor_speed = property(lambda self: bool(self & 0x40))
+    unknown1 = property(lambda self: bool(self & 0x20))
+    unknown2 = property(lambda self: bool(self & 0x10))
+    power_button_pressed = property(lambda self: bool(self & 0x08))
+    mode_button_pressed = property(lambda self: bool(self & 0x04))
+    timer_mode = property(lambda self: bool(self & 0x02))
+    unknown3 = property(lambda self: bool(self & 0x01))
+
+    def __repr__(self) -> str:
+        return f"PressureFlags(0x{int(self):02x})"
+
+
+class ToothbrushState:
+    """Decoded ``ToothbrushEvent`` with the same field names.
+
+    ``state`` and ``mode`` hold the ``State``/``Mode`` names (or the raw int
+    for values the enums do not know), so ``state.state == "running"`` works
+    as it does on the ``construct`` container.
+    """
+
+    __slots__ = (
+        "model",
+        "state",
+        "pressure",
+        "brush_minutes",
+        "brush_seconds",
+        "mode",
+        "sector",
+        "sector_timer",
+        "sector_counter",
+    )
+
+    def __init__(
+        self,
+        model: bytes,
+        state: Union[str, int],
+        pressure: PressureFlags,
+        brush_minutes: int,
+        brush_seconds: int,
+        mode: Union[str, int],
+        sector: int,
+        sector_timer: int,
+        sector_counter: int,
+    ):
+        self.model = model
+        self.state = state
+        self.pressure = pressure
+        self.brush_minutes = brush_minutes
+        self.brush_seconds = brush_seconds
+        self.mode = mode
+        self.sector = sector
+        self.sector_timer = sector_timer
+        self.sector_counter = sector_counter
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ToothbrushState):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__)
+        return f"ToothbrushState({fields})"
+
+
+def decode_toothbrush_event(data: bytes) -> ToothbrushState:
+    """Decode a toothbrush advertisement payload in one ``struct`` unpack.
+
+    Raises:
+        struct.error: If the payload is shorter than a ``ToothbrushEvent``
+    """
+    (
+        model,
+        state,
+        pressure,
+        brush_minutes,
+        brush_seconds,
+        mode,
+        sector,
+        sector_timer,
+        sector_counter,
+    ) = _toothbrush_event.unpack_from(data)
+    return ToothbrushState(
+        model,
+        STATE_NAMES.get(state, state),
+        PressureFlags(pressure),
+        brush_minutes,
+        brush_seconds,
+        MODE_NAMES.get(mode, mode),
+        sector,
+        sector_timer,
+        sector_counter,
+    )
+
+
+class ToothbrushDecoder:
+    """Decode a stream of toothbrush payloads, skipping repeats.
+
+    The radio repeats identical payloads many times per second, so ``update``
+    compares raw bytes against the previous payload before doing any work,
+    and keeps recently decoded payloads in a small LRU cache.
+    """
+
+    def __init__(self, cache_size: int = 64):
+        self.cache_size = cache_size
+        self.last_payload: Optional[bytes] = None
+        self.last_state: Optional[ToothbrushState] = None
+        self._cache: OrderedDict[bytes, ToothbrushState] = OrderedDict()
+
+    def decode(self, data: bytes) -> ToothbrushState:
+        """Decode ``data``, reusing the cached result for recently seen payloads."""
+        key = bytes(data)
+        cache = self._cache
+        state = cache.get(key)
+        if state is not None:
+            cache.move_to_end(key)
+            return state
+        state = decode_toothbrush_event(key)
+        cache[key] = state
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return state
+
+    def update(self, data: bytes) -> Optional[ToothbrushState]:
+        """Decode ``data`` if it differs from the previous payload.
+
+        Returns:
+            The new state, or None when the payload is unchanged
+        """
+        if data == self.last_payload:
+            return None
+        state = self.decode(data)
+        self.last_payload = bytes(data)
+        if state == self.last_state:
+            return None
+        self.last_state = state
+        return state
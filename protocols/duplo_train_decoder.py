@@ -0,0 +1,277 @@
+"""Fast decoders for DUPLO train hub messages.
+
+These mirror the ``construct`` Structs in ``protocols.ble_duplo_train`` but
+unpack straight from a ``memoryview`` into small ``__slots__`` records instead
+of building ``Container`` objects, and pick the decoder from a table keyed on
+the message type byte. Enum fields are kept as plain ints; the ``*_NAMES``
+tables map them back to the names the ``construct`` Enums use.
+"""
+
+import struct
+from typing import Callable, Optional, Union
+
+from protocols.ble_duplo_train import (
+    ErrorCode,
+    event,
+    information_type,
+    io_type,
+    message_type,
+)
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+MESSAGE_TYPE_NAMES: dict[int, str] = dict(message_type.decmapping)
+IO_TYPE_NAMES: dict[int, str] = dict(io_type.decmapping)
+EVENT_NAMES: dict[int, str] = dict(event.decmapping)
+INFORMATION_TYPE_NAMES: dict[int, str] = dict(information_type.decmapping)
+ERROR_CODE_NAMES: dict[int, str] = dict(ErrorCode.decmapping)
+
+HUB_ATTACHED_IO = message_type.encmapping["hub_attached_io"]
+GENERIC_ERROR_MESSAGE = message_type.encmapping["generic_error_message"]
+PORT_INFORMATION_REQUEST = message_type.encmapping["port_information_request"]
+PORT_INPUT_FORMAT_SETUP_SINGLE = message_type.encmapping[
+    "port_input_format_setup_single"
+]
+PORT_VALUE_SINGLE = message_type.encmapping["port_value_single"]
+PORT_INPUT_FORMAT_SINGLE = message_type.encmapping["port_input_format_single"]
+PORT_OUTPUT_COMMAND = message_type.encmapping["port_output_command"]
+PORT_OUTPUT_COMMAND_FEEDBACK = message_type.encmapping["port_output_command_feedback"]
+
+DETACHED_IO = event.encmapping["detached_io"]
+
+_header = struct.Struct("<BBB")
+_hub_attached_io = struct.Struct("<BBHBB")
+_hub_detached_io = struct.Struct("<BB")
+_port_information_request = struct.Struct("<BB")
+_port_input_format = struct.Struct("<BBIB")
+_port_output_command = struct.Struct("<BBB")
+_port_output_command_feedback = struct.Struct("<BB")
+_generic_error_message = struct.Struct("<BB")
+
+HEADER_SIZE = _header.size
+
+
+class Record:
+    """Base class for decoded messages: slot-based, comparable, printable."""
+
+    __slots__: tuple[str, ...] = ()
+    message_type: int = -1
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class MessageHeader(Record):
+    """``common_message_header``."""
+
+    __slots__ = ("length", "hub_id", "message_type")
+
+    def __init__(self, length: int, hub_id: int, message_type: int):
+        self.length = length
+        self.hub_id = hub_id
+        self.message_type = message_type
+
+
+class HubAttachedIo(Record):
+    """``hub_attached_io_message_format``.
+
+    Detach events carry no IO type or revisions; those fields are ``None``.
+    """
+
+    __slots__ = (
+        "port_id",
+        "event",
+        "io_type",
+        "hardware_revision",
+        "software_revision",
+    )
+    message_type = HUB_ATTACHED_IO
+
+    def __init__(
+        self,
+        port_id: int,
+        event: int,
+        io_type: Optional[int],
+        hardware_revision: Optional[int],
+        software_revision: Optional[int],
+    ):
+        self.port_id = port_id
+        self.event = event
+        self.io_type = io_type
+        self.hardware_revision = hardware_revision
+        self.software_revision = software_revision
+
+
+class GenericErrorMessage(Record):
+    """``generic_error_message``."""
+
+    __slots__ = ("command_type", "error_code")
+    message_type = GENERIC_ERROR_MESSAGE
+
+    def __init__(self, command_type: int, error_code: int):
+        self.command_type = command_type
+        self.error_code = error_code
+
+
+class PortInformationRequest(Record):
+    """``port_information_request_format``."""
+
+    __slots__ = ("port_id", "information_type")
+    message_type = PORT_INFORMATION_REQUEST
+
+    def __init__(self, port_id: int, information_type: int):
+        self.port_id = port_id
+        self.information_type = information_type
+
+
+class PortInputFormat(Record):
+    """``port_input_format_setup_single_format``, sent and echoed by the hub."""
+
+    __slots__ = (
+        "message_type",
+        "port_id",
+        "mode",
+        "delta_interval",
+        "notification_enabled",
+    )
+
+    def __init__(
+        self,
+        message_type: int,
+        port_id: int,
+        mode: int,
+        delta_interval: int,
+        notification_enabled: bool,
+    ):
+        self.message_type = message_type
+        self.port_id = port_id
+        self.mode = mode
+        self.delta_interval = delta_interval
+        self.notification_enabled = notification_enabled
+
+
+class PortValueSingle(Record):
+    """``port_value_single``."""
+
+    __slots__ = ("port_id", "value")
+    message_type = PORT_VALUE_SINGLE
+
+    def __init__(self, port_id: int, value: bytes):
+        self.port_id = port_id
+        self.value = value
+
+
+class PortOutputCommand(Record):
+    """``port_output_command``."""
+
+    __slots__ = ("port_id", "startup", "completion", "sub_command", "payload")
+    message_type = PORT_OUTPUT_COMMAND
+
+    def __init__(
+        self,
+        port_id: int,
+        startup: int,
+        completion: int,
+        sub_command: int,
+        payload: bytes,
+    ):
+        self.port_id = port_id
+        self.startup = startup
+        self.completion = completion
+        self.sub_command = sub_command
+        self.payload = payload
+
+
+class PortOutputCommandFeedback(Record):
+    """``port_output_command_feedback``."""
+
+    __slots__ = ("port_id", "port_feedback_message")
+    message_type = PORT_OUTPUT_COMMAND_FEEDBACK
+
+    def __init__(self, port_id: int, port_feedback_message: int):
+        self.port_id = port_id
+        self.port_feedback_message = port_feedback_message
+
+
+def decode_header(data: Buffer) -> MessageHeader:
+    """Decode the common message header."""
+    return MessageHeader(*_header.unpack_from(data))
+
+
+def decode_hub_attached_io(data: Buffer) -> HubAttachedIo:
+    if len(data) < HEADER_SIZE + _hub_attached_io.size:
+        port_id, io_event = _hub_detached_io.unpack_from(data, HEADER_SIZE)
+        return HubAttachedIo(port_id, io_event, None, None, None)
+    return HubAttachedIo(*_hub_attached_io.unpack_from(data, HEADER_SIZE))
+
+
+def decode_generic_error_message(data: Buffer) -> GenericErrorMessage:
+    return GenericErrorMessage(*_generic_error_message.unpack_from(data, HEADER_SIZE))
+
+
+def decode_port_information_request(data: Buffer) -> PortInformationRequest:
+    return PortInformationRequest(
+        *_port_information_request.unpack_from(data, HEADER_SIZE)
+    )
+
+
+def decode_port_input_format(data: Buffer) -> PortInputFormat:
+    port_id, mode, delta_interval, enabled = _port_input_format.unpack_from(
+        data, HEADER_SIZE
+    )
+    return PortInputFormat(data[2], port_id, mode, delta_interval, enabled != 0)
+
+
+def decode_port_value_single(data: Buffer) -> PortValueSingle:
+    return PortValueSingle(
+        data[HEADER_SIZE], bytes(memoryview(data)[HEADER_SIZE + 1 :])
+    )
+
+
+def decode_port_output_command(data: Buffer) -> PortOutputCommand:
+    port_id, flags, sub_command = _port_output_command.unpack_from(data, HEADER_SIZE)
+    return PortOutputCommand(
+        port_id,
+        flags >> 4,
+        flags & 0x0F,
+        sub_command,
+        bytes(memoryview(data)[HEADER_SIZE + 3 :]),
+    )
+
+
+def decode_port_output_command_feedback(data: Buffer) -> PortOutputCommandFeedback:
+    return PortOutputCommandFeedback(
+        *_port_output_command_feedback.unpack_from(data, HEADER_SIZE)
+    )
+
+
+DECODERS: dict[int, Callable[[Buffer], Record]] = {
+    HUB_ATTACHED_IO: decode_hub_attached_io,
+    GENERIC_ERROR_MESSAGE: decode_generic_error_message,
+    PORT_INFORMATION_REQUEST: decode_port_information_request,
+    PORT_INPUT_FORMAT_SETUP_SINGLE: decode_port_input_format,
+    PORT_VALUE_SINGLE: decode_port_value_single,
+    PORT_INPUT_FORMAT_SINGLE: decode_port_input_format,
+    PORT_OUTPUT_COMMAND: decode_port_output_command,
+    PORT_OUTPUT_COMMAND_FEEDBACK: decode_port_output_command_feedback,
+}
+
+
+def decode_message(data: Buffer) -> Optional[Record]:
+    """Decode a hub message, or return ``None`` for unhandled message types.
+
+    Raises:
+        struct.error: If the message is shorter than its type requires
+    """
+    decoder = DECODERS.get(data[2])
+    if decoder is None:
+        return None
+    return decoder(data)
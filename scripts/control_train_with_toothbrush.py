@@ -1,6 +1,7 @@
 import asyncio
 from bleak import BleakClient, BleakScanner
-from protocols.ble_toothbrush import ToothbrushEvent
+from core.rules import RuleEngine, default_rules
+from core.toothbrush_router import ToothbrushRouter
 from core.train_controller import find_train, TrainController
 
 toothbrush_service_uuid = "0000fe0d-0000-1000-8000-00805f9b34fb"
@@ -17,31 +18,13 @@ async def main() -> None:
         await controller.setup_notifications()
         await controller.setup_port_input_format(port_id=1, mode=1)
 
+        # Every toothbrush keeps its own state, so brushes in range don't mix
+        rules = RuleEngine(default_rules(speed=50, sound_id=9))
+        router = ToothbrushRouter({}, rules.reaction(), default=controller)
         async with BleakScanner(service_uuids=[toothbrush_service_uuid]) as scanner:
-            last_state = None
-            async for _, adv_data in scanner.advertisement_data():
+            async for device, adv_data in scanner.advertisement_data():
                 data = adv_data.manufacturer_data[220]
-                parsed = ToothbrushEvent.parse(data)
-                if parsed != last_state:
-                    if last_state is not None:
-                        if parsed.state == "running" and last_state.state != "running":
-                            print("Started brushing - starting train")
-                            await controller.set_motor_speed(port_id=0, speed=50)
-
-                        if parsed.state == "idle" and last_state.state == "running":
-                            print("Stopped brushing - stopping train")
-                            await controller.set_motor_speed(port_id=0, speed=0)
-
-                        if (
-                            parsed.pressure.mode_button_pressed
-                            and not last_state.pressure.mode_button_pressed
-                        ):
-                            print("Pressed mode button - playing horn sound")
-                            await controller.play_sound(
-                                port_id=1, sound_id=9
-                            )  # Horn sound
-
-                    last_state = parsed
+                router.handle_advertisement(device.address, data)
 
 
 if __name__ == "__main__":
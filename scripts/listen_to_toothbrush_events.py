@@ -1,19 +1,20 @@
 import asyncio
 from bleak import BleakScanner
-from protocols.ble_toothbrush import ToothbrushEvent
+from protocols.ble_toothbrush import ToothbrushDecoder
 
 toothbrush = "Oral-B Toothbrush"
 service_uuid = "0000fe0d-0000-1000-8000-00805f9b34fb"
 
 
 async def main() -> None:
+    decoder = ToothbrushDecoder()
     async with BleakScanner(service_uuids=[service_uuid]) as scanner:
         last_state = None
         async for ble_device, adv_data in scanner.advertisement_data():
             data = adv_data.manufacturer_data[220]
             # print(data)
-            parsed = ToothbrushEvent.parse(data)
-            if parsed != last_state:
+            parsed = decoder.update(data)
+            if parsed is not None:
                 if last_state is not None:
                     # if parsed.state == "charging":
                     #     if (
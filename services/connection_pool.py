@@ -0,0 +1,274 @@
+"""Warm train connections reused across ``train_connection`` blocks.
+
+Connecting to a hub means scanning, a BLE connect, GATT service discovery and
+enabling notifications, which together take seconds. A ``ConnectionPool``
+keeps each connection open after its lease ends, keyed by hub address, so the
+next lease of the same train is a dictionary lookup::
+
+    async with ConnectionPool(idle_timeout=120) as pool:
+        for speed in (30, 60, 0):
+            async with train_connection("Train Base", pool=pool) as train:
+                await train.set_motor_speed(0, speed)
+
+A pooled connection keeps its ``TrainController``: notifications stay enabled
+and the controller's view of the attached devices stays current between
+leases, and the hub characteristic is resolved from the discovered services
+once instead of by UUID on every write. Connections that go unused for
+``idle_timeout`` seconds, or that dropped, are disconnected and reconnected on
+their next lease.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Optional, Union
+
+from bleak import BleakClient
+from bleak.backends.device import BLEDevice
+
+from core.discovery_cache import DiscoveryCache
+from core.train_controller import FindTrain, TrainController, connect_train, find_train
+
+logger = logging.getLogger(__name__)
+
+
+class PooledConnection:
+    """One hub connection kept open by the pool."""
+
+    __slots__ = (
+        "name",
+        "address",
+        "controller",
+        "wrapper",
+        "stack",
+        "leases",
+        "last_used",
+    )
+
+    def __init__(self, name: str, controller: Any, stack: AsyncExitStack, now: float):
+        self.name = name
+        self.address = str(controller.client.address)
+        self.controller = controller
+        # A convenience controller built around ``controller`` by a caller,
+        # reused with the connection so its state survives between leases
+        self.wrapper: Any = None
+        self.stack = stack
+        self.leases = 0
+        self.last_used = now
+
+    @property
+    def connected(self) -> bool:
+        return getattr(self.controller.client, "is_connected", True) is not False
+
+    def idle_for(self, now: float) -> float:
+        """Seconds since the last lease ended, 0 while leased."""
+        return 0.0 if self.leases else now - self.last_used
+
+
+class ConnectionPool:
+    """Keeps train connections warm between uses, keyed by hub address.
+
+    Args:
+        idle_timeout: Seconds an unused connection is kept open
+        client_factory: Creates the client for a device or address
+        controller_factory: Creates the controller for a connected client
+        find: Scanner used to locate trains that are not pooled yet
+        clock: Monotonic clock used for idle times
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = 60.0,
+        client_factory: Callable[[Union[BLEDevice, str]], BleakClient] = BleakClient,
+        controller_factory: Callable[[BleakClient], Any] = TrainController,
+        find: FindTrain = find_train,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.idle_timeout = idle_timeout
+        self.client_factory = client_factory
+        self.controller_factory = controller_factory
+        self.find = find
+        self.clock = clock
+        self.connections: dict[str, PooledConnection] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        # Train name -> hub address of its pooled connection
+        self._addresses: dict[str, str] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._reaper: Optional[asyncio.Task[None]] = None
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def get(self, name: str) -> Optional[PooledConnection]:
+        """The open connection to the train named, or at address, ``name``."""
+        connection = self.connections.get(self._addresses.get(name, name))
+        if connection is not None and not connection.connected:
+            return None
+        return connection
+
+    @asynccontextmanager
+    async def lease(
+        self,
+        name: str = "Train Base",
+        timeout: float = 30.0,
+        cache: Optional[DiscoveryCache] = None,
+    ) -> AsyncIterator[Any]:
+        """Use the controller of a pooled connection, connecting on a miss.
+
+        Args:
+            name: Name or address of the train
+            timeout: Timeout in seconds for device discovery
+            cache: Discovery cache consulted when connecting
+
+        Yields:
+            The connection's controller, with notifications enabled
+
+        Raises:
+            ConnectionError: If the train was not found
+        """
+        connection = await self.acquire(name, timeout, cache)
+        try:
+            yield connection.controller
+        finally:
+            self.release(connection)
+
+    async def acquire(
+        self,
+        name: str,
+        timeout: float = 30.0,
+        cache: Optional[DiscoveryCache] = None,
+    ) -> PooledConnection:
+        """Lease a connection; hand it back with ``release``."""
+        await self.evict_idle()
+        connection = self.get(name)
+        if connection is None:
+            lock = self._locks.setdefault(name, asyncio.Lock())
+            async with lock:
+                connection = self.get(name)
+                if connection is None:
+                    connection = await self._connect(name, timeout, cache)
+                else:
+                    self.hits += 1
+        else:
+            self.hits += 1
+        connection.leases += 1
+        return connection
+
+    def release(self, connection: PooledConnection) -> None:
+        connection.leases -= 1
+        connection.last_used = self.clock()
+
+    async def _connect(
+        self, name: str, timeout: float, cache: Optional[DiscoveryCache]
+    ) -> PooledConnection:
+        stale = self.connections.get(self._addresses.get(name, name))
+        if stale is not None:
+            await self._close(stale)
+        self.misses += 1
+        stack = AsyncExitStack()
+        try:
+            client = await connect_train(
+                stack,
+                name,
+                timeout=timeout,
+                cache=cache,
+                find=self.find,
+                client_factory=self.client_factory,
+            )
+            if client is None:
+                raise ConnectionError(
+                    f"Train '{name}' not found within {timeout} seconds"
+                )
+            controller = self.controller_factory(client)
+            if cache is not None:
+                controller.use_cached_layout(cache, name)
+            controller.resolve_characteristic()
+            await controller.setup_notifications()
+        except BaseException:
+            await stack.aclose()
+            raise
+        connection = PooledConnection(name, controller, stack, self.clock())
+        self.connections[connection.address] = connection
+        self._addresses[name] = connection.address
+        logger.info("Pooled connection to %s (%s)", name, connection.address)
+        return connection
+
+    async def evict_idle(self, now: Optional[float] = None) -> int:
+        """Close connections idle for ``idle_timeout`` seconds or dropped.
+
+        Returns:
+            Number of connections closed
+        """
+        if now is None:
+            now = self.clock()
+        expired = [
+            connection
+            for connection in self.connections.values()
+            if not connection.leases
+            and (
+                connection.idle_for(now) >= self.idle_timeout
+                or not connection.connected
+            )
+        ]
+        self.evicted += len(expired)
+        # Forget them all first, so no lease can pick one up while we disconnect
+        for connection in expired:
+            self._forget(connection)
+        for connection in expired:
+            await self._disconnect(connection)
+        return len(expired)
+
+    def _forget(self, connection: PooledConnection) -> None:
+        self.connections.pop(connection.address, None)
+        if self._addresses.get(connection.name) == connection.address:
+            del self._addresses[connection.name]
+
+    async def _close(self, connection: PooledConnection) -> None:
+        self._forget(connection)
+        await self._disconnect(connection)
+
+    async def _disconnect(self, connection: PooledConnection) -> None:
+        try:
+            await connection.stack.aclose()
+        except Exception as e:
+            logger.debug("Disconnecting %s failed: %s", connection.address, e)
+        logger.info("Closed pooled connection to %s", connection.name)
+
+    async def _reap_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(max(self.idle_timeout / 2, 0.01))
+            await self.evict_idle()
+
+    async def close(self) -> None:
+        """Disconnect every pooled connection."""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        connections = list(self.connections.values())
+        for connection in connections:
+            self._forget(connection)
+        for connection in connections:
+            await self._disconnect(connection)
+
+    async def __aenter__(self) -> "ConnectionPool":
+        self._reaper = asyncio.create_task(self._reap_periodically())
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "connections": len(self.connections),
+            "leased": sum(1 for c in self.connections.values() if c.leases),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+        }
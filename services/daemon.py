@@ -0,0 +1,389 @@
+"""Long-lived train connection daemon with a Unix domain socket interface.
+
+The daemon owns the ``BleakClient`` connections, reconnects with exponential
+backoff when a hub drops, and accepts commands from other processes as JSON
+lines, so a CLI invocation can drive an already connected train in
+milliseconds instead of scanning and connecting every time.
+
+Protocol, one JSON object per line in each direction::
+
+    -> {"train": "Train Base", "command": "set_motor_speed", "args": [0, 50]}
+    <- {"ok": true}
+    -> {"command": "status"}
+    <- {"ok": true, "result": {"Train Base": true}}
+"""
+
+import asyncio
+import functools
+import json
+import logging
+from contextlib import AsyncExitStack
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+from bleak import BleakClient
+
+from core.discovery_cache import DiscoveryCache
+from core.train_controller import TrainController, connect_train, find_train
+
+logger = logging.getLogger(__name__)
+
+# Controller methods that may be called over the socket
+COMMANDS = frozenset(
+    {
+        "set_motor_speed",
+        "play_sound",
+        "set_light_color",
+        "setup_port_input_format",
+        "send_frame",
+    }
+)
+
+
+class ManagedTrain:
+    """A train connection kept alive by the daemon.
+
+    Args:
+        name: Name of the train
+        daemon: Daemon owning the connection
+        max_attempts: Failed connects in a row before giving up, or None to
+            keep retrying forever
+    """
+
+    def __init__(
+        self, name: str, daemon: "TrainDaemon", max_attempts: Optional[int] = None
+    ):
+        self.name = name
+        self.daemon = daemon
+        self.max_attempts = max_attempts
+        self.controller: Optional[TrainController] = None
+        self.connected = asyncio.Event()
+        self.connects = 0
+        self.failures = 0
+        self._disconnected = asyncio.Event()
+        self._task: Optional[asyncio.Task[None]] = None
+
+    @property
+    def gave_up(self) -> bool:
+        return self._task is not None and self._task.done()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _on_disconnect(self, client: Any) -> None:
+        self._disconnected.set()
+
+    async def _run(self) -> None:
+        daemon = self.daemon
+        delay = daemon.backoff_initial
+        while True:
+            try:
+                async with AsyncExitStack() as stack:
+                    client = await connect_train(
+                        stack,
+                        self.name,
+                        timeout=daemon.timeout,
+                        cache=daemon.cache,
+                        find=daemon.find_one,
+                        client_factory=functools.partial(
+                            daemon.client_factory,
+                            disconnected_callback=self._on_disconnect,
+                        ),
+                    )
+                    if client is None:
+                        raise ConnectionError(f"Train '{self.name}' not found")
+                    controller = TrainController(client)
+                    await controller.setup_notifications()
+                    self._disconnected.clear()
+                    self.controller = controller
+                    self.connects += 1
+                    self.connected.set()
+                    logger.info("Connected to %s", self.name)
+                    delay = daemon.backoff_initial
+                    self.failures = 0
+                    await self._disconnected.wait()
+                    logger.warning("Lost connection to %s", self.name)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.warning("Connecting to %s failed: %s", self.name, e)
+            finally:
+                self.connected.clear()
+                self.controller = None
+            if self.max_attempts is not None and self.failures >= self.max_attempts:
+                logger.warning(
+                    "Giving up on %s after %d attempts", self.name, self.failures
+                )
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, daemon.backoff_max)
+
+    async def get_controller(self, timeout: float) -> TrainController:
+        """Wait up to ``timeout`` seconds for the train to be connected.
+
+        Raises:
+            asyncio.TimeoutError: If the train does not connect in time
+            ConnectionError: If the daemon gave up connecting to the train
+        """
+        assert self._task is not None
+        waiter = asyncio.ensure_future(self.connected.wait())
+        try:
+            await asyncio.wait(
+                {waiter, self._task},
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        finally:
+            waiter.cancel()
+        if self.controller is not None:
+            return self.controller
+        if self.gave_up:
+            raise ConnectionError(
+                f"Train '{self.name}' not found after {self.failures} attempts"
+            )
+        raise asyncio.TimeoutError()
+
+
+class TrainDaemon:
+    """Serve train commands over a Unix domain socket.
+
+    Trains are connected on first use, or up front via ``trains``. Trains
+    connected up front are retried forever; a train first named by a request is
+    given up on after ``on_demand_attempts`` failed connects in a row, so a
+    misspelt name cannot keep the daemon scanning. Scans run one at a time.
+
+    Args:
+        socket_path: Path of the Unix domain socket to listen on
+        trains: Train names to connect to immediately
+        timeout: Timeout in seconds for discovery and for waiting on a connection
+        cache: Discovery cache used for direct connects
+        client_factory: Creates BLE clients; replaced by fakes in tests
+        find: Scanner used on a cache miss
+        backoff_initial: First reconnect delay in seconds
+        backoff_max: Longest reconnect delay in seconds
+        on_demand_attempts: Failed connects in a row before giving up on a
+            train that was not in ``trains``
+    """
+
+    def __init__(
+        self,
+        socket_path: Union[str, Path],
+        trains: tuple[str, ...] = (),
+        timeout: float = 30.0,
+        cache: Optional[DiscoveryCache] = None,
+        client_factory: Callable[..., Any] = BleakClient,
+        find: Callable[..., Any] = find_train,
+        backoff_initial: float = 1.0,
+        backoff_max: float = 30.0,
+        on_demand_attempts: int = 3,
+    ):
+        self.socket_path = Path(socket_path)
+        self.timeout = timeout
+        self.cache = cache
+        self.client_factory = client_factory
+        self.find = find
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.on_demand_attempts = on_demand_attempts
+        self.trains: dict[str, ManagedTrain] = {}
+        self._initial_trains = trains
+        self._server: Optional[asyncio.AbstractServer] = None
+        # The radio runs one scan at a time
+        self._scan_lock = asyncio.Lock()
+
+    def train(self, name: str) -> ManagedTrain:
+        """Return the managed connection for ``name``, starting it if needed.
+
+        A train the daemon gave up on is tried again, with a fresh budget of
+        ``on_demand_attempts``.
+        """
+        managed = self.trains.get(name)
+        if managed is None or managed.gave_up:
+            attempts = None if name in self._initial_trains else self.on_demand_attempts
+            managed = self.trains[name] = ManagedTrain(name, self, attempts)
+            managed.start()
+        return managed
+
+    async def find_one(self, name: str, timeout: float) -> Any:
+        """Run ``find``, waiting for any other train's scan to finish first."""
+        async with self._scan_lock:
+            return await self.find(name, timeout=timeout)
+
+    async def start(self) -> None:
+        """Start connecting the initial trains and listening on the socket."""
+        for name in self._initial_trains:
+            self.train(name)
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        self.socket_path.unlink(missing_ok=True)
+        self._server = await asyncio.start_unix_server(
+            self._handle_connection, path=str(self.socket_path)
+        )
+        logger.info("Listening on %s", self.socket_path)
+
+    async def stop(self) -> None:
+        """Stop serving and disconnect every train."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            self.socket_path.unlink(missing_ok=True)
+        await asyncio.gather(*(managed.stop() for managed in self.trains.values()))
+
+    async def serve_forever(self) -> None:
+        await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await self.stop()
+
+    async def __aenter__(self) -> "TrainDaemon":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.stop()
+
+    async def execute(self, request: dict[str, Any]) -> Any:
+        """Run one request and return its result.
+
+        Raises:
+            ValueError: For unknown commands or malformed requests
+            asyncio.TimeoutError: If the train does not connect in time
+        """
+        command = request.get("command")
+        if command == "status":
+            return {name: m.connected.is_set() for name, m in self.trains.items()}
+        if command not in COMMANDS:
+            raise ValueError(f"Unknown command: {command!r}")
+        args = list(request.get("args", []))
+        if command == "send_frame":
+            args = [bytes.fromhex(args[0])]
+        managed = self.train(request.get("train", "Train Base"))
+        controller = await managed.get_controller(self.timeout)
+        return await getattr(controller, command)(*args)
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    result = await self.execute(json.loads(line))
+                    response = {"ok": True, "result": result}
+                except Exception as e:
+                    response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class DaemonError(Exception):
+    """The daemon could not run a command."""
+
+
+class DaemonClient:
+    """Send commands to a running ``TrainDaemon``."""
+
+    def __init__(self, socket_path: Union[str, Path]):
+        self.socket_path = Path(socket_path)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_unix_connection(
+            str(self.socket_path)
+        )
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._reader = self._writer = None
+
+    async def __aenter__(self) -> "DaemonClient":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+    async def request(self, request: dict[str, Any]) -> Any:
+        """Send a request and wait for its response.
+
+        Raises:
+            DaemonError: If the daemon reports a failure
+        """
+        if self._writer is None or self._reader is None:
+            await self.connect()
+        assert self._writer is not None and self._reader is not None
+        self._writer.write(json.dumps(request).encode() + b"\n")
+        await self._writer.drain()
+        line = await self._reader.readline()
+        if not line:
+            raise DaemonError("Daemon closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise DaemonError(response["error"])
+        return response.get("result")
+
+    async def status(self) -> dict[str, bool]:
+        """Connection state of every train the daemon manages."""
+        return await self.request({"command": "status"})
+
+    def train(self, name: str = "Train Base") -> "RemoteTrain":
+        """Return a controller-like proxy for ``name``."""
+        return RemoteTrain(self, name)
+
+
+class RemoteTrain:
+    """Drives a daemon-managed train with the ``TrainController`` command methods."""
+
+    def __init__(self, client: DaemonClient, name: str):
+        self.client = client
+        self.name = name
+
+    async def _command(self, command: str, *args: Any) -> Any:
+        return await self.client.request(
+            {"train": self.name, "command": command, "args": list(args)}
+        )
+
+    async def set_motor_speed(self, port_id: Union[int, str], speed: int) -> None:
+        await self._command("set_motor_speed", port_id, speed)
+
+    async def play_sound(self, port_id: Union[int, str], sound_id: int) -> None:
+        await self._command("play_sound", port_id, sound_id)
+
+    async def set_light_color(self, port_id: Union[int, str], color_id: int) -> None:
+        await self._command("set_light_color", port_id, color_id)
+
+    async def setup_port_input_format(
+        self,
+        port_id: Union[int, str],
+        mode: int = 1,
+        delta_interval: int = 1,
+        notification_enabled: bool = True,
+    ) -> None:
+        await self._command(
+            "setup_port_input_format",
+            port_id,
+            mode,
+            delta_interval,
+            notification_enabled,
+        )
+
+    async def send_frame(self, frame: bytes) -> None:
+        await self._command("send_frame", frame.hex())
@@ -0,0 +1,335 @@
+"""Typed events fanned out to subscribers through bounded queues.
+
+Hub notifications are decoded inside the BLE stack's callback, so whatever
+runs there runs on the BLE stack's time. The event bus moves that work out of
+the callback: producers publish small typed events without ever waiting, and
+each subscriber drains its own bounded queue at its own pace::
+
+    bus = EventBus()
+    bus.attach(controller, source="Train Base")
+    values = bus.subscribe(PortValue, policy=COALESCE_LATEST, name="dashboard")
+    async for event in values:
+        print(event.source, event.port_id, event.value)
+
+Per-subscriber policies decide what happens when a queue is full:
+
+``drop_oldest``
+    Discard the oldest queued event (the default).
+``coalesce_latest``
+    Keep only the latest event per key (per train and port for port
+    events, per toothbrush for state changes); a full queue drops the
+    oldest key.
+``block``
+    ``await bus.publish(event)`` waits for room. Publishing from a
+    callback with ``publish_nowait`` cannot wait, so there a full blocking
+    subscriber misses the event and counts it as dropped.
+
+``stats()`` reports queue depth, high-water mark, drops and coalesced
+events per subscriber.
+"""
+
+import asyncio
+import logging
+import operator
+import time
+from typing import Any, Hashable, Iterable, Optional, Union
+
+from protocols.duplo_train_decoder import (
+    DETACHED_IO,
+    GenericErrorMessage,
+    HubAttachedIo,
+    PortOutputCommandFeedback,
+    PortValueSingle,
+    Record,
+)
+from services.queues import BLOCK, DROP_OLDEST, BoundedQueue
+
+logger = logging.getLogger(__name__)
+
+COALESCE_LATEST = "coalesce_latest"
+POLICIES = (DROP_OLDEST, COALESCE_LATEST, BLOCK)
+
+
+class Event:
+    """Something that happened on a train or toothbrush named ``source``."""
+
+    __slots__ = ("source", "timestamp")
+
+    def __init__(self, source: str, timestamp: Optional[float] = None):
+        self.source = source
+        self.timestamp = time.monotonic() if timestamp is None else timestamp
+
+    def key(self) -> Hashable:
+        """Events with equal keys supersede each other when coalescing."""
+        return (type(self), self.source)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(
+            f"{name}={getattr(self, name)!r}"
+            for cls in type(self).__mro__
+            for name in getattr(cls, "__slots__", ())
+            if name != "timestamp"
+        )
+        return f"{type(self).__name__}({fields})"
+
+
+class HubAttached(Event):
+    """A device was attached to or detached from a hub port."""
+
+    __slots__ = ("port_id", "io_type", "attached")
+
+    def __init__(
+        self,
+        source: str,
+        port_id: int,
+        io_type: Optional[int],
+        attached: bool,
+        timestamp: Optional[float] = None,
+    ):
+        super().__init__(source, timestamp)
+        self.port_id = port_id
+        self.io_type = io_type
+        self.attached = attached
+
+    def key(self) -> Hashable:
+        return (HubAttached, self.source, self.port_id)
+
+
+class PortValue(Event):
+    """A sensor port reported a new raw value."""
+
+    __slots__ = ("port_id", "value")
+
+    def __init__(
+        self,
+        source: str,
+        port_id: int,
+        value: bytes,
+        timestamp: Optional[float] = None,
+    ):
+        super().__init__(source, timestamp)
+        self.port_id = port_id
+        self.value = value
+
+    def key(self) -> Hashable:
+        return (PortValue, self.source, self.port_id)
+
+
+class CommandFeedback(Event):
+    """The hub reported progress of the commands on a port."""
+
+    __slots__ = ("port_id", "flags")
+
+    def __init__(
+        self,
+        source: str,
+        port_id: int,
+        flags: int,
+        timestamp: Optional[float] = None,
+    ):
+        super().__init__(source, timestamp)
+        self.port_id = port_id
+        self.flags = flags
+
+    def key(self) -> Hashable:
+        return (CommandFeedback, self.source, self.port_id)
+
+
+class HubError(Event):
+    """The hub rejected a command."""
+
+    __slots__ = ("command_type", "error_code")
+
+    def __init__(
+        self,
+        source: str,
+        command_type: int,
+        error_code: int,
+        timestamp: Optional[float] = None,
+    ):
+        super().__init__(source, timestamp)
+        self.command_type = command_type
+        self.error_code = error_code
+
+
+class ToothbrushStateChanged(Event):
+    """A toothbrush, named by its address, changed state."""
+
+    __slots__ = ("previous", "current")
+
+    def __init__(
+        self,
+        source: str,
+        previous: Any,
+        current: Any,
+        timestamp: Optional[float] = None,
+    ):
+        super().__init__(source, timestamp)
+        self.previous = previous
+        self.current = current
+
+
+def event_from_record(source: str, record: Record) -> Optional[Event]:
+    """The event for a decoded hub message, or None for other message types."""
+    if isinstance(record, PortValueSingle):
+        return PortValue(source, record.port_id, record.value)
+    if isinstance(record, PortOutputCommandFeedback):
+        return CommandFeedback(source, record.port_id, record.port_feedback_message)
+    if isinstance(record, GenericErrorMessage):
+        return HubError(source, record.command_type, record.error_code)
+    if isinstance(record, HubAttachedIo):
+        return HubAttached(
+            source, record.port_id, record.io_type, record.event != DETACHED_IO
+        )
+    return None
+
+
+EventTypes = Union[type[Event], Iterable[type[Event]]]
+
+
+class Subscriber(BoundedQueue[Event]):
+    """Events of the subscribed types, iterated with ``async for``."""
+
+    def __init__(
+        self,
+        name: str,
+        event_types: tuple[type[Event], ...],
+        maxsize: int,
+        policy: str,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown subscriber policy {policy!r}")
+        if policy == COALESCE_LATEST:
+            super().__init__(maxsize, DROP_OLDEST, key=operator.methodcaller("key"))
+        else:
+            super().__init__(maxsize, policy)
+        self.name = name
+        self.event_types = event_types
+        self.subscriber_policy = policy
+        self.max_depth = 0
+
+    def offer(self, event: Event) -> None:
+        """Queue ``event`` without waiting, whatever the policy."""
+        try:
+            self.put_nowait(event)
+        except asyncio.QueueFull:
+            # A full blocking subscriber cannot hold up a callback
+            self.dropped += 1
+            logger.debug("Subscriber %s is full, dropped %r", self.name, event)
+            return
+        depth = len(self)
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    async def deliver(self, event: Event) -> None:
+        await self.put(event)
+        depth = len(self)
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def stats(self) -> dict[str, Any]:
+        stats: dict[str, Any] = super().stats()
+        stats["max_depth"] = self.max_depth
+        stats["policy"] = self.subscriber_policy
+        return stats
+
+
+class EventBus:
+    """Delivers published events to every subscriber of their type."""
+
+    def __init__(self) -> None:
+        self.subscribers: list[Subscriber] = []
+        self.published = 0
+        self._routes: dict[type, list[Subscriber]] = {}
+
+    def subscribe(
+        self,
+        event_types: EventTypes = Event,
+        maxsize: int = 256,
+        policy: str = DROP_OLDEST,
+        name: Optional[str] = None,
+    ) -> Subscriber:
+        """Receive events of ``event_types`` and their subclasses.
+
+        Args:
+            event_types: An event class or several (default: every event)
+            maxsize: Events queued before ``policy`` applies
+            policy: ``drop_oldest``, ``coalesce_latest`` or ``block``
+            name: Shown in ``stats`` (default: ``subscriber-N``)
+        """
+        if isinstance(event_types, type):
+            event_types = (event_types,)
+        subscriber = Subscriber(
+            name or f"subscriber-{len(self.subscribers) + 1}",
+            tuple(event_types),
+            maxsize,
+            policy,
+        )
+        self.subscribers.append(subscriber)
+        self._routes.clear()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """Stop delivering to ``subscriber`` and end its iteration."""
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+            self._routes.clear()
+        subscriber.close()
+
+    def _route(self, event_type: type) -> list[Subscriber]:
+        route = self._routes.get(event_type)
+        if route is None:
+            route = self._routes[event_type] = [
+                subscriber
+                for subscriber in self.subscribers
+                if issubclass(event_type, subscriber.event_types)
+            ]
+        return route
+
+    def publish_nowait(self, event: Event) -> None:
+        """Queue ``event`` for its subscribers without waiting; safe in callbacks."""
+        self.published += 1
+        for subscriber in self._route(type(event)):
+            subscriber.offer(event)
+
+    async def publish(self, event: Event) -> None:
+        """Queue ``event``, waiting for room in blocking subscribers."""
+        self.published += 1
+        for subscriber in self._route(type(event)):
+            await subscriber.deliver(event)
+
+    def publish_record(self, source: str, record: Optional[Record]) -> None:
+        """Publish the event for a decoded hub message, if it has one."""
+        if record is None:
+            return
+        event = event_from_record(source, record)
+        if event is not None:
+            self.publish_nowait(event)
+
+    def attach(self, controller: Any, source: Optional[str] = None) -> None:
+        """Publish the events of every message ``controller`` decodes.
+
+        Args:
+            controller: A ``TrainController``
+            source: Name of the train in events (default: the client address)
+        """
+        if source is None:
+            source = getattr(controller.client, "address", "")
+
+        def on_message(record: Record) -> None:
+            self.publish_record(source, record)
+
+        controller.on_message = on_message
+
+    def toothbrush_changed(self, address: str, previous: Any, current: Any) -> None:
+        """Publish a toothbrush state change; a ``ToothbrushRouter`` hook."""
+        self.publish_nowait(ToothbrushStateChanged(address, previous, current))
+
+    def stats(self) -> dict[str, Any]:
+        """Events published and the queue statistics of each subscriber."""
+        return {
+            "published": self.published,
+            "subscribers": {
+                subscriber.name: subscriber.stats() for subscriber in self.subscribers
+            },
+        }
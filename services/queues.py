@@ -0,0 +1,198 @@
+"""Bounded asyncio queues with an explicit policy for when they are full.
+
+A producer that must never wait, such as a BLE detection callback, cannot use
+``asyncio.Queue.put``, and an unbounded queue grows without limit when its
+consumer falls behind. ``BoundedQueue`` caps the backlog and applies one of
+these policies to an item that arrives while the queue is full:
+
+``drop_oldest``
+    Discard the oldest queued item to make room (the default; consumers
+    see the most recent data).
+``drop_newest``
+    Discard the arriving item.
+``block``
+    ``put`` waits for room; ``put_nowait`` raises ``asyncio.QueueFull``.
+
+With a ``key`` function items coalesce: an item whose key is already queued
+replaces the queued one in place instead of taking a second slot, so a
+consumer only ever sees the latest item per key.
+"""
+
+import asyncio
+import collections
+from typing import AsyncIterator, Callable, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class QueueClosed(Exception):
+    """The queue was closed while waiting on it."""
+
+
+class BoundedQueue(AsyncIterator[T]):
+    """A bounded FIFO with an overflow policy and optional coalescing.
+
+    Args:
+        maxsize: Items held before the overflow policy applies
+        policy: One of ``drop_oldest``, ``drop_newest`` or ``block``
+        key: Coalesce items with equal keys, keeping the latest
+
+    Iterating the queue yields items until it is closed and drained.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        policy: str = DROP_OLDEST,
+        key: Optional[Callable[[T], Hashable]] = None,
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.key = key
+        self.closed = False
+        self.put_count = 0
+        self.dropped = 0
+        self.coalesced = 0
+        # Keyed by ``key(item)``, or by a sequence number without a key
+        self._items: collections.OrderedDict[Hashable, T] = collections.OrderedDict()
+        self._sequence = 0
+        self._getters: collections.deque[asyncio.Future[None]] = collections.deque()
+        self._putters: collections.deque[asyncio.Future[None]] = collections.deque()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def full(self) -> bool:
+        return len(self._items) >= self.maxsize
+
+    def put_nowait(self, item: T) -> bool:
+        """Queue ``item`` without waiting.
+
+        Returns:
+            False if the item was dropped because the queue is full or closed
+
+        Raises:
+            asyncio.QueueFull: If the queue is full and its policy is ``block``
+        """
+        if self.closed:
+            self.dropped += 1
+            return False
+        self.put_count += 1
+        if self.key is not None:
+            slot = self.key(item)
+            if slot in self._items:
+                self._items[slot] = item
+                self.coalesced += 1
+                return True
+        else:
+            self._sequence += 1
+            slot = self._sequence
+        if len(self._items) >= self.maxsize:
+            if self.policy == DROP_NEWEST:
+                self.dropped += 1
+                return False
+            if self.policy == BLOCK:
+                self.put_count -= 1
+                raise asyncio.QueueFull
+            self._items.popitem(last=False)
+            self.dropped += 1
+        self._items[slot] = item
+        self._wake(self._getters)
+        return True
+
+    async def put(self, item: T) -> bool:
+        """Queue ``item``, waiting for room if the policy is ``block``.
+
+        Raises:
+            QueueClosed: If the queue is closed while waiting
+        """
+        while self.policy == BLOCK and self.full() and not self.closed:
+            if self.key is not None and self.key(item) in self._items:
+                break
+            waiter = asyncio.get_running_loop().create_future()
+            self._putters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Pass our wake-up on to the next putter
+                if waiter.done() and not waiter.cancelled():
+                    self._wake(self._putters)
+                raise
+        if self.closed:
+            raise QueueClosed
+        return self.put_nowait(item)
+
+    def get_nowait(self) -> T:
+        """Remove and return the oldest item.
+
+        Raises:
+            asyncio.QueueEmpty: If nothing is queued
+        """
+        if not self._items:
+            raise asyncio.QueueEmpty
+        _, item = self._items.popitem(last=False)
+        self._wake(self._putters)
+        return item
+
+    async def get(self) -> T:
+        """Remove and return the oldest item, waiting for one.
+
+        Raises:
+            QueueClosed: If the queue is closed and empty
+        """
+        while not self._items:
+            if self.closed:
+                raise QueueClosed
+            waiter = asyncio.get_running_loop().create_future()
+            self._getters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                # Pass our wake-up on to the next getter
+                if waiter.done() and not waiter.cancelled():
+                    self._wake(self._getters)
+                raise
+        return self.get_nowait()
+
+    def close(self) -> None:
+        """Refuse new items and wake every waiter; queued items stay readable."""
+        self.closed = True
+        for waiters in (self._getters, self._putters):
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": len(self._items),
+            "put": self.put_count,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+    def __aiter__(self) -> "BoundedQueue[T]":
+        return self
+
+    async def __anext__(self) -> T:
+        try:
+            return await self.get()
+        except QueueClosed:
+            raise StopAsyncIteration from None
+
+    @staticmethod
+    def _wake(waiters: "collections.deque[asyncio.Future[None]]") -> None:
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
@@ -0,0 +1,236 @@
+"""One BLE scan shared by every consumer of advertisements.
+
+Train discovery, toothbrush decoding and the broadcast listeners used to open
+a ``BleakScanner`` each, so the adapter ran several scans at once and every
+advertisement was parsed by each of them. ``SharedScanner`` runs a single
+scan and fans advertisements out to subscriptions::
+
+    async with SharedScanner() as scanner:
+        brushes = scanner.subscribe(
+            "toothbrush", ScanFilter(manufacturer_ids=[220]), maxsize=64
+        )
+        device = await scanner.find_device("Train Base", timeout=10)
+        async for device, adv_data, received in brushes:
+            ...
+
+Each subscription has a filter compiled once into a single predicate, and
+its own ``BoundedQueue`` with an overflow policy, so a slow consumer loses
+its own oldest advertisements (or, with ``drop_newest``, the new ones)
+without holding up the scan or the other consumers. The detection callback
+never waits, so the ``block`` policy is not available here. Each advertisement
+carries the ``time.perf_counter_ns()`` at which the scan saw it, so consumers
+can tell how long it waited in their queue.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Iterable, Optional
+
+from bleak import BleakScanner
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+from services.queues import BLOCK, DROP_OLDEST, BoundedQueue, QueueClosed
+
+logger = logging.getLogger(__name__)
+
+# (device, advertisement data, time.perf_counter_ns() when the scan saw it)
+Advertisement = tuple[BLEDevice, AdvertisementData, int]
+Predicate = Callable[[BLEDevice, AdvertisementData], bool]
+
+
+class ScanFilter:
+    """Which advertisements a subscription receives.
+
+    Each given criterion must match; an empty filter matches everything.
+
+    Args:
+        addresses: Device addresses, case-insensitive
+        names: Exact device or local names
+        service_uuids: Advertised service UUIDs, any of which must be present
+        manufacturer_ids: Manufacturer IDs, any of which must be present
+    """
+
+    __slots__ = ("addresses", "names", "service_uuids", "manufacturer_ids")
+
+    def __init__(
+        self,
+        addresses: Iterable[str] = (),
+        names: Iterable[str] = (),
+        service_uuids: Iterable[str] = (),
+        manufacturer_ids: Iterable[int] = (),
+    ):
+        self.addresses = frozenset(address.upper() for address in addresses)
+        self.names = frozenset(names)
+        self.service_uuids = frozenset(uuid.lower() for uuid in service_uuids)
+        self.manufacturer_ids = frozenset(manufacturer_ids)
+
+    def compile(self) -> Predicate:
+        """Build a predicate that checks only the criteria that were given."""
+        checks: list[Predicate] = []
+        if self.addresses:
+            addresses = self.addresses
+            checks.append(lambda d, a: d.address.upper() in addresses)
+        if self.names:
+            names = self.names
+            checks.append(lambda d, a: d.name in names or a.local_name in names)
+        if self.service_uuids:
+            uuids = self.service_uuids
+            checks.append(lambda d, a: not uuids.isdisjoint(a.service_uuids))
+        if self.manufacturer_ids:
+            ids = self.manufacturer_ids
+            checks.append(lambda d, a: not ids.isdisjoint(a.manufacturer_data))
+
+        if not checks:
+            return lambda d, a: True
+        if len(checks) == 1:
+            return checks[0]
+        return lambda d, a: all(check(d, a) for check in checks)
+
+    def __repr__(self) -> str:
+        fields = (
+            f"{name}={sorted(getattr(self, name))}"
+            for name in self.__slots__
+            if getattr(self, name)
+        )
+        return f"ScanFilter({', '.join(fields)})"
+
+
+class Subscription(BoundedQueue[Advertisement]):
+    """Advertisements matching one consumer's filter, as a bounded queue.
+
+    Iterate it to receive ``(device, advertisement_data, received)`` tuples
+    until it is unsubscribed or the scanner stops.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        scan_filter: ScanFilter,
+        maxsize: int = 256,
+        overflow: str = DROP_OLDEST,
+    ):
+        if overflow == BLOCK:
+            raise ValueError("Scanner subscriptions cannot block the scan")
+        super().__init__(maxsize, overflow)
+        self.name = name
+        self.filter = scan_filter
+        self.matches = scan_filter.compile()
+
+
+class SharedScanner:
+    """Runs one BLE scan and delivers advertisements to every subscription.
+
+    The scan starts with the first ``start`` (or ``async with``) and stops
+    when the last user leaves, so nested users share it.
+
+    Args:
+        scanner_factory: Creates the underlying scanner from a
+            ``detection_callback``
+    """
+
+    def __init__(self, scanner_factory: Callable[..., Any] = BleakScanner):
+        self.scanner_factory = scanner_factory
+        self.subscriptions: list[Subscription] = []
+        self.advertisements = 0
+        self.delivered = 0
+        self._scanner: Any = None
+        self._users = 0
+
+    def subscribe(
+        self,
+        name: str,
+        scan_filter: Optional[ScanFilter] = None,
+        maxsize: int = 256,
+        overflow: str = DROP_OLDEST,
+    ) -> Subscription:
+        """Start receiving advertisements that match ``scan_filter``.
+
+        Args:
+            name: Consumer name, shown in ``stats``
+            scan_filter: Advertisements to receive (default: all)
+            maxsize: Advertisements buffered before ``overflow`` applies
+            overflow: ``drop_oldest`` or ``drop_newest``
+        """
+        subscription = Subscription(
+            name, scan_filter or ScanFilter(), maxsize, overflow
+        )
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop delivering to ``subscription`` and end its iteration."""
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+        subscription.close()
+
+    def dispatch(self, device: BLEDevice, adv_data: AdvertisementData) -> None:
+        """Deliver one advertisement; the scanner's detection callback."""
+        self.advertisements += 1
+        received = time.perf_counter_ns()
+        for subscription in self.subscriptions:
+            if subscription.matches(device, adv_data):
+                subscription.put_nowait((device, adv_data, received))
+                self.delivered += 1
+
+    async def start(self) -> None:
+        self._users += 1
+        if self._scanner is None:
+            self._scanner = self.scanner_factory(detection_callback=self.dispatch)
+            await self._scanner.start()
+            logger.debug("Shared scan started")
+
+    async def stop(self) -> None:
+        self._users = max(0, self._users - 1)
+        if self._users or self._scanner is None:
+            return
+        scanner, self._scanner = self._scanner, None
+        try:
+            await scanner.stop()
+        finally:
+            for subscription in list(self.subscriptions):
+                self.unsubscribe(subscription)
+            logger.debug("Shared scan stopped")
+
+    async def __aenter__(self) -> "SharedScanner":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.stop()
+
+    async def find_device(
+        self, name: str, timeout: float = 30.0
+    ) -> Optional[BLEDevice]:
+        """Wait for a device advertising ``name`` (or with that address).
+
+        Returns:
+            The first matching device, or None after ``timeout`` seconds
+        """
+        by_name = ScanFilter(names=[name]).compile()
+        by_address = ScanFilter(addresses=[name]).compile()
+        subscription = self.subscribe(f"find {name}", maxsize=1)
+        subscription.matches = lambda d, a: by_name(d, a) or by_address(d, a)
+        await self.start()
+        try:
+            async with asyncio.timeout(timeout):
+                device, _, _ = await subscription.get()
+                return device
+        except (TimeoutError, QueueClosed):
+            pass
+        finally:
+            self.unsubscribe(subscription)
+            await self.stop()
+        return None
+
+    def stats(self) -> dict[str, Any]:
+        """Advertisements seen and delivered, and each subscription's queue."""
+        return {
+            "advertisements": self.advertisements,
+            "delivered": self.delivered,
+            "subscriptions": {
+                subscription.name: subscription.stats()
+                for subscription in self.subscriptions
+            },
+        }
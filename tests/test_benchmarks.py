@@ -0,0 +1,62 @@
+"""Test the benchmark suite's coverage and regression comparison."""
+
+import asyncio
+
+from benchmarks.suite import (
+    STRUCT_SAMPLES,
+    benchmarks,
+    compare,
+    measure,
+    protocol_structs,
+)
+
+
+def result(ops: float, peak: float) -> dict:
+    return {"ops_per_sec": ops, "peak_bytes_per_op": peak}
+
+
+def test_every_protocol_struct_is_benchmarked():
+    """Test each Struct gets a build and a parse benchmark that round-trips."""
+    loop = asyncio.new_event_loop()
+    try:
+        cases = benchmarks(loop)
+        for name in protocol_structs():
+            parse, _ = cases[f"construct.{name}.parse"]
+            build, _ = cases[f"construct.{name}.build"]
+            parse()
+            assert build() == STRUCT_SAMPLES[name]
+        op, per_call = cases["controller.set_motor_speed"]
+        op()
+        assert per_call > 1
+    finally:
+        loop.close()
+
+
+def test_measure_reports_throughput_and_memory():
+    """Test measure returns positive throughput and non-negative peak bytes."""
+    measured = measure(lambda: bytes(256), 1, min_time=0.01)
+    assert measured["ops_per_sec"] > 0
+    assert measured["peak_bytes_per_op"] >= 256
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    """Test slowdowns and memory growth past the threshold are reported."""
+    baseline = {
+        "results": {
+            "fast": result(1000, 100),
+            "slow": result(1000, 100),
+            "fat": result(1000, 100),
+        }
+    }
+    current = {
+        "results": {
+            "fast": result(900, 100),
+            "slow": result(500, 100),
+            "fat": result(1000, 1000),
+            "new": result(1, 1),
+        }
+    }
+    regressions = compare(baseline, current, threshold=0.2)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("slow:")
+    assert regressions[1].startswith("fat:")
@@ -1,4 +1,13 @@
-from protocols.ble_toothbrush import ToothbrushEvent
+import struct
+
+import pytest
+
+from protocols.ble_toothbrush import (
+    PressureFlags,
+    ToothbrushDecoder,
+    ToothbrushEvent,
+    decode_toothbrush_event,
+)
 
 
 def test_parse_toothbrush_event():
@@ -6,3 +15,59 @@ def test_parse_toothbrush_event():
     parsed = ToothbrushEvent.parse(event)
     assert parsed.model == b"\x062k"
     assert parsed.state == "idle"
+
+
+def test_decode_matches_construct():
+    """Test the struct decoder keeps the construct field names and values."""
+    event = b"\x062k\x03\x24\x01\x1e\x08\x09\x02\x04"
+    expected = ToothbrushEvent.parse(event)
+    state = decode_toothbrush_event(event)
+    assert state.model == expected.model
+    assert state.state == expected.state == "running"
+    assert state.mode == expected.mode == "settings"
+    for flag in [
+        "high_pressure",
+        "motor_speed",
+        "unknown1",
+        "unknown2",
+        "power_button_pressed",
+        "mode_button_pressed",
+        "timer_mode",
+        "unknown3",
+    ]:
+        assert getattr(state.pressure, flag) == getattr(expected.pressure, flag)
+    assert state.pressure & PressureFlags.MODE_BUTTON_PRESSED
+    for field in [
+        "brush_minutes",
+        "brush_seconds",
+        "sector",
+        "sector_timer",
+        "sector_counter",
+    ]:
+        assert getattr(state, field) == getattr(expected, field)
+
+
+def test_decode_unknown_enum_value_stays_int():
+    """Test that unknown states decode to their raw value like construct."""
+    event = b"\x062k\x07r\x00\x03\x02\t\x00\x04"
+    assert decode_toothbrush_event(event).state == ToothbrushEvent.parse(event).state
+
+
+def test_decoder_skips_unchanged_payloads():
+    """Test that repeated payloads are skipped and changes are reported."""
+    idle = b"\x062k\x02r\x00\x03\x02\t\x00\x04"
+    running = b"\x062k\x03r\x00\x03\x02\t\x00\x04"
+    decoder = ToothbrushDecoder(cache_size=1)
+
+    first = decoder.update(idle)
+    assert first is not None and first.state == "idle"
+    assert decoder.update(bytearray(idle)) is None
+    assert decoder.update(running).state == "running"
+    assert decoder.update(idle).state == "idle"
+    assert decoder.decode(idle) is decoder.decode(idle)
+
+
+def test_decoder_rejects_short_payload():
+    """Test that truncated payloads raise."""
+    with pytest.raises(struct.error):
+        ToothbrushDecoder().update(b"\x062k\x02")
@@ -0,0 +1,160 @@
+"""Test deduplication, batched output and formatting for broadcast listeners."""
+
+import asyncio
+import io
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from core.broadcast import (
+    BatchWriter,
+    BroadcastStats,
+    DedupeTable,
+    format_jsonl,
+    format_text,
+)
+from duplo.cli.broadcast import create_parser, listen_to_broadcasts
+from services.scanner import SharedScanner
+
+
+def advert(address, name="Train Base", rssi=-60):
+    device = Mock(address=address)
+    device.name = name
+    adv_data = Mock(
+        local_name=name,
+        rssi=rssi,
+        service_uuids=["00001623-1212-efde-1623-785feabcd123"],
+        manufacturer_data={919: b"\x00\x20"},
+        service_data={},
+    )
+    return device, adv_data
+
+
+def test_dedupe_table_is_bounded_in_size_and_age():
+    """Test repeats are suppressed within the TTL and old keys are evicted."""
+    table = DedupeTable(maxsize=2, ttl=10.0)
+    assert not table.seen("a", now=0.0)
+    assert table.seen("a", now=5.0)
+    assert not table.seen("a", now=10.0)  # the TTL passed, shown again
+    assert not table.seen("b", now=11.0)
+    assert table.seen("a", now=12.0)  # refreshes "a" as recently seen
+    assert not table.seen("c", now=13.0)  # evicts "b"
+    assert not table.seen("b", now=14.0)
+    assert table.stats() == {"entries": 2, "duplicates": 2, "evicted": 2, "expired": 1}
+
+
+async def test_batch_writer_flushes_by_size_and_time():
+    """Test lines are written in batches and never wait past the interval."""
+    stream = io.StringIO()
+    async with BatchWriter(stream, batch_size=3, interval=0.01) as writer:
+        for line in "abcd":
+            writer.write(line)
+        assert stream.getvalue() == "a\nb\nc\n"
+        await asyncio.sleep(0.03)
+        assert stream.getvalue() == "a\nb\nc\nd\n"
+        writer.write("e")
+    assert stream.getvalue().endswith("e\n")
+    assert (writer.lines, writer.batches) == (5, 3)
+
+
+def test_formats():
+    """Test text blocks and JSON lines carry the advertisement fields."""
+    device, adv_data = advert("AA:BB")
+    text = format_text(device, adv_data, show_manufacturer_data=True)
+    assert text.splitlines()[:2] == ["Device: Train Base (AA:BB)", "  RSSI: -60 dBm"]
+    assert "    ID 919: 0020" in text
+    record = json.loads(format_jsonl(device, adv_data, 1.5))
+    assert record["address"] == "AA:BB" and record["manufacturer_data"] == {
+        "919": "0020"
+    }
+
+
+class BurstScanner:
+    """Stands in for BleakScanner, replaying advertisements once started."""
+
+    adverts: list = []
+
+    def __init__(self, detection_callback):
+        self.detection_callback = detection_callback
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        for item in self.adverts:
+            loop.call_soon(self.detection_callback, *item)
+
+    async def stop(self):
+        pass
+
+
+async def test_listener_writes_deduplicated_jsonl(capsys):
+    """Test --format jsonl emits one line per new device and reports stats."""
+    BurstScanner.adverts = [advert("AA:BB")] * 50 + [
+        advert("CC:DD", "Other"),
+        advert("EE:FF"),
+    ]
+    stream = io.StringIO()
+    stats = await listen_to_broadcasts(
+        timeout=0.05,
+        name_filter="train",
+        verbose=False,
+        show_manufacturer_data=False,
+        scanner=SharedScanner(BurstScanner),
+        output_format="jsonl",
+        stream=stream,
+    )
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["address"] for line in lines] == ["AA:BB", "EE:FF"]
+    assert stats["received"] == 52 and stats["filtered"] == 1
+    assert (stats["shown"], stats["deduplicated"], stats["dropped"]) == (2, 49, 0)
+    assert "deduplicated: 49" in capsys.readouterr().err
+    args = create_parser().parse_args(["--format", "jsonl", "--dedupe-ttl", "5"])
+    assert (args.format, args.dedupe_ttl, args.dedupe_size) == ("jsonl", 5.0, 4096)
+
+
+def test_broadcast_stats_summarise_rolling_windows():
+    """Test rate, RSSI and inter-arrival figures cover only the window."""
+    stats = BroadcastStats(window=1.0, capacity=64, max_devices=2)
+    stats.started = 0.0
+    for i in range(20):
+        stats.add("AA", "Busy", -50 - i % 2, now=i * 0.1)
+    stats.add("BB", None, -80, now=0.1)
+    stats.add("BB", "Quiet", -70, now=1.5)
+
+    (busy, summary), (quiet, _) = stats.top(now=1.95)
+    assert (busy.address, quiet.name) == ("AA", "Quiet")
+    assert summary["count"] == 10 and summary["rate"] == 10.0
+    assert summary["rssi_p10"] == -51 and summary["rssi_p90"] == -50
+    assert summary["gap_p50"] == pytest.approx(0.1)
+    assert stats.top(1, now=1.95) == [(busy, summary)]
+    assert stats.rate(now=2.2) == pytest.approx(10.0)
+
+    table = stats.render(now=1.95)
+    assert table.splitlines()[0].startswith("22 advertisements from 2 devices")
+    assert "Busy" in table and "Quiet" in table
+    # The least recently heard device makes room for a new one
+    stats.add("CC", "New", -60, now=2.0)
+    assert list(stats.devices) == ["BB", "CC"]
+
+
+async def test_listener_stats_mode_redraws_table():
+    """Test --stats replaces per-packet output with a throttled device table."""
+    BurstScanner.adverts = [advert("AA:BB")] * 30 + [advert("CC:DD", "Other")] * 5
+    stream = io.StringIO()
+    stats = await listen_to_broadcasts(
+        timeout=0.05,
+        name_filter="",
+        verbose=False,
+        show_manufacturer_data=False,
+        scanner=SharedScanner(BurstScanner),
+        stream=stream,
+        show_stats=True,
+        top=5,
+        refresh=0.02,
+    )
+    output = stream.getvalue()
+    assert "Device:" not in output
+    assert output.count("ADDRESS") >= 2  # redrawn, plus the final table
+    assert stats["received"] == 35 and stats["devices"] == 2 and stats["shown"] == 0
+    args = create_parser().parse_args(["--stats", "--top", "3", "--refresh", "2"])
+    assert (args.stats, args.top, args.refresh, args.window) == (True, 3, 2.0, 10.0)
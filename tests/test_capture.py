@@ -0,0 +1,132 @@
+import logging
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from core.capture import (
+    ADVERTISEMENT,
+    NOTIFICATION,
+    WRITE,
+    CaptureReader,
+    CaptureRecord,
+    CaptureWriter,
+    replay,
+)
+from core.frames import motor_speed_frame, sound_frame
+from core.rules import RuleEngine, default_rules
+from core.toothbrush_router import ToothbrushRouter
+from core.train_controller import TrainController
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# Hub attached IO: port 1 detached
+DETACH = b"\x05\x00\x04\x01\x00"
+
+
+def brush(code: int, pressure: int = 0) -> bytes:
+    return b"\x062k" + bytes([code, pressure]) + b"\x00\x03\x02\x09\x00\x04"
+
+
+def test_round_trip(tmp_path):
+    """Test records read back with their offsets, sources and payloads."""
+    path = tmp_path / "capture.dcap"
+    clock = Clock()
+    with CaptureWriter(path, clock=clock) as writer:
+        writer.advertisement("AA:BB", 220, b"\x01\x02")
+        clock.now += 0.5
+        writer.notification("CC:DD", b"\x05\x00\x04", handle=14)
+        writer.write("CC:DD", b"")
+    with CaptureReader(path) as reader:
+        records = list(reader)
+    assert records == [
+        CaptureRecord(0.0, ADVERTISEMENT, "AA:BB", 220, b"\x01\x02"),
+        CaptureRecord(0.5, NOTIFICATION, "CC:DD", 14, b"\x05\x00\x04"),
+        CaptureRecord(0.5, WRITE, "CC:DD", 0, b""),
+    ]
+
+
+def test_truncated_record_is_skipped(tmp_path, caplog):
+    """Test a record cut short at the end of the file ends iteration."""
+    path = tmp_path / "capture.dcap"
+    with CaptureWriter(path) as writer:
+        writer.advertisement("AA", 220, b"\x01")
+        writer.advertisement("AA", 220, b"\x02\x03")
+    path.write_bytes(path.read_bytes()[:-1])
+    with caplog.at_level(logging.WARNING), CaptureReader(path) as reader:
+        assert [r.payload for r in reader] == [b"\x01"]
+    assert "truncated" in caplog.text
+
+
+@pytest.mark.parametrize("content", [b"", b"NOPE" + bytes(12)])
+def test_rejects_non_capture_files(tmp_path, content):
+    """Test files without the capture header are refused."""
+    path = tmp_path / "other.bin"
+    path.write_bytes(content)
+    with pytest.raises(ValueError):
+        CaptureReader(path)
+
+
+async def test_controller_records_notifications_and_writes(tmp_path):
+    """Test the controller hook logs incoming notifications and outgoing frames."""
+    client = Mock(address="CC:DD", write_gatt_char=AsyncMock())
+    controller = TrainController(client)
+    path = tmp_path / "capture.dcap"
+    with CaptureWriter(path) as writer:
+        controller.start_recording(writer)
+        controller.handle_notification(Mock(handle=14), bytearray(DETACH))
+        frame = motor_speed_frame(0, 50)
+        await controller.send_frame(frame)
+        controller.stop_recording()
+        await controller.send_frame(frame)
+    with CaptureReader(path) as reader:
+        records = [(r.kind, r.source, r.channel, r.payload) for r in reader]
+    assert records == [
+        (NOTIFICATION, "CC:DD", 14, DETACH),
+        (WRITE, "CC:DD", 0, frame),
+    ]
+
+
+async def test_replay_through_rules(tmp_path):
+    """Test a capture replays through the real decoder, router and rules."""
+    path = tmp_path / "capture.dcap"
+    clock = Clock()
+    with CaptureWriter(path, clock=clock) as writer:
+        for code, pressure in [(2, 0), (3, 0), (3, 4), (2, 0)]:
+            writer.advertisement("AA", 220, brush(code, pressure))
+            clock.now += 0.01
+    train = AsyncMock()
+    router = ToothbrushRouter(
+        {}, RuleEngine(default_rules(40, 9)).reaction(verbose=False), default=train
+    )
+    with CaptureReader(path) as reader:
+        result = await replay(
+            reader,
+            {ADVERTISEMENT: lambda r: router.handle_advertisement(r.source, r.payload)},
+            speed=None,
+        )
+    await router.join()
+    await router.stop()
+    assert result.records == 4
+    assert [c.args[0] for c in train.send_frame.await_args_list] == [
+        motor_speed_frame(0, 40),
+        sound_frame(1, 9),
+        motor_speed_frame(0, 0),
+    ]
+
+
+async def test_replay_honours_speed():
+    """Test timed replay waits for record offsets scaled by the speed."""
+    records = [CaptureRecord(t, ADVERTISEMENT, "AA", 0, b"") for t in (0.0, 0.2)]
+    handler = AsyncMock()
+    result = await replay(records, {ADVERTISEMENT: handler, WRITE: None}, speed=4.0)
+    assert handler.await_count == 2
+    assert 0.05 <= result.elapsed < 0.2
+    fast = await replay(records, {ADVERTISEMENT: handler}, speed=0)
+    assert fast.elapsed < 0.05
@@ -103,4 +103,111 @@ async def test_demo_train_control_device_not_found(mock_find_train):
             sound_id=5,
             color_id=3,
             run_time=5.0
-        )
\ No newline at end of file
+        )
+
+
+@pytest.mark.asyncio
+@patch("duplo.cli.demo.DaemonClient")
+@patch("duplo.cli.demo.asyncio.sleep", new_callable=AsyncMock)
+async def test_demo_train_control_through_daemon(mock_sleep, mock_daemon_client):
+    """Test that the demo sends commands through the daemon when asked."""
+    train = Mock()
+    for method in [
+        "setup_port_input_format",
+        "play_sound",
+        "set_light_color",
+        "set_motor_speed",
+    ]:
+        setattr(train, method, AsyncMock())
+    daemon = Mock()
+    daemon.train.return_value = train
+    mock_daemon_client.return_value.__aenter__ = AsyncMock(return_value=daemon)
+    mock_daemon_client.return_value.__aexit__ = AsyncMock()
+
+    await demo_train_control(
+        device_name="Test Train",
+        timeout=30.0,
+        speed=50,
+        sound_id=5,
+        color_id=3,
+        run_time=5.0,
+        daemon_socket="/tmp/duplo.sock",
+    )
+
+    daemon.train.assert_called_once_with("Test Train")
+    train.set_motor_speed.assert_any_call(port_id=0, speed=50)
+    train.set_motor_speed.assert_any_call(port_id=0, speed=0)
+
+
+@pytest.mark.asyncio
+@patch("duplo.cli.demo.DaemonClient")
+@patch("duplo.cli.demo.asyncio.sleep", new_callable=AsyncMock)
+async def test_demo_ramps_speed_with_motion_profiles(mock_sleep, mock_daemon_client):
+    """Test that --ramp streams precomputed frames instead of jumping to speed."""
+    train = Mock()
+    for method in [
+        "setup_port_input_format",
+        "play_sound",
+        "set_light_color",
+        "set_motor_speed",
+        "send_frame",
+    ]:
+        setattr(train, method, AsyncMock())
+    daemon = Mock()
+    daemon.train.return_value = train
+    mock_daemon_client.return_value.__aenter__ = AsyncMock(return_value=daemon)
+    mock_daemon_client.return_value.__aexit__ = AsyncMock()
+
+    await demo_train_control(
+        device_name="Test Train",
+        timeout=30.0,
+        speed=50,
+        sound_id=5,
+        color_id=3,
+        run_time=5.0,
+        daemon_socket="/tmp/duplo.sock",
+        ramp=0.5,
+    )
+
+    assert demo_parser().parse_args(["--ramp", "2"]).ramp == 2.0
+    train.set_motor_speed.assert_not_called()
+    frames = [call.args[0] for call in train.send_frame.await_args_list]
+    assert frames[0][-1] < 50 and frames[-1][-1] == 0
+    assert bytes([8, 0, 0x81, 0, 0x11, 0x51, 0, 50]) in frames
+
+
+@pytest.mark.asyncio
+@patch("duplo.cli.demo.DaemonClient")
+async def test_demo_plays_timeline_file(mock_daemon_client, tmp_path):
+    """Test that --timeline replaces the built-in sequence with timed frames."""
+    path = tmp_path / "show.json"
+    path.write_text(
+        '[{"at": 0, "action": "play_sound", "value": 9},'
+        ' {"at": 0.01, "action": "set_motor_speed", "value": 0}]'
+    )
+    train = Mock()
+    for method in ["setup_port_input_format", "set_motor_speed", "send_frame"]:
+        setattr(train, method, AsyncMock())
+    daemon = Mock()
+    daemon.train.return_value = train
+    mock_daemon_client.return_value.__aenter__ = AsyncMock(return_value=daemon)
+    mock_daemon_client.return_value.__aexit__ = AsyncMock()
+
+    await demo_train_control(
+        device_name="Test Train",
+        timeout=30.0,
+        speed=50,
+        sound_id=5,
+        color_id=3,
+        run_time=5.0,
+        daemon_socket="/tmp/duplo.sock",
+        timeline_path=path,
+    )
+
+    assert demo_parser().parse_args(["--timeline", "t.json"]).timeline.name == "t.json"
+    train.set_motor_speed.assert_not_called()
+    frames = [call.args[0] for call in train.send_frame.await_args_list]
+    assert frames == [
+        bytes([8, 0, 0x81, 1, 0x11, 0x51, 1, 9]),
+        bytes([8, 0, 0x81, 0, 0x11, 0x51, 0, 0]),
+    ]
@@ -0,0 +1,186 @@
+"""Test the warm connection pool."""
+
+import asyncio
+import time
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from core.frames import motor_speed_frame
+from duplo.api import EnhancedTrainController, train_connection
+from services.connection_pool import ConnectionPool
+
+CONNECT_LATENCY = 0.05
+
+
+class FakeServices:
+    def __init__(self):
+        self.lookups = 0
+
+    def get_characteristic(self, uuid):
+        self.lookups += 1
+        return Mock(uuid=str(uuid), handle=14)
+
+
+class SlowClient:
+    """Stands in for BleakClient; connecting takes ``CONNECT_LATENCY``."""
+
+    instances: list["SlowClient"] = []
+
+    def __init__(self, device):
+        self.address = device if isinstance(device, str) else device.address
+        self.services = FakeServices()
+        self.is_connected = False
+        self.notifying = 0
+        self.written: list[tuple[object, bytes]] = []
+        self.disconnects = 0
+        SlowClient.instances.append(self)
+
+    async def __aenter__(self):
+        await asyncio.sleep(CONNECT_LATENCY)
+        self.is_connected = True
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.is_connected = False
+        self.disconnects += 1
+
+    async def start_notify(self, char, callback):
+        self.notifying += 1
+
+    async def write_gatt_char(self, char, data, response=False):
+        self.written.append((char, bytes(data)))
+
+
+@pytest.fixture
+def fake_find():
+    SlowClient.instances = []
+    return AsyncMock(return_value=Mock(address="AA:BB"))
+
+
+async def test_reentry_reuses_the_warm_connection(fake_find):
+    """Test re-entering a pooled train skips connecting and setup."""
+    pool = ConnectionPool(
+        client_factory=SlowClient,
+        controller_factory=EnhancedTrainController,
+        find=fake_find,
+    )
+    async with pool:
+        start = time.perf_counter()
+        async with train_connection("Train Base", pool=pool) as train:
+            await train.set_motor_speed(0, 30)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for speed in (40, 50, 0):
+            async with train_connection("Train Base", pool=pool) as again:
+                await again.set_motor_speed(0, speed)
+        warm = (time.perf_counter() - start) / 3
+
+        assert again is train
+        assert cold >= CONNECT_LATENCY
+        assert warm < cold / 10
+        assert pool.stats() == {
+            "connections": 1,
+            "leased": 0,
+            "hits": 3,
+            "misses": 1,
+            "evicted": 0,
+        }
+
+    (client,) = SlowClient.instances
+    fake_find.assert_awaited_once()
+    assert client.notifying == 1 and client.services.lookups == 1
+    assert client.disconnects == 1
+    char, frame = client.written[-1]
+    assert char.handle == 14 and frame == motor_speed_frame(0, 0)
+
+
+async def test_idle_and_dropped_connections_are_replaced(fake_find):
+    """Test idle connections are evicted and dropped ones reconnected."""
+    now = [0.0]
+    pool = ConnectionPool(
+        idle_timeout=10.0,
+        client_factory=SlowClient,
+        find=fake_find,
+        clock=lambda: now[0],
+    )
+    async with pool.lease("Train Base") as controller:
+        assert pool.get("AA:BB").controller is controller
+        now[0] = 100.0
+        assert await pool.evict_idle() == 0  # leased connections stay
+
+    now[0] = 105.0
+    assert await pool.evict_idle() == 0
+    now[0] = 110.0
+    assert await pool.evict_idle() == 1
+    assert len(pool) == 0 and SlowClient.instances[0].disconnects == 1
+
+    async with pool.lease("Train Base"):
+        pass
+    SlowClient.instances[1].is_connected = False
+    async with pool.lease("Train Base"):
+        pass
+    assert len(SlowClient.instances) == 3 and pool.misses == 3
+    await pool.close()
+    assert all(not client.is_connected for client in SlowClient.instances)
+
+
+async def test_concurrent_leases_share_one_connect(fake_find):
+    """Test simultaneous first leases of a train connect only once."""
+    pool = ConnectionPool(client_factory=SlowClient, find=fake_find)
+
+    async def use():
+        async with pool.lease("Train Base") as controller:
+            return controller
+
+    first, second = await asyncio.gather(use(), use())
+    assert first is second and len(SlowClient.instances) == 1
+
+    fake_find.return_value = None
+    with pytest.raises(ConnectionError, match="Train 'Other' not found"):
+        async with pool.lease("Other", timeout=1.0):
+            pass
+    await pool.close()
+
+
+class SlowExitClient(SlowClient):
+    """Disconnecting also takes ``CONNECT_LATENCY``."""
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.sleep(CONNECT_LATENCY)
+        await super().__aexit__(*exc_info)
+
+
+async def test_eviction_never_closes_a_new_lease():
+    """Test a lease taken while idle connections are closing gets a live one."""
+    SlowClient.instances = []
+    now = [0.0]
+    pool = ConnectionPool(
+        idle_timeout=10.0,
+        client_factory=SlowExitClient,
+        find=AsyncMock(side_effect=lambda name, timeout: Mock(address=name)),
+        clock=lambda: now[0],
+    )
+    for name in ("A", "B"):
+        async with pool.lease(name):
+            pass
+    now[0] = 20.0
+    evicting = asyncio.create_task(pool.evict_idle())
+    await asyncio.sleep(0)  # Disconnecting the first expired connection
+    async with pool.lease("B") as controller:
+        assert await evicting == 2
+        assert controller.client.is_connected
+        assert pool.get("B").controller is controller
+    assert pool.evicted == 2 and len(SlowClient.instances) == 3
+    await pool.close()
+
+
+async def test_train_connection_reuses_its_controller(fake_find):
+    """Test pooled blocks share one enhanced controller, keeping its speed."""
+    async with ConnectionPool(client_factory=SlowClient, find=fake_find) as pool:
+        async with train_connection("Train Base", pool=pool) as train:
+            await train.set_motor_speed("motor", 40)
+        async with train_connection("Train Base", pool=pool) as again:
+            assert again is train and again.speed == 40
+        assert pool.stats()["leased"] == 0
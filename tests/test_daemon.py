@@ -0,0 +1,145 @@
+"""Test the connection daemon and its socket protocol."""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from core.frames import motor_speed_frame, sound_frame
+from services.daemon import DaemonClient, DaemonError, TrainDaemon
+
+
+class FakeClient:
+    """Stands in for BleakClient, recording every frame written to the hub."""
+
+    instances: list["FakeClient"] = []
+
+    def __init__(self, device, disconnected_callback=None):
+        self.address = device if isinstance(device, str) else device.address
+        self.disconnected_callback = disconnected_callback
+        self.frames: list[bytes] = []
+        FakeClient.instances.append(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def start_notify(self, char_uuid, callback):
+        pass
+
+    async def write_gatt_char(self, char_uuid, data, response=False):
+        self.frames.append(bytes(data))
+
+    def drop(self):
+        self.disconnected_callback(self)
+
+
+@pytest.fixture
+def fake_find():
+    FakeClient.instances = []
+    return AsyncMock(return_value=Mock(address="AA:BB"))
+
+
+@pytest.mark.asyncio
+async def test_commands_reach_connected_train(tmp_path, fake_find):
+    """Test that CLI-side commands are written by the daemon's connection."""
+    socket_path = tmp_path / "daemon.sock"
+    daemon = TrainDaemon(socket_path, client_factory=FakeClient, find=fake_find)
+
+    async with daemon, DaemonClient(socket_path) as client:
+        train = client.train("Train Base")
+        await train.set_motor_speed(0, 50)
+        await train.play_sound(1, 9)
+        await train.send_frame(motor_speed_frame(0, 0))
+        assert await client.status() == {"Train Base": True}
+
+    assert FakeClient.instances[0].frames == [
+        motor_speed_frame(0, 50),
+        sound_frame(1, 9),
+        motor_speed_frame(0, 0),
+    ]
+    fake_find.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_connection_is_reused_across_clients(tmp_path, fake_find):
+    """Test that later CLI invocations skip discovery and connecting."""
+    socket_path = tmp_path / "daemon.sock"
+    async with TrainDaemon(
+        socket_path, trains=("Train Base",), client_factory=FakeClient, find=fake_find
+    ):
+        for speed in (10, 20, 30):
+            async with DaemonClient(socket_path) as client:
+                await client.train().set_motor_speed(0, speed)
+
+    assert len(FakeClient.instances) == 1
+    assert len(FakeClient.instances[0].frames) == 3
+
+
+@pytest.mark.asyncio
+async def test_reconnects_after_disconnect(tmp_path, fake_find):
+    """Test that a dropped hub is reconnected with backoff."""
+    socket_path = tmp_path / "daemon.sock"
+    daemon = TrainDaemon(
+        socket_path, client_factory=FakeClient, find=fake_find, backoff_initial=0.01
+    )
+    async with daemon, DaemonClient(socket_path) as client:
+        await client.train().set_motor_speed(0, 50)
+        FakeClient.instances[0].drop()
+        await asyncio.sleep(0.05)
+        await client.train().set_motor_speed(0, 0)
+        assert daemon.trains["Train Base"].connects == 2
+
+    assert FakeClient.instances[1].frames == [motor_speed_frame(0, 0)]
+
+
+@pytest.mark.asyncio
+async def test_errors_are_reported_to_client(tmp_path, fake_find):
+    """Test that unknown commands and missing trains come back as errors."""
+    socket_path = tmp_path / "daemon.sock"
+    fake_find.return_value = None
+    daemon = TrainDaemon(
+        socket_path, timeout=0.05, client_factory=FakeClient, find=fake_find
+    )
+    async with daemon, DaemonClient(socket_path) as client:
+        with pytest.raises(DaemonError, match="Unknown command"):
+            await client.request({"command": "self_destruct"})
+        with pytest.raises(DaemonError, match="TimeoutError"):
+            await client.train("Missing").set_motor_speed(0, 50)
+
+
+@pytest.mark.asyncio
+async def test_unknown_trains_stop_scanning(tmp_path, fake_find):
+    """Test a misspelt train is given up on instead of scanned for forever."""
+    socket_path = tmp_path / "daemon.sock"
+    scanning = 0
+    overlapped = False
+
+    async def find(name, timeout):
+        nonlocal scanning, overlapped
+        scanning += 1
+        overlapped = overlapped or scanning > 1
+        await asyncio.sleep(0.01)
+        scanning -= 1
+        return None
+
+    daemon = TrainDaemon(
+        socket_path,
+        trains=("Train Base",),
+        timeout=1.0,
+        client_factory=FakeClient,
+        find=find,
+        backoff_initial=0.01,
+        on_demand_attempts=2,
+    )
+    async with daemon, DaemonClient(socket_path) as client:
+        with pytest.raises(DaemonError, match="not found after 2 attempts"):
+            await client.train("Trian Base").set_motor_speed(0, 50)
+        await asyncio.sleep(0.05)
+        assert daemon.trains["Trian Base"].gave_up
+        assert daemon.trains["Trian Base"].failures == 2
+        assert not daemon.trains["Train Base"].gave_up
+
+    assert not overlapped
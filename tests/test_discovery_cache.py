@@ -0,0 +1,174 @@
+"""Test the discovery cache and direct connect by address."""
+
+from contextlib import AsyncExitStack
+
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+
+from core.discovery_cache import DiscoveryCache
+from core.train_controller import TrainController, connect_train, find_train
+from duplo.api import train_connection
+
+
+def make_client_factory(failing_addresses=()):
+    """Return a BleakClient stand-in that fails to connect to some addresses."""
+    created = []
+
+    def factory(device):
+        address = device if isinstance(device, str) else device.address
+        client = Mock(address=address)
+        client.start_notify = AsyncMock()
+        client.write_gatt_char = AsyncMock()
+        client.__aenter__ = AsyncMock(
+            side_effect=OSError("unreachable")
+            if address in failing_addresses
+            else None,
+            return_value=client,
+        )
+        client.__aexit__ = AsyncMock()
+        created.append(address)
+        return client
+
+    factory.created = created
+    return factory
+
+
+def test_cache_persists_and_counts(tmp_path):
+    """Test recording, lookups, stats and reloading from disk."""
+    path = tmp_path / "discovery.json"
+    cache = DiscoveryCache(path, ttl=60)
+    assert cache.lookup("Train Base") is None
+
+    cache.record("Train Base", "AA:BB", {0: 0x29, 17: 0x17})
+    entry = DiscoveryCache(path, ttl=60).lookup("Train Base")
+    assert entry.address == "AA:BB"
+    assert entry.attached_io == {0: 0x29, 17: 0x17}
+
+    assert cache.lookup("Train Base").address == "AA:BB"
+    assert cache.stats() == {"hits": 1, "misses": 1, "invalidations": 0, "entries": 1}
+
+
+def test_cache_keeps_layout_for_same_address(tmp_path):
+    """Test that refreshing an entry keeps the known IO layout."""
+    cache = DiscoveryCache(tmp_path / "discovery.json", ttl=60)
+    cache.record("Train Base", "AA:BB", {0: 0x29})
+    assert cache.record("Train Base", "AA:BB").attached_io == {0: 0x29}
+    assert cache.record("Train Base", "CC:DD").attached_io == {}
+
+
+def test_cache_ttl_and_invalidation(tmp_path):
+    """Test that stale and invalidated entries are misses."""
+    cache = DiscoveryCache(tmp_path / "discovery.json", ttl=0)
+    cache.record("Train Base", "AA:BB")
+    assert cache.lookup("Train Base") is None
+
+    cache.ttl = 60
+    cache.invalidate("Train Base")
+    assert cache.lookup("Train Base") is None
+    assert cache.invalidations == 1
+
+
+def test_unreadable_cache_is_empty(tmp_path):
+    """Test that a corrupt cache file does not break discovery."""
+    path = tmp_path / "discovery.json"
+    path.write_text("{not json")
+    assert DiscoveryCache(path, ttl=60).lookup("Train Base") is None
+
+
+@pytest.mark.asyncio
+async def test_find_train_returns_cached_address(tmp_path):
+    """Test that a cache hit skips scanning."""
+    cache = DiscoveryCache(tmp_path / "discovery.json", ttl=60)
+    cache.record("Train Base", "AA:BB")
+    with patch("core.train_controller.BleakScanner") as mock_scanner:
+        assert await find_train("Train Base", cache=cache) == "AA:BB"
+    mock_scanner.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_connect_train_uses_cache_then_falls_back(tmp_path):
+    """Test direct connect on a hit, and invalidate-and-scan when it fails."""
+    cache = DiscoveryCache(tmp_path / "discovery.json", ttl=60)
+    cache.record("Train Base", "OLD")
+    find = AsyncMock(return_value=Mock(address="NEW"))
+    factory = make_client_factory(failing_addresses={"OLD"})
+
+    async with AsyncExitStack() as stack:
+        client = await connect_train(
+            stack, "Train Base", cache=cache, find=find, client_factory=factory
+        )
+    assert client.address == "NEW"
+    assert factory.created == ["OLD", "NEW"]
+    find.assert_awaited_once_with("Train Base", timeout=30.0)
+    assert cache.lookup("Train Base").address == "NEW"
+
+    find.reset_mock()
+    async with AsyncExitStack() as stack:
+        client = await connect_train(
+            stack, "Train Base", cache=cache, find=find, client_factory=factory
+        )
+    assert client.address == "NEW"
+    find.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_connect_train_records_bare_address(tmp_path):
+    """Test a finder returning an address string, not a device, is cached."""
+    cache = DiscoveryCache(tmp_path / "discovery.json", ttl=60)
+    find = AsyncMock(return_value="AA:BB")
+    factory = make_client_factory()
+
+    async with AsyncExitStack() as stack:
+        client = await connect_train(
+            stack, "Train Base", cache=cache, find=find, client_factory=factory
+        )
+    assert client.address == "AA:BB"
+    assert cache.lookup("Train Base").address == "AA:BB"
+
+
+def test_controller_tracks_attached_io():
+    """Test that attach and detach notifications update the IO layout."""
+    controller = TrainController(Mock())
+    controller.handle_notification(None, bytearray.fromhex("090004000129000102"))
+    controller.handle_notification(None, bytearray.fromhex("090004110117000102"))
+    controller.handle_notification(None, bytearray.fromhex("0500041100"))
+    assert controller.attached_io == {0: 0x29}
+
+
+@pytest.mark.asyncio
+@patch("duplo.api.find_train")
+@patch("duplo.api.BleakClient")
+async def test_train_connection_records_layout(
+    mock_bleak_client, mock_find_train, tmp_path
+):
+    """Test that train_connection caches the address and attached IO."""
+    cache = DiscoveryCache(tmp_path / "discovery.json", ttl=60)
+    mock_find_train.return_value = Mock(address="AA:BB")
+    mock_bleak_client.side_effect = make_client_factory()
+
+    async with train_connection("Train Base", cache=cache) as train:
+        train.handle_notification(None, bytearray.fromhex("090004000129000102"))
+
+    entry = cache.lookup("Train Base")
+    assert entry.address == "AA:BB"
+    assert entry.attached_io == {0: 0x29}
+
+
+@pytest.mark.asyncio
+@patch("duplo.api.find_train")
+@patch("duplo.api.BleakClient")
+async def test_train_connection_seeds_cached_layout(
+    mock_bleak_client, mock_find_train, tmp_path
+):
+    """Test a cache hit assumes the cached IO layout until the hub reports."""
+    cache = DiscoveryCache(tmp_path / "discovery.json", ttl=60)
+    cache.record("Train Base", "AA:BB", {0: 0x29, 3: 0x17})
+    mock_bleak_client.side_effect = make_client_factory()
+
+    async with train_connection("Train Base", cache=cache) as train:
+        assert train.ports.resolve("light") == 3
+        train.handle_notification(None, bytearray.fromhex("090004110117000102"))
+        assert train.ports.resolve("light") == 17
+    mock_find_train.assert_not_awaited()
+    assert cache.layout("Train Base", "AA:BB") == {17: 0x17}
+    assert cache.layout("Train Base", "CC:DD") == {}
@@ -0,0 +1,148 @@
+"""Test the fast hub message decoders against the construct parsers."""
+
+import pytest
+
+from core.train_controller import decode_notification, notification_handler
+from protocols.ble_duplo_train import (
+    common_message_header,
+    generic_error_message,
+    hub_attached_io_message_format,
+    port_information_request_format,
+    port_input_format_setup_single_format,
+    port_output_command,
+    port_output_command_feedback,
+    port_value_single,
+)
+from protocols.duplo_train_decoder import (
+    ERROR_CODE_NAMES,
+    IO_TYPE_NAMES,
+    MESSAGE_TYPE_NAMES,
+    GenericErrorMessage,
+    HubAttachedIo,
+    PortInformationRequest,
+    PortInputFormat,
+    PortOutputCommand,
+    PortOutputCommandFeedback,
+    PortValueSingle,
+    decode_header,
+    decode_message,
+)
+
+
+def as_int(value):
+    """Return the integer behind a construct Enum value."""
+    return getattr(value, "intvalue", value)
+
+
+HUB_ATTACHED_IO = bytes.fromhex("0900040101290001") + b"\x02"
+GENERIC_ERROR = bytes.fromhex("0500058106")
+PORT_INFORMATION_REQUEST = bytes.fromhex("0500210101")
+PORT_INPUT_FORMAT = bytes.fromhex("0a004701010100000001")
+PORT_VALUE = bytes.fromhex("060045130af0")
+PORT_OUTPUT_COMMAND = bytes.fromhex("0800810011510032")
+PORT_OUTPUT_COMMAND_FEEDBACK = bytes.fromhex("0500820a0a")
+
+
+def test_header_matches_construct():
+    """Test the header decoder."""
+    expected = common_message_header.parse(PORT_VALUE)
+    header = decode_header(memoryview(PORT_VALUE))
+    assert header.length == expected.length
+    assert header.hub_id == expected.hub_id
+    assert MESSAGE_TYPE_NAMES[header.message_type] == expected.message_type
+
+
+def test_hub_attached_io_matches_construct():
+    """Test the attached IO decoder, including enum names."""
+    expected = hub_attached_io_message_format.parse(HUB_ATTACHED_IO)
+    record = decode_message(HUB_ATTACHED_IO)
+    assert isinstance(record, HubAttachedIo)
+    assert record.port_id == expected.port_id
+    assert record.event == as_int(expected.event)
+    assert record.io_type == as_int(expected.io_type)
+    assert IO_TYPE_NAMES[record.io_type] == expected.io_type == "duplo_train_motor"
+    assert record.hardware_revision == expected.hardware_revision
+    assert record.software_revision == expected.software_revision
+
+
+def test_hub_detached_io_without_io_type():
+    """Test that short detach messages decode instead of raising."""
+    record = decode_message(bytes.fromhex("0500041100"))
+    assert record == HubAttachedIo(17, 0, None, None, None)
+
+
+def test_generic_error_matches_construct():
+    """Test the generic error decoder."""
+    expected = generic_error_message.parse(GENERIC_ERROR)
+    record = decode_message(GENERIC_ERROR)
+    assert isinstance(record, GenericErrorMessage)
+    assert record.command_type == expected.command_type
+    assert ERROR_CODE_NAMES[record.error_code] == expected.error_code
+
+
+def test_port_information_request_matches_construct():
+    """Test the port information request decoder."""
+    expected = port_information_request_format.parse(PORT_INFORMATION_REQUEST)
+    record = decode_message(PORT_INFORMATION_REQUEST)
+    assert isinstance(record, PortInformationRequest)
+    assert record.port_id == expected.port_id
+    assert record.information_type == as_int(expected.information_type)
+
+
+def test_port_input_format_matches_construct():
+    """Test the input format decoder for the hub's echo."""
+    expected = port_input_format_setup_single_format.parse(PORT_INPUT_FORMAT)
+    record = decode_message(PORT_INPUT_FORMAT)
+    assert isinstance(record, PortInputFormat)
+    assert record.port_id == expected.port_id
+    assert record.mode == expected.mode
+    assert record.delta_interval == expected.delta_interval
+    assert record.notification_enabled == expected.notification_enabled
+
+
+def test_port_value_single_matches_construct():
+    """Test the port value decoder from a memoryview."""
+    expected = port_value_single.parse(PORT_VALUE)
+    record = decode_message(memoryview(PORT_VALUE))
+    assert isinstance(record, PortValueSingle)
+    assert record.port_id == expected.port_id
+    assert record.value == expected.value
+
+
+def test_port_output_command_matches_construct():
+    """Test the output command decoder."""
+    expected = port_output_command.parse(PORT_OUTPUT_COMMAND)
+    record = decode_message(PORT_OUTPUT_COMMAND)
+    assert isinstance(record, PortOutputCommand)
+    assert record.port_id == expected.port_id
+    assert record.startup == expected.startup_and_completion_information.startup
+    assert record.completion == expected.startup_and_completion_information.completion
+    assert record.sub_command == expected.sub_command
+    assert record.payload == expected.payload
+
+
+def test_port_output_command_feedback_matches_construct():
+    """Test the output command feedback decoder."""
+    expected = port_output_command_feedback.parse(PORT_OUTPUT_COMMAND_FEEDBACK)
+    record = decode_message(PORT_OUTPUT_COMMAND_FEEDBACK)
+    assert isinstance(record, PortOutputCommandFeedback)
+    assert record.port_id == expected.port_id
+    assert record.port_feedback_message == expected.port_feedback_message
+
+
+def test_unknown_message_type():
+    """Test that unhandled message types decode to None."""
+    assert decode_message(bytes.fromhex("05000201ff")) is None
+
+
+def test_truncated_message_raises():
+    """Test that truncated messages are rejected."""
+    with pytest.raises(Exception):
+        decode_message(bytes.fromhex("050082"))
+
+
+def test_decode_notification_returns_record():
+    """Test notifications decode without printing; the callback returns None."""
+    record = decode_notification(bytearray(PORT_OUTPUT_COMMAND_FEEDBACK))
+    assert record == PortOutputCommandFeedback(10, 10)
+    assert notification_handler(None, bytearray(PORT_OUTPUT_COMMAND_FEEDBACK)) is None
@@ -0,0 +1,134 @@
+"""Test the typed event bus and its per-subscriber policies."""
+
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from core.simulator import (
+    generic_error_message,
+    hub_attached_io_message,
+    port_output_command_feedback_message,
+    port_value_single_message,
+)
+from core.toothbrush_router import ToothbrushRouter
+from core.train_controller import TrainController
+from services.event_bus import (
+    BLOCK,
+    COALESCE_LATEST,
+    CommandFeedback,
+    Event,
+    EventBus,
+    HubAttached,
+    HubError,
+    PortValue,
+    ToothbrushStateChanged,
+)
+
+
+def drain(subscriber) -> list:
+    events = []
+    while subscriber:
+        events.append(subscriber.get_nowait())
+    return events
+
+
+def test_controller_messages_become_typed_events():
+    """Test decoded hub messages reach subscribers of their event type."""
+    bus = EventBus()
+    everything = bus.subscribe(name="log")
+    errors = bus.subscribe((HubError, CommandFeedback), name="errors")
+    controller = TrainController(Mock(address="AA:BB"))
+    bus.attach(controller)
+    for message in [
+        hub_attached_io_message(19, 0x2C),
+        port_value_single_message(19, b"\x05\x00"),
+        port_output_command_feedback_message(0, 0x0A),
+        generic_error_message(0x81, 0x06),
+    ]:
+        controller.handle_notification(None, bytearray(message))
+
+    attached, value, feedback, error = drain(everything)
+    assert isinstance(attached, HubAttached) and attached.attached
+    assert (value.source, value.port_id, value.value) == ("AA:BB", 19, b"\x05\x00")
+    assert feedback.flags == 0x0A and error.error_code == 0x06
+    assert drain(errors) == [feedback, error]
+    assert bus.published == 4
+
+
+def test_drop_oldest_and_coalesce_latest():
+    """Test full queues drop the oldest event or keep the latest per key."""
+    bus = EventBus()
+    recent = bus.subscribe(PortValue, maxsize=2, name="recent")
+    latest = bus.subscribe(PortValue, maxsize=4, policy=COALESCE_LATEST, name="latest")
+    for i in range(5):
+        bus.publish_nowait(PortValue("train", 19, bytes([i])))
+    bus.publish_nowait(PortValue("train", 20, b"\x09"))
+
+    assert [e.value for e in drain(recent)] == [b"\x04", b"\x09"]
+    assert [(e.port_id, e.value) for e in drain(latest)] == [
+        (19, b"\x04"),
+        (20, b"\x09"),
+    ]
+    stats = bus.stats()["subscribers"]
+    assert stats["recent"]["dropped"] == 4 and stats["recent"]["max_depth"] == 2
+    assert stats["latest"]["coalesced"] == 4 and stats["latest"]["dropped"] == 0
+    with pytest.raises(ValueError):
+        bus.subscribe(policy="spill")
+
+
+async def test_block_applies_backpressure_only_to_async_publishers():
+    """Test publish waits for a blocking subscriber while callbacks never do."""
+    bus = EventBus()
+    slow = bus.subscribe(HubError, maxsize=1, policy=BLOCK)
+    await bus.publish(HubError("train", 0x81, 1))
+    waiting = asyncio.create_task(bus.publish(HubError("train", 0x81, 2)))
+    await asyncio.sleep(0)
+    assert not waiting.done()
+
+    bus.publish_nowait(HubError("train", 0x81, 3))  # from a callback: dropped
+    assert slow.dropped == 1
+    assert (await slow.get()).error_code == 1
+    await waiting
+    assert (await slow.get()).error_code == 2
+
+
+async def test_slow_subscriber_does_not_stall_the_callback():
+    """Test publishing stays immediate while a consumer lags behind."""
+    bus = EventBus()
+    received = []
+
+    async def consume(subscriber):
+        async for event in subscriber:
+            received.append(event.value)
+            await asyncio.sleep(0.01)
+
+    slow = bus.subscribe(PortValue, maxsize=1, policy=COALESCE_LATEST)
+    consumer = asyncio.create_task(consume(slow))
+    controller = TrainController(Mock(address="AA"))
+    bus.attach(controller, source="Train Base")
+    for i in range(50):
+        message = port_value_single_message(19, bytes([i]))
+        controller.handle_notification(None, message)
+    await asyncio.sleep(0.02)
+    bus.unsubscribe(slow)
+    await consumer
+    assert received[-1] == bytes([49]) and len(received) < 5
+
+
+async def test_toothbrush_router_publishes_state_changes():
+    """Test the router's on_change hook publishes toothbrush events."""
+    bus = EventBus()
+    changes = bus.subscribe(ToothbrushStateChanged, policy=COALESCE_LATEST)
+    router = ToothbrushRouter(
+        {}, AsyncMock(), default=Mock(), on_change=bus.toothbrush_changed
+    )
+    idle = b"\x062k\x02\x00\x00\x03\x02\x09\x00\x04"
+    running = b"\x062k\x03\x00\x00\x03\x02\x09\x00\x04"
+    router.handle_advertisement("AA", idle)
+    router.handle_advertisement("AA", running)
+    await router.stop()
+    (event,) = drain(changes)
+    assert event.source == "AA" and event.previous.state == "idle"
+    assert event.current.state == "running"
+    assert isinstance(event, Event) and "ToothbrushStateChanged" in repr(event)
@@ -0,0 +1,120 @@
+"""Test the multi-train fleet API."""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, Mock, patch
+
+from duplo.fleet import Fleet, fleet_connection
+
+
+def make_client(fail_writes: bool = False) -> Mock:
+    client = Mock()
+    client.connect = AsyncMock()
+    client.disconnect = AsyncMock()
+    client.start_notify = AsyncMock()
+    client.write_gatt_char = AsyncMock(
+        side_effect=OSError("write failed") if fail_writes else None
+    )
+    return client
+
+
+@pytest.mark.asyncio
+@patch("duplo.fleet.find_trains")
+@patch("duplo.fleet.BleakClient")
+async def test_fleet_connects_and_fans_out(mock_bleak_client, mock_find_trains):
+    """Test that one scan finds every train and commands reach all of them."""
+    devices = [Mock(), Mock()]
+    clients = {id(devices[0]): make_client(), id(devices[1]): make_client()}
+    mock_find_trains.return_value = devices
+    mock_bleak_client.side_effect = lambda device: clients[id(device)]
+
+    async with fleet_connection(["Train Base", "Train Base"]) as fleet:
+        assert list(fleet) == ["Train Base", "Train Base#2"]
+        result = await fleet.set_motor_speed(0, 50)
+        assert result == {"Train Base": None, "Train Base#2": None}
+        await fleet.stop_all()
+
+    mock_find_trains.assert_called_once_with(["Train Base", "Train Base"], timeout=30.0)
+    for client in clients.values():
+        client.connect.assert_awaited_once()
+        client.start_notify.assert_awaited_once()
+        assert client.write_gatt_char.await_count == 2
+        client.disconnect.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+@patch("duplo.fleet.find_trains")
+async def test_fleet_missing_train_raises(mock_find_trains):
+    """Test that a missing train fails fast when all trains are required."""
+    mock_find_trains.return_value = [Mock(), None]
+
+    with pytest.raises(ConnectionError, match="Green"):
+        async with fleet_connection(["Red", "Green"]):
+            pass
+
+
+@pytest.mark.asyncio
+@patch("duplo.fleet.find_trains")
+@patch("duplo.fleet.BleakClient")
+async def test_fleet_continues_without_failed_trains(
+    mock_bleak_client, mock_find_trains
+):
+    """Test that connect failures are reported when not all trains are required."""
+    good, bad = make_client(), make_client()
+    bad.connect.side_effect = OSError("out of range")
+    mock_find_trains.return_value = [Mock(), Mock(), None]
+    mock_bleak_client.side_effect = [good, bad]
+
+    async with fleet_connection(["A", "B", "C"], require_all=False) as fleet:
+        assert list(fleet) == ["A"]
+        assert isinstance(fleet.connect_errors["B"], OSError)
+        assert isinstance(fleet.connect_errors["C"], ConnectionError)
+
+
+@pytest.mark.asyncio
+@patch("duplo.fleet.find_trains")
+@patch("duplo.fleet.BleakClient")
+async def test_fleet_cancelled_while_connecting_disconnects(
+    mock_bleak_client, mock_find_trains
+):
+    """Test that clients connected before a cancellation are disconnected."""
+    fast, slow = make_client(), make_client()
+
+    async def connect_slowly():
+        await asyncio.sleep(10)
+
+    slow.connect.side_effect = connect_slowly
+    mock_find_trains.return_value = [Mock(), Mock()]
+    mock_bleak_client.side_effect = [fast, slow]
+
+    async def use_fleet():
+        async with fleet_connection(["A", "B"]):
+            pass
+
+    task = asyncio.create_task(use_fleet())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    fast.disconnect.assert_awaited_once()
+    slow.disconnect.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_fleet_reports_per_train_failures():
+    """Test that one failing train neither raises nor delays the others."""
+
+    async def slow_write(*args):
+        await asyncio.sleep(0.05)
+
+    slow = Mock()
+    slow.set_motor_speed = AsyncMock(side_effect=slow_write)
+    broken = Mock()
+    broken.set_motor_speed = AsyncMock(side_effect=OSError("disconnected"))
+    fleet = Fleet({"slow": slow, "broken": broken})
+
+    result = await fleet.set_motor_speed(0, 30)
+
+    assert result["slow"] is None
+    assert isinstance(result["broken"], OSError)
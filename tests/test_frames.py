@@ -0,0 +1,120 @@
+"""Test the precomputed command frames."""
+
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from core.frames import (
+    SPEED_TABLE,
+    light_color_frame,
+    motor_speed_frame,
+    output_command_frame,
+    port_input_format_frame,
+    sound_frame,
+    speed_byte,
+)
+from core.train_controller import TrainController
+from protocols.ble_duplo_train import (
+    message_type,
+    port_input_format_setup_single_format,
+    port_output_command,
+)
+
+
+def construct_output_command(port_id: int, payload: bytes) -> bytes:
+    return port_output_command.build(
+        {
+            "header": {
+                "length": 8,
+                "hub_id": 0,
+                "message_type": message_type.port_output_command,
+            },
+            "port_id": port_id,
+            "startup_and_completion_information": {"startup": 1, "completion": 1},
+            "sub_command": 0x51,
+            "payload": payload,
+        }
+    )
+
+
+def reference_speed_to_val(speed: int) -> int:
+    if speed == 127:
+        return 127
+    if speed > 100:
+        speed = 100
+    if speed < 0:
+        speed = speed & 255
+    return speed
+
+
+def test_speed_table_matches_reference():
+    """Test the lookup table against the original conversion for all inputs."""
+    assert len(SPEED_TABLE) == 256
+    for speed in range(-300, 300):
+        assert speed_byte(speed) == reference_speed_to_val(speed)
+
+
+@pytest.mark.parametrize("port_id", [0, 1, 17, 50])
+def test_output_frames_match_construct(port_id):
+    """Test every value on the default and an uncached port is byte-identical."""
+    for value in range(256):
+        assert sound_frame(port_id, value) == construct_output_command(
+            port_id, bytes([1, value])
+        )
+        assert light_color_frame(port_id, value) == construct_output_command(
+            port_id, bytes([0, value])
+        )
+    for speed in range(-128, 128):
+        assert motor_speed_frame(port_id, speed) == construct_output_command(
+            port_id, bytes([0, reference_speed_to_val(speed)])
+        )
+
+
+@pytest.mark.parametrize("value", [-1, -256, 256])
+def test_output_frames_reject_out_of_range_ids(value):
+    """Test ids outside a byte raise instead of wrapping around the table."""
+    with pytest.raises(ValueError, match="out of range"):
+        sound_frame(1, value)
+    with pytest.raises(ValueError, match="out of range"):
+        light_color_frame(17, value)
+
+
+def test_output_frame_startup_and_completion():
+    """Test custom startup and completion nibbles land in the fifth byte."""
+    frame = output_command_frame(0, 0, 50, startup_and_completion=0x10)
+    parsed = port_output_command.parse(frame)
+    assert parsed.startup_and_completion_information.startup == 1
+    assert parsed.startup_and_completion_information.completion == 0
+
+
+def test_port_input_format_frame_matches_construct():
+    """Test the input format setup frame against the construct builder."""
+    expected = port_input_format_setup_single_format.build(
+        {
+            "header": {
+                "length": 10,
+                "hub_id": 0,
+                "message_type": message_type.port_input_format_setup_single,
+            },
+            "port_id": 1,
+            "mode": 1,
+            "delta_interval": 1,
+            "notification_enabled": 1,
+        }
+    )
+    assert port_input_format_frame(1, 1) == expected
+
+
+@pytest.mark.asyncio
+async def test_send_frame_writes_without_response():
+    """Test the send_frame fast path."""
+    mock_client = Mock()
+    mock_client.write_gatt_char = AsyncMock()
+    controller = TrainController(mock_client)
+
+    await controller.set_motor_speed(port_id=0, speed=-50)
+
+    mock_client.write_gatt_char.assert_called_once_with(
+        controller.config.CHAR_UUID,
+        construct_output_command(0, bytes([0, 206])),
+        response=False,
+    )
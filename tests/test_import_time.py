@@ -0,0 +1,116 @@
+"""Import-time budget for the CLI entry points.
+
+Each CLI entry point is run with ``--help`` in a fresh interpreter under
+``python -X importtime``. That path must not load BLE, protocol or settings
+code, and its cumulative import cost must stay within budget.
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CLI_MODULES = [
+    "duplo.cli.broadcast",
+    "duplo.cli.daemon",
+    "duplo.cli.demo",
+    "duplo.cli.listen_toothbrush",
+    "duplo.cli.toothbrush",
+]
+
+# Eagerly importing bleak, construct and pydantic cost ~380 ms before lazy loading
+IMPORT_BUDGET_US = 150_000
+
+HEAVY_PACKAGES = {
+    "asyncio",
+    "bleak",
+    "construct",
+    "pydantic",
+    "pydantic_settings",
+    "protocols",
+    "services",
+}
+
+
+# Runs a CLI's main() as its console script would, then lists what was imported
+HELP_SCRIPT = """
+import json
+import sys
+sys.argv = ["{module}", "--help"]
+import {module}
+try:
+    {module}.main()
+except SystemExit:
+    pass
+print(json.dumps(sorted(sys.modules)), file=sys.stderr)
+"""
+
+
+def run_profiled(code: str) -> subprocess.CompletedProcess[str]:
+    """Run ``code`` in a fresh interpreter under ``-X importtime``."""
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def import_profile(code: str) -> dict[str, int]:
+    """Run ``code`` under ``-X importtime`` and return cumulative us per module."""
+    return parse_profile(run_profiled(code).stderr)
+
+
+def parse_profile(stderr: str) -> dict[str, int]:
+    profile = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:") :].split("|")
+        profile[module.strip()] = int(cumulative)
+    return profile
+
+
+def is_heavy(name: str) -> bool:
+    return name.split(".")[0] in HEAVY_PACKAGES or name == "core.train_controller"
+
+
+@pytest.mark.parametrize("module", CLI_MODULES)
+def test_cli_help_import_budget(module):
+    """Test that ``--help`` exits before loading anything heavy."""
+    result = run_profiled(HELP_SCRIPT.format(module=module))
+    assert "usage:" in result.stdout
+
+    loaded = json.loads(result.stderr.splitlines()[-1])
+    assert module in loaded
+    assert [name for name in loaded if is_heavy(name)] == []
+    assert parse_profile(result.stderr)[module] < IMPORT_BUDGET_US
+
+
+def test_import_duplo_is_lazy():
+    """Test that importing the package defers the API until it is used."""
+    profile = import_profile("import duplo")
+    assert "bleak" not in profile
+    assert "duplo.api" not in profile
+    assert profile["duplo"] < IMPORT_BUDGET_US
+
+
+def test_lazy_names_resolve():
+    """Test that deferred names load on first access and are then cached."""
+    import core
+    import duplo
+    import protocols
+    from core.train_controller import TrainController
+    from protocols.ble_toothbrush import ToothbrushEvent
+
+    assert duplo.CoreTrainController is TrainController
+    assert core.TrainController is TrainController
+    assert protocols.ToothbrushEvent is ToothbrushEvent
+    assert "ToothbrushEvent" in vars(protocols)
+    with pytest.raises(AttributeError):
+        duplo.not_a_thing
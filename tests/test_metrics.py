@@ -0,0 +1,117 @@
+"""Test the latency histograms, their export and the pipeline instrumentation."""
+
+import asyncio
+import random
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from core.metrics import (
+    MAX_NANOSECONDS,
+    LatencyHistogram,
+    Metrics,
+    bucket_index,
+    bucket_upper_bound,
+)
+from core.rules import RuleEngine, default_rules
+from core.toothbrush_router import ToothbrushRouter
+from core.train_controller import TrainController
+
+
+def test_buckets_are_contiguous_and_precise():
+    """Test every value maps to a bucket whose bounds contain it within 6.25%."""
+    previous_upper = -1
+    for index in range(bucket_index(1 << 20)):
+        upper = bucket_upper_bound(index)
+        assert upper > previous_upper
+        assert bucket_index(previous_upper + 1) == index
+        assert bucket_index(upper) == index
+        assert (upper - previous_upper) <= max(1, (previous_upper + 1) / 16 + 1)
+        previous_upper = upper
+
+
+def test_percentiles_within_bucket_precision():
+    """Test percentiles are close to the exact order statistics."""
+    rng = random.Random(3)
+    values = sorted(int(rng.lognormvariate(13, 1)) for _ in range(10_000))
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    for quantile in (0.5, 0.9, 0.99):
+        exact = values[int(quantile * len(values)) - 1]
+        assert histogram.percentile(quantile) == pytest.approx(exact, rel=0.07)
+    assert histogram.percentile(1.0) == values[-1]
+    assert histogram.count == len(values)
+
+
+def test_out_of_range_values_are_clamped():
+    histogram = LatencyHistogram()
+    histogram.record(-5)
+    histogram.record(MAX_NANOSECONDS * 2)
+    assert histogram.min == 0 and histogram.max == MAX_NANOSECONDS
+
+
+def test_openmetrics_export(tmp_path):
+    """Test the text export has cumulative buckets, count, sum and quantiles."""
+    metrics = Metrics()
+    for microseconds in (1, 3, 30, 300):
+        metrics.record("decode", microseconds * 1000)
+    text = metrics.to_openmetrics()
+    assert text.endswith("# EOF\n")
+    assert 'duplo_stage_latency_seconds_bucket{stage="decode",le="5e-06"} 2' in text
+    assert 'duplo_stage_latency_seconds_bucket{stage="decode",le="+Inf"} 4' in text
+    assert 'duplo_stage_latency_seconds_count{stage="decode"} 4' in text
+    assert 'duplo_stage_latency_quantile_seconds{stage="decode",quantile="0.5"}' in text
+    path = tmp_path / "metrics.txt"
+    metrics.write_openmetrics(path)
+    assert path.read_text() == text
+
+
+async def test_http_endpoint_serves_metrics():
+    """Test the endpoint answers a scrape with the OpenMetrics text."""
+    metrics = Metrics()
+    metrics.record("write", 2_000_000)
+    async with metrics.exporting(port=0) as exported:
+        assert exported is metrics
+    server = await metrics.serve(port=0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    response = await reader.read()
+    writer.close()
+    server.close()
+    await server.wait_closed()
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert b"application/openmetrics-text" in response
+    assert response.endswith(b"# EOF\n")
+
+
+async def test_pipeline_records_every_stage():
+    """Test the router, rules and controller feed their stages."""
+    metrics = Metrics()
+    client = Mock(write_gatt_char=AsyncMock())
+    controller = TrainController(client)
+    controller.start_metrics(metrics)
+    engine = RuleEngine(default_rules())
+    router = ToothbrushRouter(
+        {},
+        engine.reaction(verbose=False, metrics=metrics),
+        default=controller,
+        metrics=metrics,
+    )
+    for code in (0x02, 0x03):
+        payload = b"\x062k" + bytes([code, 0]) + b"\x00\x03\x02\x09\x00\x04"
+        router.handle_advertisement("AA", payload)
+    await router.join()
+    await router.stop()
+    assert set(metrics.histograms) == {
+        "receive",
+        "decode",
+        "queue",
+        "rules",
+        "write",
+        "end_to_end",
+    }
+    assert metrics.histogram("write").count == 1
+    assert metrics.summary("end_to_end")["count"] == 2
+    assert metrics.summary("missing") is None
@@ -0,0 +1,105 @@
+"""Test motion profiles and their fixed-tick playback."""
+
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from core.frames import motor_speed_frame
+from core.motion import (
+    MotionProfile,
+    hold,
+    play_profile,
+    ramp,
+    s_curve,
+    stop_at_time,
+)
+from duplo.api import EnhancedTrainController
+
+
+def test_ramp_and_s_curve_reach_target():
+    """Test profiles have one speed per tick and end at the target."""
+    linear = ramp(0, 40, duration=0.1, tick=0.025)
+    assert list(linear.speeds) == [10, 20, 30, 40]
+    assert linear.duration == pytest.approx(0.1)
+
+    smooth = s_curve(0, 40, duration=0.1, tick=0.025)
+    assert list(smooth.speeds) == [6, 20, 34, 40]
+    backwards = s_curve(0, -40, duration=0.1, tick=0.025)
+    assert list(backwards.speeds) == [-6, -20, -34, -40]
+    assert backwards.speed_bytes[-1] == 216
+
+
+def test_stop_at_time_cruises_then_brakes():
+    """Test stop_at_time holds speed and reaches zero at the given time."""
+    profile = stop_at_time(50, at=0.2, braking=0.1, tick=0.025)
+    assert len(profile) == 8
+    assert list(profile.speeds)[:4] == [50] * 4
+    assert profile.speeds[-1] == 0
+    # Shorter than the braking time: brake the whole way
+    assert len(stop_at_time(50, at=0.05, braking=1.0, tick=0.025)) == 2
+
+
+def test_profiles_join_only_with_same_tick():
+    """Test profiles concatenate and reject mismatched ticks."""
+    joined = hold(20, 0.05, tick=0.025) + ramp(20, 0, 0.05, tick=0.025)
+    assert list(joined.speeds) == [20, 20, 10, 0]
+    with pytest.raises(ValueError):
+        joined + hold(0, 0.1, tick=0.01)
+    with pytest.raises(ValueError):
+        MotionProfile(b"", tick=0)
+
+
+async def test_play_profile_skips_repeated_speeds():
+    """Test each tick is timed and unchanged speeds are not rewritten."""
+    send = AsyncMock()
+    profile = hold(30, 0.02, tick=0.005) + ramp(30, 0, 0.01, tick=0.005)
+    result = await play_profile(send, profile)
+    assert [call.args[0] for call in send.await_args_list] == [
+        motor_speed_frame(0, 30),
+        motor_speed_frame(0, 15),
+        motor_speed_frame(0, 0),
+    ]
+    assert (result.ticks, result.writes, result.skipped) == (6, 3, 0)
+    assert len(result.jitter) == 6
+    assert result.elapsed >= 0.025
+    assert result.summary()["jitter_max"] >= 0
+
+
+async def test_play_profile_catches_up_without_bursting():
+    """Test a stalled write skips the ticks it missed instead of replaying them."""
+
+    async def slow_send(frame: bytes) -> None:
+        if frame == motor_speed_frame(0, 10):
+            await asyncio.sleep(0.03)
+
+    result = await play_profile(slow_send, ramp(0, 100, 0.1, tick=0.01))
+    assert result.skipped >= 1
+    assert result.ticks + result.skipped == 10
+
+
+async def test_enhanced_controller_ramps_and_stops():
+    """Test the convenience API tracks the speed reached by profiles."""
+    client = Mock()
+    client.write_gatt_char = AsyncMock()
+    train = EnhancedTrainController(client)
+    result = await train.ramp_to(40, 0.03)
+    assert train.speed == 40 and result.writes == result.ticks == 2
+    await train.stop_at(0.05, braking=0.03)
+    assert train.speed == 0
+    last_frame = client.write_gatt_char.await_args.args[1]
+    assert last_frame == motor_speed_frame(0, 0)
+
+
+async def test_enhanced_controller_ramps_from_the_last_set_speed():
+    """Test ramps start from a speed set directly, and braking counts as 0."""
+    client = Mock()
+    client.write_gatt_char = AsyncMock()
+    train = EnhancedTrainController(client)
+    await train.set_motor_speed("motor", 60)
+    assert train.speed == 60
+    await train.ramp_to(20, 0.02, smooth=False)
+    first_frame = client.write_gatt_char.await_args_list[1].args[1]
+    assert first_frame == motor_speed_frame(0, 40)
+    await train.emergency_stop()
+    assert train.speed == 0
@@ -0,0 +1,127 @@
+"""Test pipelined commands and their completion futures."""
+
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from core.frames import STARTUP_NO_FEEDBACK, motor_speed_frame
+from core.metrics import Metrics
+from core.pipeline import CommandError, CommandPipeline
+from core.simulator import (
+    BUFFER_OVERFLOW,
+    INVALID_USE,
+    SimulatedHub,
+    generic_error_message,
+    port_output_command_feedback_message,
+)
+from core.train_controller import TrainController
+from protocols.duplo_train_decoder import decode_message
+
+
+def feedback(port_id: int, flags: int = 0x0A):
+    return decode_message(port_output_command_feedback_message(port_id, flags))
+
+
+def output_error(error_code: int):
+    return decode_message(generic_error_message(0x81, error_code))
+
+
+async def test_feedback_completes_oldest_command_per_port():
+    """Test feedback resolves commands in order, independently per port."""
+    pipeline = CommandPipeline(AsyncMock(), timeout=None)
+    first = await pipeline.submit(0, b"a")
+    second = await pipeline.submit(0, b"b")
+    light = await pipeline.submit(17, b"c")
+    assert pipeline.in_flight() == 3
+
+    pipeline.feedback(feedback(17))
+    pipeline.feedback(feedback(0))
+    assert light.done() and first.done() and not second.done()
+    assert first.result() >= 0
+    pipeline.feedback(feedback(0, 0x04))
+    with pytest.raises(CommandError, match="discarded"):
+        second.result()
+    assert (pipeline.completed, pipeline.failed) == (2, 1)
+
+
+async def test_errors_fail_matching_command():
+    """Test overflow fails the newest command and other errors the oldest."""
+    pipeline = CommandPipeline(AsyncMock(), timeout=None)
+    first = await pipeline.submit(0, b"a")
+    second = await pipeline.submit(1, b"b")
+    third = await pipeline.submit(0, b"c")
+
+    pipeline.error(output_error(BUFFER_OVERFLOW))
+    assert third.exception().error_code == BUFFER_OVERFLOW
+    pipeline.error(output_error(INVALID_USE))
+    with pytest.raises(CommandError, match="INVALID_USE"):
+        first.result()
+    # Errors about other message types are not ours
+    pipeline.error(decode_message(generic_error_message(0x41, INVALID_USE)))
+    assert not second.done()
+
+
+async def test_window_limits_commands_in_flight():
+    """Test submissions wait for a slot once the port's window is full."""
+    write = AsyncMock()
+    pipeline = CommandPipeline(write, window=2, timeout=None)
+    await pipeline.submit(0, b"a")
+    await pipeline.submit(0, b"b")
+    waiting = asyncio.create_task(pipeline.submit(0, b"c"))
+    await asyncio.sleep(0)
+    assert not waiting.done() and write.await_count == 2
+    # Other ports have their own window
+    await pipeline.submit(1, b"d")
+
+    pipeline.feedback(feedback(0))
+    third = await waiting
+    assert write.await_count == 4 and not third.done()
+
+
+async def test_unacknowledged_commands_time_out():
+    """Test a command without feedback fails and frees its slot."""
+    pipeline = CommandPipeline(AsyncMock(), window=1, timeout=0.01)
+    lost = await pipeline.submit(0, b"a")
+    with pytest.raises(asyncio.TimeoutError):
+        await lost
+    assert pipeline.timed_out == 1 and pipeline.in_flight(0) == 0
+
+
+async def test_fast_mode_suppresses_feedback():
+    """Test fast mode writes no-feedback frames and completes on write."""
+    client = Mock()
+    client.write_gatt_char = AsyncMock()
+    controller = TrainController(client)
+    controller.start_metrics(Metrics())
+    pipeline = controller.start_pipeline(fast=True)
+    done = await controller.set_motor_speed(0, 50)
+    assert done.done() and pipeline.in_flight() == 0
+    frame = client.write_gatt_char.await_args.args[1]
+    assert frame == motor_speed_frame(0, 50, STARTUP_NO_FEEDBACK)
+    assert controller.metrics.summary("completion")["count"] == 1
+
+
+async def test_pipeline_against_simulated_hub():
+    """Test completion futures resolve from real feedback and errors."""
+    hub = SimulatedHub(interval=0.002)
+    async with hub:
+        controller = TrainController(hub)  # type: ignore[arg-type]
+        await controller.setup_notifications()
+        controller.start_pipeline(window=4)
+        with pytest.raises(RuntimeError):
+            controller.start_write_scheduler()
+        futures = [await controller.set_motor_speed("motor", s) for s in range(8)]
+        futures.append(await controller.play_sound("speaker", 9))
+        latencies = await asyncio.gather(*futures)
+        assert all(latency > 0 for latency in latencies)
+        assert hub.motor_speeds == {0: 7} and hub.sounds == [9]
+
+        # The hub rejects commands to ports it no longer has
+        del hub.ports[17]
+        rejected = await controller.set_light_color("light", 3)
+        with pytest.raises(CommandError, match="INVALID_USE"):
+            await rejected
+        await controller.stop_pipeline()
+        assert controller.pipeline is None
+        assert await controller.set_motor_speed("motor", 0) is None
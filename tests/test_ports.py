@@ -0,0 +1,114 @@
+"""Test the port registry and its use by the train controller."""
+
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from core.ports import DEFAULT_LAYOUT, ROLES, PortNotAttachedError, PortRegistry
+from core.simulator import (
+    SPEEDOMETER_PORT,
+    SimulatedHub,
+    hub_attached_io_message,
+    port_value_single_message,
+)
+from core.train_controller import TrainController
+from protocols.duplo_train_decoder import decode_message
+
+DETACH_SPEAKER = bytearray.fromhex("0500040100")
+
+
+def announced_registry(layout=DEFAULT_LAYOUT) -> PortRegistry:
+    registry = PortRegistry(clock=lambda: 42.0)
+    for port_id, io in layout.items():
+        registry.update(decode_message(hub_attached_io_message(port_id, io)))
+    return registry
+
+
+def test_defaults_before_announcement():
+    """Test roles resolve to the train base layout until the hub reports."""
+    registry = PortRegistry()
+    assert registry.resolve("motor") == 0
+    assert registry.resolve("speaker") == 1
+    assert registry.resolve("light") == 17
+    assert registry.resolve(5) == 5
+    with pytest.raises(ValueError, match="Unknown role"):
+        registry.resolve("horn")
+
+
+def test_attach_detach_and_revisions():
+    """Test attach events record IO types and revisions, detach removes them."""
+    registry = announced_registry({0: ROLES["motor"], 1: ROLES["speaker"]})
+    assert registry.attached_io() == {0: ROLES["motor"], 1: ROLES["speaker"]}
+    assert registry.info("motor").hardware_revision == 1
+    assert registry.info(0).io_name == "duplo_train_motor"
+
+    registry.update(decode_message(DETACH_SPEAKER))
+    assert 1 not in registry
+    with pytest.raises(PortNotAttachedError):
+        registry.resolve(1)
+    with pytest.raises(PortNotAttachedError):
+        registry.resolve("speaker")
+
+
+def test_roles_follow_the_reported_layout():
+    """Test a role maps to the lowest port the hub reports for its IO type."""
+    registry = announced_registry({4: ROLES["motor"], 2: ROLES["motor"]})
+    assert registry.port_for("motor") == 2
+    assert registry.port_for(ROLES["motor"]) == 2
+    with pytest.raises(PortNotAttachedError):
+        registry.port_for("light")
+
+
+def test_seeded_layout_is_replaced_by_announcement():
+    """Test a cached layout is used until the hub announces its own."""
+    registry = PortRegistry()
+    registry.seed({3: ROLES["light"]})
+    assert registry.port_for("light") == 3
+    registry.update(decode_message(hub_attached_io_message(17, ROLES["light"])))
+    assert registry.attached_io() == {17: ROLES["light"]}
+
+
+def test_values_are_cached():
+    """Test port_value_single readings are kept per attached port."""
+    registry = announced_registry()
+    assert registry.value("speedometer") is None
+    registry.update(
+        decode_message(port_value_single_message(SPEEDOMETER_PORT, b"\x32\x00"))
+    )
+    assert registry.value("speedometer") == b"\x32\x00"
+    assert registry.info(SPEEDOMETER_PORT).updated == 42.0
+    # Readings for ports that are not attached are ignored
+    registry.update(decode_message(port_value_single_message(40, b"\x01")))
+    assert 40 not in registry
+
+
+async def test_controller_fails_fast_on_detached_port():
+    """Test commands to a detached port raise without writing to the hub."""
+    client = Mock()
+    client.write_gatt_char = AsyncMock()
+    controller = TrainController(client)
+    controller.handle_notification(None, bytearray(hub_attached_io_message(0, 0x29)))
+
+    await controller.set_motor_speed("motor", 50)
+    with pytest.raises(PortNotAttachedError):
+        await controller.play_sound(1, 9)
+    with pytest.raises(PortNotAttachedError):
+        await controller.set_light_color("light", 3)
+    assert client.write_gatt_char.await_count == 1
+
+
+async def test_controller_reads_cached_values_from_simulated_hub():
+    """Test the controller learns the layout and speed from the simulated hub."""
+    hub = SimulatedHub(interval=0.002)
+    async with hub:
+        controller = TrainController(hub)  # type: ignore[arg-type]
+        await controller.setup_notifications()
+        await controller.setup_port_input_format("speedometer", mode=0)
+        await controller.set_motor_speed("motor", 40)
+        for _ in range(50):
+            if controller.read_value("speedometer") == b"\x28\x00":
+                break
+            await asyncio.sleep(0.002)
+        assert controller.attached_io == hub.ports
+        assert controller.read_value("speedometer") == b"\x28\x00"
@@ -0,0 +1,85 @@
+"""Test bounded queues and their overflow policies."""
+
+import asyncio
+
+import pytest
+
+from services.queues import BLOCK, DROP_NEWEST, BoundedQueue, QueueClosed
+
+
+def test_drop_oldest_keeps_latest_items():
+    """Test a full queue discards its oldest item by default."""
+    queue = BoundedQueue(maxsize=2)
+    assert all(queue.put_nowait(item) for item in "abc")
+    assert [queue.get_nowait(), queue.get_nowait()] == ["b", "c"]
+    assert queue.stats() == {"queued": 0, "put": 3, "dropped": 1, "coalesced": 0}
+
+
+def test_drop_newest_and_block_policies():
+    """Test drop_newest refuses new items and block raises without waiting."""
+    newest = BoundedQueue(maxsize=1, policy=DROP_NEWEST)
+    assert newest.put_nowait("a") and not newest.put_nowait("b")
+    assert newest.get_nowait() == "a" and newest.dropped == 1
+
+    blocking = BoundedQueue(maxsize=1, policy=BLOCK)
+    blocking.put_nowait("a")
+    with pytest.raises(asyncio.QueueFull):
+        blocking.put_nowait("b")
+    with pytest.raises(ValueError):
+        BoundedQueue(policy="spill")
+
+
+def test_key_coalesces_pending_items():
+    """Test an item replaces the queued item with the same key in place."""
+    queue = BoundedQueue(maxsize=2, key=lambda item: item[0])
+    for item in [("a", 1), ("b", 1), ("a", 2)]:
+        queue.put_nowait(item)
+    assert len(queue) == 2 and queue.coalesced == 1
+    assert queue.get_nowait() == ("a", 2)
+    queue.put_nowait(("c", 1))
+    queue.put_nowait(("d", 1))
+    assert [queue.get_nowait(), queue.get_nowait()] == [("c", 1), ("d", 1)]
+    assert queue.dropped == 1
+
+
+async def test_block_waits_for_room():
+    """Test put waits under the block policy until a get frees a slot."""
+    queue = BoundedQueue(maxsize=1, policy=BLOCK)
+    await queue.put(1)
+    waiting = asyncio.create_task(queue.put(2))
+    await asyncio.sleep(0)
+    assert not waiting.done()
+    assert await queue.get() == 1
+    await waiting
+    assert await queue.get() == 2
+
+
+async def test_cancelled_putter_passes_on_its_wake_up():
+    """Test a putter cancelled after being woken lets the next putter in."""
+    queue = BoundedQueue(maxsize=1, policy=BLOCK)
+    await queue.put(1)
+    first = asyncio.create_task(queue.put(2))
+    second = asyncio.create_task(queue.put(3))
+    await asyncio.sleep(0)
+    assert queue.get_nowait() == 1
+    first.cancel()
+    await asyncio.sleep(0)
+    assert first.cancelled()
+    async with asyncio.timeout(1):
+        await second
+    assert queue.get_nowait() == 3
+
+
+async def test_close_ends_iteration_after_draining():
+    """Test closing wakes getters and iteration stops once drained."""
+    queue = BoundedQueue()
+    getter = asyncio.create_task(queue.get())
+    await asyncio.sleep(0)
+    queue.put_nowait("a")
+    assert await getter == "a"
+    queue.put_nowait("b")
+    queue.close()
+    assert not queue.put_nowait("c")
+    assert [item async for item in queue] == ["b"]
+    with pytest.raises(QueueClosed):
+        await queue.get()
@@ -0,0 +1,149 @@
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+
+from core.frames import motor_speed_frame, sound_frame
+from core.ports import ROLES, PortNotAttachedError, PortRegistry
+from core.rules import RuleEngine, default_rules, load_rules
+from core.simulator import hub_attached_io_message
+from core.toothbrush_router import ToothbrushRouter
+from protocols.ble_toothbrush import decode_toothbrush_event
+from protocols.duplo_train_decoder import decode_message
+
+
+def payload(code: int, pressure: int = 0) -> bytes:
+    """Build a toothbrush advertisement with the given state and pressure byte."""
+    return b"\x062k" + bytes([code, pressure]) + b"\x00\x03\x02\x09\x00\x04"
+
+
+def state(code: int, pressure: int = 0):
+    return decode_toothbrush_event(payload(code, pressure))
+
+
+IDLE = state(0x02)
+RUNNING = state(0x03)
+RUNNING_MODE_PRESSED = state(0x03, 0x04)
+
+
+def commands(actions):
+    return [(action.command, action.value) for action in actions]
+
+
+def test_default_rules_match_brushing_behaviour():
+    """Test the default rules start, stop and honk on the original edges."""
+    engine = RuleEngine(default_rules(speed=40, sound_id=9))
+    assert commands(engine.evaluate(IDLE, RUNNING)) == [("set_motor_speed", 40)]
+    assert commands(engine.evaluate(RUNNING, IDLE)) == [("set_motor_speed", 0)]
+    assert commands(engine.evaluate(RUNNING, RUNNING_MODE_PRESSED)) == [
+        ("play_sound", 9)
+    ]
+    assert engine.evaluate(RUNNING_MODE_PRESSED, RUNNING) == []
+    assert engine.evaluate(None, RUNNING) == []
+
+
+def test_actions_carry_prebuilt_frames():
+    """Test compiled actions hold the same frames as the frame builders."""
+    engine = RuleEngine(default_rules(speed=40, sound_id=9))
+    start, stop, horn = sorted(
+        (a for actions in engine.table.values() for a in actions),
+        key=lambda a: a.order,
+    )
+    assert start.frame == motor_speed_frame(0, 40)
+    assert stop.frame == motor_speed_frame(0, 0)
+    assert horn.frame == sound_frame(1, 9)
+
+
+def test_wildcards_and_rule_order():
+    """Test wildcard rules fire alongside exact ones, in rule order."""
+    engine = RuleEngine(
+        [
+            {"on": "state", "from": "*", "to": "*", "action": "play_sound", "value": 3},
+            {
+                "on": "state",
+                "from": "idle",
+                "to": "running",
+                "action": "set_motor_speed",
+                "value": 30,
+            },
+            {"on": "mode", "action": "set_light_color", "value": 5},
+        ]
+    )
+    assert commands(engine.evaluate(IDLE, RUNNING)) == [
+        ("play_sound", 3),
+        ("set_motor_speed", 30),
+    ]
+    assert len(engine) == 3
+
+
+@pytest.mark.parametrize(
+    "rule",
+    [
+        {"on": "colour", "action": "play_sound", "value": 1},
+        {"on": "state", "action": "honk", "value": 1},
+        {"on": "state", "action": "play_sound"},
+        {"on": "pressure.timer_mode", "edge": "up", "action": "play_sound", "value": 1},
+        {
+            "on": "pressure.timer_mode",
+            "edge": "rising",
+            "to": True,
+            "action": "play_sound",
+            "value": 1,
+        },
+        {"on": "state", "edge": "rising", "action": "play_sound", "value": 1},
+        {"on": "state", "action": "play_sound", "value": 300},
+        {"on": "state", "action": "set_light_color", "value": -1},
+        {"on": "state", "action": "set_motor_speed", "value": 101},
+        {"on": "state", "action": "set_motor_speed", "value": 10, "port": "tender"},
+    ],
+)
+def test_invalid_rules_rejected(rule):
+    """Test malformed rules and out-of-range values raise ValueError when compiled."""
+    with pytest.raises(ValueError):
+        RuleEngine([rule])
+
+
+def test_load_rules(tmp_path):
+    """Test rules load from a bare list or a {"rules": [...]} object."""
+    rules = default_rules()
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"rules": rules}))
+    assert load_rules(path) == rules
+    path.write_text(json.dumps(rules))
+    assert load_rules(path) == rules
+    path.write_text("{}")
+    with pytest.raises(ValueError):
+        load_rules(path)
+
+
+async def test_reaction_sends_frames_through_router():
+    """Test the rule reaction writes the compiled frames to the routed train."""
+    train = AsyncMock()
+    engine = RuleEngine(default_rules(speed=40, sound_id=9))
+    router = ToothbrushRouter({}, engine.reaction(verbose=False), default=train)
+    for code, pressure in [(2, 0), (3, 0), (3, 4), (2, 0)]:
+        router.handle_advertisement("AA", payload(code, pressure))
+    await router.join()
+    assert [c.args[0] for c in train.send_frame.await_args_list] == [
+        motor_speed_frame(0, 40),
+        sound_frame(1, 9),
+        motor_speed_frame(0, 0),
+    ]
+    await router.stop()
+
+
+async def test_reaction_follows_the_reported_port_layout():
+    """Test rule frames go to the ports the hub reports, failing when detached."""
+    registry = PortRegistry()
+    for port_id, io in {2: ROLES["motor"], 1: ROLES["speaker"]}.items():
+        registry.update(decode_message(hub_attached_io_message(port_id, io)))
+    train = AsyncMock(ports=registry)
+    react = RuleEngine(default_rules(speed=40)).reaction(verbose=False)
+    await react(IDLE, RUNNING, train)
+    train.send_frame.assert_awaited_once_with(motor_speed_frame(2, 40))
+
+    pinned = RuleEngine(
+        [{"on": "state", "action": "set_motor_speed", "value": 40, "port": 0}]
+    )
+    with pytest.raises(PortNotAttachedError):
+        await pinned.reaction(verbose=False)(IDLE, RUNNING, train)
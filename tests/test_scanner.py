@@ -0,0 +1,121 @@
+"""Test the shared BLE scanner and its subscriptions."""
+
+import asyncio
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from core.train_controller import find_train, find_trains
+from services.scanner import ScanFilter, SharedScanner
+
+BRUSH_UUID = "0000fe0d-0000-1000-8000-00805f9b34fb"
+
+
+def advert(address, name=None, uuids=(), manufacturer=None):
+    device = Mock(address=address)
+    device.name = name
+    adv_data = Mock(
+        local_name=None,
+        service_uuids=list(uuids),
+        manufacturer_data=manufacturer or {},
+    )
+    return device, adv_data
+
+
+class FakeScanner:
+    """Stands in for BleakScanner, counting how often a scan was started."""
+
+    starts = 0
+
+    def __init__(self, detection_callback):
+        self.detection_callback = detection_callback
+
+    async def start(self):
+        FakeScanner.starts += 1
+
+    async def stop(self):
+        pass
+
+
+@pytest.fixture
+def scanner():
+    FakeScanner.starts = 0
+    return SharedScanner(FakeScanner)
+
+
+def test_filters_match_only_given_criteria():
+    """Test compiled filters combine criteria and ignore the missing ones."""
+    brush = advert("aa:bb", uuids=[BRUSH_UUID], manufacturer={220: b"x"})
+    train = advert("CC:DD", name="Train Base", manufacturer={919: b"y"})
+    assert ScanFilter().compile()(*train)
+    assert ScanFilter(addresses=["AA:BB"]).compile()(*brush)
+    assert ScanFilter(names=["Train Base"]).compile()(*train)
+    both = ScanFilter(service_uuids=[BRUSH_UUID.upper()], manufacturer_ids=[220])
+    assert both.compile()(*brush) and not both.compile()(*train)
+    wrong_maker = ScanFilter(service_uuids=[BRUSH_UUID], manufacturer_ids=[1])
+    assert not wrong_maker.compile()(*brush)
+
+
+async def test_fans_out_to_matching_subscriptions(scanner):
+    """Test one advertisement reaches every matching consumer's own queue."""
+    everything = scanner.subscribe("log", maxsize=2)
+    brushes = scanner.subscribe("brush", ScanFilter(manufacturer_ids=[220]))
+    async with scanner:
+        for i in range(3):
+            scanner.dispatch(*advert(f"0{i}", manufacturer={220: bytes([i])}))
+        scanner.dispatch(*advert("10", name="Train Base"))
+
+        assert len(brushes) == 3
+        # The slow logger lost its oldest advertisements, not the others'
+        latest = [everything.get_nowait()[0].address for _ in range(2)]
+        assert latest == ["02", "10"]
+        stats = scanner.stats()
+        assert stats["advertisements"] == 4
+        assert stats["subscriptions"]["log"]["dropped"] == 2
+        with pytest.raises(ValueError):
+            scanner.subscribe("stuck", overflow="block")
+    assert FakeScanner.starts == 1
+    # Stopping the scan ends every subscription
+    assert brushes.closed and [d async for d, *_ in brushes][-1].address == "02"
+
+
+async def test_discovery_shares_the_running_scan(scanner):
+    """Test find_train and find_trains use the shared scan instead of their own."""
+    async with scanner:
+        finding = asyncio.create_task(find_train("Train Base", 1.0, scanner=scanner))
+        several = asyncio.create_task(
+            find_trains(["Train Base", "ee:ff"], 1.0, scanner=scanner)
+        )
+        await asyncio.sleep(0)
+        scanner.dispatch(*advert("11", name="Other"))
+        scanner.dispatch(*advert("CC:DD", name="Train Base"))
+        scanner.dispatch(*advert("EE:FF"))
+        assert (await finding).address == "CC:DD"
+        assert [d.address for d in await several] == ["CC:DD", "EE:FF"]
+        assert scanner.subscriptions == []
+        assert await scanner.find_device("Missing", timeout=0.01) is None
+    assert FakeScanner.starts == 1
+
+
+async def test_route_toothbrush_events_from_shared_scan(scanner):
+    """Test the toothbrush CLI decodes brushes from a shared subscription."""
+    from duplo.cli.toothbrush import route_toothbrush_events
+
+    router = Mock(metrics=None)
+    routing = asyncio.create_task(route_toothbrush_events(router, False, scanner))
+    await asyncio.sleep(0)
+    before = time.perf_counter_ns()
+    scanner.dispatch(*advert("AA", uuids=[BRUSH_UUID], manufacturer={220: b"\x01"}))
+    scanner.dispatch(*advert("BB", manufacturer={220: b"\x02"}))
+    dispatched = time.perf_counter_ns()
+    await asyncio.sleep(0)
+    router.handle_advertisement.assert_called_once()
+    address, data, received = router.handle_advertisement.call_args.args
+    # Stamped when the scan saw the advertisement, not when it was routed
+    assert (address, data) == ("AA", b"\x01")
+    assert before <= received <= dispatched
+    routing.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await routing
+    assert scanner.subscriptions == [] and scanner._scanner is None
@@ -0,0 +1,128 @@
+"""Test sensor streams, their ring buffer and delta interval adaptation."""
+
+import asyncio
+import struct
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from core.frames import port_input_format_frame
+from core.ports import ROLES
+from core.sensors import RingBuffer, SensorStream, decode_value
+from core.simulator import SPEEDOMETER_PORT, SimulatedHub
+from core.train_controller import TrainController
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def mock_controller() -> TrainController:
+    client = Mock()
+    client.write_gatt_char = AsyncMock()
+    return TrainController(client)
+
+
+def test_decode_value_per_sensor():
+    """Test values decode by IO type and mode, signed by default."""
+    assert decode_value(ROLES["speedometer"], 0, b"\xd8\xff") == -40
+    assert decode_value(ROLES["speedometer"], 1, b"\x10\x27\x00\x00") == 10000
+    assert decode_value(ROLES["color"], 0, b"\xff") == -1
+    assert decode_value(None, 0, b"\x05\x01") == 0x105
+
+
+def test_ring_buffer_wraps_and_windows():
+    """Test the ring buffer keeps the newest values and windows by time."""
+    buffer = RingBuffer(capacity=4)
+    assert buffer.latest() is None and buffer.stats() is None
+    for second in range(6):
+        buffer.append(float(second), second * 10.0)
+    assert len(buffer) == 4
+    assert buffer.latest() == (5.0, 50.0)
+    assert buffer.window() == [20.0, 30.0, 40.0, 50.0]
+    assert buffer.window(1.0) == [40.0, 50.0]
+    assert buffer.window(1.0, now=10.0) == []
+    stats = buffer.stats(window=2.0)
+    assert stats["count"] == 3
+    assert stats["mean"] == 40.0
+    assert (stats["min"], stats["max"]) == (30.0, 50.0)
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+
+
+async def test_stream_subscribes_and_unsubscribes():
+    """Test a stream asks for its resolution and disables reports when closed."""
+    controller = mock_controller()
+    write = controller.client.write_gatt_char
+    async with controller.stream("speedometer", resolution=5) as stream:
+        assert controller.streams == {SPEEDOMETER_PORT: [stream]}
+    assert controller.streams == {}
+    frames = [call.args[1] for call in write.await_args_list]
+    assert frames == [
+        port_input_format_frame(SPEEDOMETER_PORT, 0, 5),
+        port_input_format_frame(SPEEDOMETER_PORT, 0, 1, notification_enabled=False),
+    ]
+
+
+async def test_delta_interval_adapts_to_consumer():
+    """Test overflow doubles the delta interval and keeping up halves it."""
+    clock = FakeClock()
+    controller = mock_controller()
+    stream = SensorStream(
+        controller,
+        SPEEDOMETER_PORT,
+        io=ROLES["speedometer"],
+        resolution=2,
+        queue_size=2,
+        clock=clock,
+    )
+    await stream.start()
+    for speed in range(5):
+        stream.push(struct.pack("<h", speed))
+    assert stream.dropped == 3
+    assert len(stream.buffer) == 5
+
+    clock.now = 2.0
+    assert (await stream.__anext__()).value == 3
+    assert stream.delta_interval == 4
+    assert (await stream.__anext__()).value == 4
+
+    # Caught up, but too soon after the last change to adapt again
+    clock.now = 2.5
+    stream.push(struct.pack("<h", 8))
+    assert (await stream.__anext__()).value == 8
+
+    clock.now = 4.0
+    waiting = asyncio.create_task(stream.__anext__())
+    await asyncio.sleep(0)
+    assert stream.delta_interval == 2
+    stream.push(struct.pack("<h", 12))
+    assert (await waiting).value == 12
+    await stream.close()
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+
+
+async def test_stream_from_simulated_hub():
+    """Test speed changes reach an async for loop, thinned by the resolution."""
+    hub = SimulatedHub(interval=0.002)
+    async with hub:
+        controller = TrainController(hub)  # type: ignore[arg-type]
+        await controller.setup_notifications()
+        readings = []
+        async with controller.stream("speedometer", resolution=10) as speed:
+            async for reading in speed:
+                readings.append(reading.value)
+                if len(readings) == 1:
+                    # Subscribed, the hub reported the current value
+                    for value in (3, 12, 15, 25, -25):
+                        hub.set_port_value(SPEEDOMETER_PORT, struct.pack("<h", value))
+                elif reading.value == -25:
+                    break
+        assert readings == [0, 12, 25, -25]
+        assert speed.buffer.stats()["count"] == 4
+        assert controller.read_value("speedometer") == struct.pack("<h", -25)
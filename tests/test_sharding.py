@@ -0,0 +1,126 @@
+"""Test trains sharded over worker processes against simulated hubs."""
+
+import asyncio
+import collections
+import functools
+import multiprocessing
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+
+from core.simulator import SimulatedHub
+from duplo.sharding import ShardError, ShardWorker, by_address, sharded_connection
+from services.event_bus import CommandFeedback
+
+HUB = functools.partial(SimulatedHub, interval=0.005)
+
+
+def addresses(count: int) -> list[str]:
+    return [f"00:16:53:00:00:{i:02X}" for i in range(1, count + 1)]
+
+
+async def no_trains(targets, timeout=30.0):
+    return [None] * len(targets)
+
+
+async def collect_feedback(subscriber, expected: dict[str, int]) -> dict[str, int]:
+    counts: collections.Counter[str] = collections.Counter()
+    async with asyncio.timeout(10):
+        while any(counts[train] < count for train, count in expected.items()):
+            event = await subscriber.get()
+            counts[event.source] += 1
+    return counts
+
+
+async def test_commands_route_to_the_owning_worker():
+    """Test each worker owns its trains and reports their events."""
+    trains = addresses(4)
+    async with sharded_connection(
+        trains, workers=2, client_factory=HUB, find_all=by_address
+    ) as fleet:
+        feedback = fleet.events.subscribe(CommandFeedback, maxsize=1024)
+        assert await fleet.set_motor_speed(0, 50) == dict.fromkeys(trains)
+        await fleet[trains[1]].play_sound(1, 9)
+        await collect_feedback(feedback, {**dict.fromkeys(trains, 1), trains[1]: 2})
+
+        with pytest.raises(AttributeError):
+            fleet[trains[0]].disconnect
+        with pytest.raises(ShardError, match="Unknown role .tender."):
+            await fleet[trains[0]].set_motor_speed("tender", 10)
+        results = await fleet.stop_all()
+        assert all(error is None for error in results.values())
+
+        shards = fleet.stats()["shards"]
+        assert [shard["trains"] for shard in shards] == [trains[0::2], trains[1::2]]
+        assert len({shard["pid"] for shard in shards}) == 2
+        assert all(shard["pending"] == 0 for shard in shards)
+
+    assert all(not shard.process.is_alive() for shard in fleet.shards)
+
+
+async def test_missing_trains_fail_the_connection():
+    """Test a train that is not found is reported from its worker."""
+    with pytest.raises(ConnectionError, match="not found"):
+        async with sharded_connection(
+            ["Train Base"], client_factory=HUB, find_all=no_trains
+        ):
+            pass
+
+
+async def test_coordinator_finds_all_trains_in_one_scan():
+    """Test the coordinator scans once and reports trains it did not find."""
+    trains = addresses(3)
+
+    async def two_found(targets, timeout=30.0):
+        return [*targets[:2], None]
+
+    find_all = AsyncMock(side_effect=two_found)
+    async with sharded_connection(
+        trains,
+        workers=2,
+        client_factory=HUB,
+        find_all=find_all,
+        timeout=1.0,
+        require_all=False,
+    ) as fleet:
+        find_all.assert_awaited_once_with(trains, timeout=1.0)
+        assert list(fleet.trains) == trains[:2]
+        assert list(fleet.connect_errors) == [trains[2]]
+        shards = fleet.stats()["shards"]
+        assert [shard["trains"] for shard in shards] == [[trains[0]], [trains[1]]]
+
+
+async def test_unpicklable_results_are_answered_as_errors():
+    """Test a result that cannot be sent back still resolves the request."""
+    parent, child = multiprocessing.Pipe()
+    worker = ShardWorker(child, {}, HUB)
+    train = AsyncMock()
+    train.set_motor_speed.return_value = lambda: None
+    worker.trains["A"] = train
+    await worker._call(1, "A", "set_motor_speed", (0, 50))
+    request_id, ok, error = parent.recv()[1:]
+    assert (request_id, ok) == (1, False)
+    assert "pickle" in error.lower()
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+async def test_throughput_with_simulated_hubs(workers):
+    """Test every command of many hubs completes whatever the worker count."""
+    trains = addresses(8)
+    rounds = 10
+    async with sharded_connection(
+        trains, workers=workers, client_factory=HUB, find_all=by_address
+    ) as fleet:
+        feedback = fleet.events.subscribe(CommandFeedback, maxsize=4096)
+        start = time.perf_counter()
+        for speed in range(rounds):
+            results = await fleet.set_motor_speed(0, speed * 10)
+            assert all(error is None for error in results.values())
+        counts = await collect_feedback(feedback, dict.fromkeys(trains, rounds))
+        elapsed = time.perf_counter() - start
+
+    assert sum(counts.values()) == rounds * len(trains)
+    assert len(fleet.shards) == workers
+    assert sum(shard.calls for shard in fleet.shards) == rounds * len(trains)
+    assert elapsed < 5.0
@@ -0,0 +1,164 @@
+"""Test the simulated hub against the real controller and decoders."""
+
+import asyncio
+import functools
+from contextlib import AsyncExitStack
+from unittest.mock import AsyncMock
+
+import pytest
+
+from core.frames import (
+    motor_speed_frame,
+    output_command_frame,
+    port_input_format_frame,
+)
+from core.simulator import SPEEDOMETER_PORT, SimulatedHub
+from core.train_controller import TrainController, connect_train
+from protocols.duplo_train_decoder import (
+    ERROR_CODE_NAMES,
+    GenericErrorMessage,
+    HubAttachedIo,
+    PortInputFormat,
+    PortOutputCommandFeedback,
+    PortValueSingle,
+    decode_message,
+)
+
+INTERVAL = 0.002
+
+
+async def connected_hub(**options) -> tuple[SimulatedHub, list]:
+    hub = SimulatedHub(interval=INTERVAL, **options)
+    await hub.connect()
+    received: list = []
+    await hub.start_notify(
+        None, lambda sender, data: received.append(decode_message(data))
+    )
+    return hub, received
+
+
+def hub_factory(hub: SimulatedHub):
+    return lambda address: hub
+
+
+async def settle(intervals: int = 3) -> None:
+    await asyncio.sleep(INTERVAL * intervals + 0.005)
+
+
+async def test_announces_attached_io():
+    """Test enabling notifications reports every attached port."""
+    hub, received = await connected_hub()
+    await settle()
+    attached = {m.port_id: m.io_type for m in received if type(m) is HubAttachedIo}
+    assert attached == hub.ports
+    await hub.disconnect()
+
+
+async def test_controller_commands_get_feedback():
+    """Test output commands run on the hub and are acknowledged."""
+    hub = SimulatedHub(interval=INTERVAL)
+    async with AsyncExitStack() as stack:
+        client = await connect_train(
+            stack,
+            "AA:BB",
+            timeout=1.0,
+            find=AsyncMock(return_value="AA:BB"),
+            client_factory=hub_factory(hub),
+        )
+        controller = TrainController(client)
+        received = []
+
+        def record(sender, data):
+            received.append(controller.process_notification(data))
+
+        await client.start_notify(None, record)
+        await controller.set_motor_speed(0, -30)
+        await controller.play_sound(1, 9)
+        await controller.set_light_color(17, 3)
+        await settle()
+    assert hub.motor_speeds == {0: -30}
+    assert hub.sounds == [9]
+    assert hub.light_colors == {17: 3}
+    feedback = [m for m in received if type(m) is PortOutputCommandFeedback]
+    assert [m.port_id for m in feedback] == [0, 1, 17]
+    assert controller.attached_io[0] == hub.ports[0]
+
+
+async def test_speedometer_subscription_reports_values():
+    """Test a subscribed speedometer reports the motor speed as int16."""
+    hub, received = await connected_hub()
+    await hub.write_gatt_char(None, port_input_format_frame(SPEEDOMETER_PORT))
+    await settle()
+    await hub.write_gatt_char(None, motor_speed_frame(0, 40))
+    await settle()
+    assert PortInputFormat(0x47, SPEEDOMETER_PORT, 1, 1, True) in received
+    values = [m.value for m in received if type(m) is PortValueSingle]
+    assert values[-1] == (40).to_bytes(2, "little")
+    await hub.disconnect()
+
+
+@pytest.mark.parametrize(
+    "frame, error",
+    [
+        (output_command_frame(42, 0, 1), "INVALID_USE"),
+        (bytes([4, 0, 0x7F, 0]), "COMMAND_NOT_RECOGNIZED"),
+        (bytes([4, 0, 0x82, 0]), "INVALID_USE"),
+    ],
+)
+async def test_bad_frames_get_generic_errors(frame, error):
+    """Test unknown ports, unknown message types and short frames are rejected."""
+    hub, received = await connected_hub()
+    await hub.write_gatt_char(None, frame)
+    await settle()
+    errors = [m for m in received if type(m) is GenericErrorMessage]
+    assert [ERROR_CODE_NAMES[e.error_code] for e in errors] == [error]
+    await hub.disconnect()
+
+
+async def test_buffer_overflow():
+    """Test writes beyond the hub's buffer are dropped with an error."""
+    hub, received = await connected_hub(buffer_size=2, frames_per_interval=1)
+    for speed in range(4):
+        await hub.write_gatt_char(None, motor_speed_frame(0, speed))
+    await hub.write_gatt_char(None, b"\x02")  # Too short to name its type
+    await settle(8)
+    assert hub.overflows == 3
+    assert hub.motor_speeds == {0: 1}
+    errors = [m for m in received if type(m) is GenericErrorMessage]
+    assert len(errors) == 3
+    assert {ERROR_CODE_NAMES[e.error_code] for e in errors} == {"BUFFER_OVERFLOW"}
+    await hub.disconnect()
+
+
+async def test_packet_loss_is_seeded():
+    """Test lost packets are counted and reproducible for a given seed."""
+    lost = []
+    for _ in range(2):
+        hub, _ = await connected_hub(loss=0.5, seed=7, buffer_size=100)
+        for _ in range(40):
+            await hub.write_gatt_char(None, motor_speed_frame(0, 10))
+        # Count once every frame and answer went through, so the draws line up
+        while hub._inbox or hub._outbox:
+            await settle(1)
+        lost.append(hub.lost)
+        await hub.disconnect()
+    assert lost[0] == lost[1] and 0 < lost[0] < 80
+
+
+async def test_drop_connection_calls_back():
+    """Test a dropped link refuses writes and notifies the owner."""
+    dropped = []
+    hub = SimulatedHub(disconnected_callback=dropped.append, interval=INTERVAL)
+    await hub.connect()
+    hub.drop_connection()
+    assert dropped == [hub] and not hub.is_connected
+    with pytest.raises(ConnectionError):
+        await hub.write_gatt_char(None, motor_speed_frame(0, 1))
+
+
+async def test_works_as_client_factory():
+    """Test the hub slots in where BleakClient is expected."""
+    factory = functools.partial(SimulatedHub, interval=INTERVAL)
+    async with factory("AA:BB") as hub:
+        assert hub.address == "AA:BB" and hub.is_connected
+    assert not hub.is_connected
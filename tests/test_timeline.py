@@ -0,0 +1,132 @@
+"""Test timelines of timed commands and their deadline executor."""
+
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+from core.frames import light_color_frame, motor_speed_frame, sound_frame
+from core.simulator import SimulatedHub
+from core.timeline import Timeline, load_timeline, run_timeline
+from core.train_controller import TrainController
+
+EXAMPLE = Path(__file__).parent.parent / "examples" / "demo_timeline.json"
+
+
+def test_compile_orders_frames_by_offset():
+    """Test events fire by offset, ties in the order they were added."""
+    compiled = (
+        Timeline().motor(0.5, 0).sound(0.0, 5).light(0.2, 3).motor(0.2, 40).compile()
+    )
+    assert [(at, frame) for at, _, frame, _ in compiled.events()] == [
+        (0.0, sound_frame(1, 5)),
+        (0.2, light_color_frame(17, 3)),
+        (0.2, motor_speed_frame(0, 40)),
+        (0.5, motor_speed_frame(0, 0)),
+    ]
+    assert compiled.duration == 0.5 and len(compiled) == 4
+
+
+def test_ramps_expand_to_changed_speeds_only():
+    """Test a ramp becomes one frame per tick with a new speed."""
+    timeline = Timeline(tick=0.025).ramp(1.0, 0, 40, 0.1, smooth=False)
+    events = timeline.compile().events()
+    assert [at for at, *_ in events] == pytest.approx([1.0, 1.025, 1.05, 1.075])
+    assert events[-1][2] == motor_speed_frame(0, 40)
+    assert len(Timeline(tick=0.025).ramp(0.0, 20, 20, 0.1)) == 1
+
+
+def test_event_ports_accept_roles():
+    """Test role names resolve to the standard train base ports."""
+    timeline = Timeline()
+    timeline.add_event(
+        {"at": 0, "action": "set_light_color", "value": 3, "port": "light"}
+    )
+    timeline.add_event(
+        {"at": 1, "action": "ramp", "to": 10, "duration": 0.1, "port": "motor"}
+    )
+    events = timeline.compile().events()
+    assert events[0][2] == light_color_frame(17, 3)
+    assert events[-1][2] == motor_speed_frame(0, 10)
+
+
+def test_malformed_events_are_rejected():
+    """Test bad events raise ValueError naming the event."""
+    for event in [
+        {"at": 0, "action": "explode", "value": 1},
+        {"at": -1, "action": "play_sound", "value": 1},
+        {"action": "play_sound", "value": 1},
+        {"at": 0, "action": "s_curve", "from": 0},
+        {"at": 0, "action": "play_sound", "value": "loud"},
+        {"at": 0, "action": "play_sound", "value": 1, "port": "tender"},
+    ]:
+        with pytest.raises(ValueError, match="Malformed timeline event"):
+            Timeline().add_event(event)
+    with pytest.raises(ValueError, match="Tick must be a positive time"):
+        Timeline(tick=0)
+
+
+def test_load_timeline_from_file(tmp_path):
+    """Test files hold a list of events or an object with a tick."""
+    path = tmp_path / "show.json"
+    path.write_text(json.dumps([{"at": 1, "action": "set_motor_speed", "value": 30}]))
+    assert load_timeline(path).compile().events()[0][2] == motor_speed_frame(0, 30)
+    path.write_text(
+        json.dumps(
+            {
+                "tick": 0.5,
+                "events": [
+                    {"at": 0, "action": "ramp", "to": 20, "duration": 1.0, "port": 1}
+                ],
+            }
+        )
+    )
+    assert [e[2] for e in load_timeline(path).compile().events()] == [
+        motor_speed_frame(1, 10),
+        motor_speed_frame(1, 20),
+    ]
+    path.write_text(json.dumps({"events": {}}))
+    with pytest.raises(ValueError):
+        load_timeline(path)
+    for tick in (0, -0.1, "fast", None):
+        path.write_text(json.dumps({"tick": tick, "events": []}))
+        with pytest.raises(ValueError, match="Malformed timeline"):
+            load_timeline(path)
+    assert len(load_timeline(EXAMPLE)) > 7
+
+
+async def test_run_timeline_keeps_absolute_deadlines():
+    """Test a slow write does not delay events after it."""
+    sent = []
+
+    async def send(frame: bytes) -> None:
+        sent.append(frame)
+        if frame == sound_frame(1, 5):
+            await asyncio.sleep(0.02)
+
+    compiled = Timeline().sound(0.0, 5).light(0.03, 3).motor(0.06, 0).compile()
+    result = await run_timeline(send, compiled)
+    assert sent == [frame for _, _, frame, _ in compiled.events()]
+    assert len(result) == 3 and result.elapsed >= 0.06
+    # Ran on deadlines from the start, not sleeps after each write
+    assert result.elapsed < 0.06 + 0.02
+    summary = result.summary()
+    assert summary["events"] == 3 and summary["lateness_max"] >= 0
+    assert result.latest(1)[0][0].startswith(("play_sound", "set_light", "set_motor"))
+    # The compiled timeline is reusable
+    assert len((await run_timeline(send, compiled))) == 3
+
+
+async def test_timeline_against_simulated_hub():
+    """Test every event reaches the simulated hub."""
+    hub = SimulatedHub(interval=0.001)
+    async with hub:
+        controller = TrainController(hub)  # type: ignore[arg-type]
+        compiled = Timeline(tick=0.005).sound(0.0, 9).ramp(0.0, 0, 30, 0.02).compile()
+        await run_timeline(controller.send_frame, compiled)
+        for _ in range(100):
+            if hub.motor_speeds.get(0) == 30 and hub.sounds:
+                break
+            await asyncio.sleep(0.005)
+    assert hub.sounds == [9] and hub.motor_speeds == {0: 30}
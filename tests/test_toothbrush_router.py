@@ -0,0 +1,126 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from core.toothbrush_router import ToothbrushRouter, ToothbrushTracker
+
+
+def payload(state: int, pressure: int = 0) -> bytes:
+    """Build a toothbrush advertisement with the given state and pressure byte."""
+    return b"\x062k" + bytes([state, pressure]) + b"\x00\x03\x02\x09\x00\x04"
+
+
+IDLE = payload(0x02)
+RUNNING = payload(0x03)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_tracker_keeps_state_per_device():
+    """Test one brush's advertisements do not affect another's edge detection."""
+    tracker = ToothbrushTracker()
+    previous, current = tracker.update("AA", IDLE)
+    assert previous is None and current.state == "idle"
+    previous, current = tracker.update("BB", RUNNING)
+    assert previous is None and current.state == "running"
+    previous, current = tracker.update("AA", RUNNING)
+    assert previous.state == "idle" and current.state == "running"
+    assert tracker.update("BB", RUNNING) is None
+    assert len(tracker) == 2
+
+
+def test_tracker_evicts_stale_devices():
+    """Test devices not seen within stale_after are forgotten."""
+    clock = Clock()
+    tracker = ToothbrushTracker(stale_after=10.0, clock=clock)
+    tracker.update("AA", IDLE)
+    clock.now = 5.0
+    tracker.update("BB", IDLE)
+    clock.now = 12.0
+    tracker.update("BB", IDLE)
+    assert "AA" not in tracker and "BB" in tracker
+    assert tracker.evicted == 1
+    previous, current = tracker.update("AA", RUNNING)
+    assert previous is None
+
+
+def test_tracker_evicts_least_recent_over_capacity():
+    """Test the least recently seen device is dropped past max_devices."""
+    clock = Clock()
+    tracker = ToothbrushTracker(max_devices=2, clock=clock)
+    for address in ["AA", "BB", "CC"]:
+        clock.now += 1
+        tracker.update(address, IDLE)
+    assert "AA" not in tracker and len(tracker) == 2
+
+
+async def test_router_dispatches_to_routed_train():
+    """Test each brush drives only the train it is routed to."""
+    reaction = AsyncMock()
+    train_a, train_b = Mock(), Mock()
+    router = ToothbrushRouter({"aa": train_a, "BB": train_b}, reaction)
+    assert router.handle_advertisement("AA", IDLE)
+    assert router.handle_advertisement("BB", RUNNING)
+    assert not router.handle_advertisement("CC", RUNNING)
+    await router.join()
+    trains = [call.args[2] for call in reaction.await_args_list]
+    assert sorted(map(id, trains)) == sorted([id(train_a), id(train_b)])
+    await router.stop()
+
+
+async def test_slow_train_does_not_block_others():
+    """Test a stalled write on one hub does not delay another hub's reaction."""
+    release = asyncio.Event()
+    fast_done = asyncio.Event()
+    slow, fast = Mock(), Mock()
+
+    async def reaction(previous, current, train):
+        if train is slow:
+            await release.wait()
+        else:
+            fast_done.set()
+
+    router = ToothbrushRouter({"AA": slow, "BB": fast}, reaction)
+    router.handle_advertisement("AA", IDLE)
+    router.handle_advertisement("BB", IDLE)
+    await asyncio.wait_for(fast_done.wait(), 1.0)
+    release.set()
+    await router.join()
+    await router.stop()
+
+
+async def test_router_drops_oldest_when_train_falls_behind():
+    """Test a full per-train queue drops its oldest pending reaction."""
+    release = asyncio.Event()
+    seen = []
+
+    async def reaction(previous, current, train):
+        await release.wait()
+        seen.append(current.state)
+
+    router = ToothbrushRouter({}, reaction, default=Mock(), queue_size=1)
+    router.handle_advertisement("AA", IDLE)
+    await asyncio.sleep(0)
+    router.handle_advertisement("AA", RUNNING)
+    router.handle_advertisement("AA", IDLE)
+    assert router.dropped == 1
+    release.set()
+    await router.join()
+    assert seen == ["idle", "idle"]
+    await router.stop()
+
+
+@pytest.mark.parametrize("route", ["AA", "=Train", "AA="])
+def test_parse_routes_rejects_malformed(route):
+    """Test routes must be BRUSH=TRAIN."""
+    from duplo.cli.toothbrush import parse_routes
+
+    with pytest.raises(ValueError):
+        parse_routes([route])
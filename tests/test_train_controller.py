@@ -1,8 +1,8 @@
 """Test the TrainController utility."""
 
 import pytest
-from unittest.mock import AsyncMock, Mock
-from core.train_controller import TrainController, convert_speed_to_val
+from unittest.mock import AsyncMock, Mock, patch
+from core.train_controller import TrainController, convert_speed_to_val, find_trains
 
 
 def test_convert_speed_to_val():
@@ -44,3 +44,48 @@ async def test_train_controller():
     # Test light color setting
     await controller.set_light_color(port_id=17, color_id=3)
     assert mock_client.write_gatt_char.call_count == 3
+
+
+@pytest.mark.asyncio
+@patch("core.train_controller.BleakScanner")
+async def test_find_trains_single_scan(mock_scanner):
+    """Test that several trains are found by name and address in one scan."""
+
+    def device(address, name):
+        device = Mock(address=address)
+        device.name = name
+        return device, Mock(local_name=None)
+
+    adverts = [
+        device("AA:AA", "Train Base"),
+        device("AA:AA", "Train Base"),
+        device("BB:BB", "Other"),
+        device("CC:CC", "Train Base"),
+    ]
+
+    def scanner(detection_callback):
+        async def enter():
+            for ble_device, adv_data in adverts:
+                detection_callback(ble_device, adv_data)
+
+        instance = Mock()
+        instance.__aenter__ = AsyncMock(side_effect=enter)
+        instance.__aexit__ = AsyncMock()
+        return instance
+
+    mock_scanner.side_effect = scanner
+
+    found = await find_trains(["Train Base", "bb:bb", "Train Base"], timeout=1.0)
+
+    assert [device.address for device in found] == ["AA:AA", "BB:BB", "CC:CC"]
+    mock_scanner.assert_called_once()
+
+
+@pytest.mark.asyncio
+@patch("core.train_controller.BleakScanner")
+async def test_find_trains_times_out(mock_scanner):
+    """Test that targets not seen before the timeout come back as None."""
+    mock_scanner.return_value.__aenter__ = AsyncMock()
+    mock_scanner.return_value.__aexit__ = AsyncMock()
+
+    assert await find_trains(["Train Base"], timeout=0.01) == [None]
@@ -0,0 +1,135 @@
+"""Test the coalescing write scheduler."""
+
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from core.frames import motor_speed_frame, sound_frame
+from core.train_controller import TrainController
+from core.write_scheduler import WriteScheduler
+
+
+@pytest.mark.asyncio
+async def test_superseded_frames_are_dropped():
+    """Test that only the newest frame per key is written."""
+    write = AsyncMock()
+    scheduler = WriteScheduler(write, tick=0.01)
+
+    scheduler.submit((0, "motor"), b"a")
+    scheduler.submit((1, "sound"), b"b")
+    scheduler.submit((0, "motor"), b"c")
+    await scheduler.flush()
+
+    assert [call.args[0] for call in write.call_args_list] == [b"c", b"b"]
+    assert scheduler.submitted == 3
+    assert scheduler.written == 2
+    assert scheduler.coalesced == 1
+
+
+@pytest.mark.asyncio
+async def test_burst_within_tick_coalesces():
+    """Test that a burst after the first write collapses into one write."""
+    writes = []
+
+    async def write(frame: bytes) -> None:
+        writes.append(frame)
+
+    async with WriteScheduler(write, tick=0.05) as scheduler:
+        scheduler.submit(0, b"first")
+        await asyncio.sleep(0.01)
+        for speed in range(10):
+            scheduler.submit(0, bytes([speed]))
+        await asyncio.sleep(0.1)
+
+    assert writes == [b"first", bytes([9])]
+    assert scheduler.coalesced == 9
+
+
+@pytest.mark.asyncio
+async def test_write_errors_are_counted():
+    """Test that a failing write does not stop the scheduler."""
+    write = AsyncMock(side_effect=[OSError("gone"), None])
+    scheduler = WriteScheduler(write)
+
+    scheduler.submit(0, b"a")
+    scheduler.submit(1, b"b")
+    await scheduler.flush()
+
+    assert scheduler.errors == 1
+    assert scheduler.written == 1
+
+
+@pytest.mark.asyncio
+async def test_train_controller_coalesces_through_scheduler():
+    """Test TrainController routing commands through the scheduler."""
+    mock_client = Mock()
+    mock_client.write_gatt_char = AsyncMock()
+    controller = TrainController(mock_client)
+
+    scheduler = controller.start_write_scheduler(tick=0.05)
+    await asyncio.sleep(0)
+    for speed in (10, 20, 30):
+        await controller.set_motor_speed(port_id=0, speed=speed)
+    await controller.play_sound(port_id=1, sound_id=9)
+    await controller.stop_write_scheduler()
+
+    frames = [call.args[1] for call in mock_client.write_gatt_char.call_args_list]
+    assert frames == [motor_speed_frame(0, 30), sound_frame(1, 9)]
+    assert scheduler.coalesced == 2
+    assert controller.write_scheduler is None
+
+
+async def test_stop_during_flush_keeps_pending_frames():
+    """Test stopping mid-write still writes every frame, including the last."""
+    writes = []
+    started = asyncio.Event()
+
+    async def slow_write(frame: bytes) -> None:
+        started.set()
+        await asyncio.sleep(0.02)
+        writes.append(frame)
+
+    scheduler = WriteScheduler(slow_write, tick=0.01)
+    scheduler.start()
+    scheduler.submit((0, "motor"), b"go")
+    scheduler.submit((17, "light"), b"red")
+    await started.wait()
+    scheduler.submit((0, "motor"), b"stop")
+    await scheduler.stop()
+
+    assert writes == [b"go", b"red", b"stop"]
+    assert not scheduler.running
+
+
+async def test_cancelled_flush_requeues_unwritten_frames():
+    """Test a flush cancelled mid-write leaves its frames pending."""
+    write = AsyncMock(side_effect=[None, asyncio.CancelledError()])
+    scheduler = WriteScheduler(write)
+    scheduler.submit(0, b"a")
+    scheduler.submit(1, b"b")
+    scheduler.submit(2, b"c")
+    with pytest.raises(asyncio.CancelledError):
+        await scheduler.flush()
+
+    write.side_effect = None
+    await scheduler.flush()
+    assert [call.args[0] for call in write.call_args_list] == [b"a", b"b", b"b", b"c"]
+
+
+async def test_sounds_are_never_coalesced():
+    """Test back-to-back sounds all play while motor commands coalesce."""
+    mock_client = Mock()
+    mock_client.write_gatt_char = AsyncMock()
+    controller = TrainController(mock_client)
+
+    controller.start_write_scheduler(tick=0.05)
+    await asyncio.sleep(0)
+    await controller.play_sound(port_id=1, sound_id=9)
+    await controller.set_motor_speed(port_id=0, speed=10)
+    await controller.play_sound(port_id=1, sound_id=5)
+    await controller.set_motor_speed(port_id=0, speed=20)
+    await controller.stop_write_scheduler()
+
+    frames = [call.args[1] for call in mock_client.write_gatt_char.call_args_list]
+    assert frames == [sound_frame(1, 9), motor_speed_frame(0, 20), sound_frame(1, 5)]